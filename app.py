@@ -7,6 +7,18 @@ from iac.main_stack import MainStack
 
 
 app = cdk.App()
-MainStack(app, "MainStack")
+
+# analyse cameras in batches with the fused analyze_cameras function, e.g. cdk deploy -c cameraBatchSize=50
+camera_batch_size = app.node.try_get_context("cameraBatchSize")
+
+# only process entities with changes since the previous run, e.g. cdk deploy -c incremental=true
+incremental = str(app.node.try_get_context("incremental")).lower() == "true"
+
+MainStack(
+    app,
+    "MainStack",
+    camera_batch_size=int(camera_batch_size) if camera_batch_size else None,
+    incremental=incremental,
+)
 
 app.synth()
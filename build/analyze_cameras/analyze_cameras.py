@@ -0,0 +1,182 @@
+import os
+import math
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import aws_clients
+import change_tracking
+import detection
+import dynamo_batch
+import instrumentation
+import regression_state
+import retention
+import vehicle_counts
+
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
+
+# the central DynamoDB table and the bucket where the images are stored
+table_name = os.environ["DB_NAME"]
+dynamodb = aws_clients.client("dynamodb")
+
+# cache of detection results, shared with count_cars and count_emergency_vehicles
+detection_cache = detection.DetectionCache(
+    dynamodb,
+    aws_clients.client("s3"),
+    table_name,
+    os.environ["BUCKET_NAME"],
+    detection.create_detector(),
+)
+
+# constants
+# max. number of cameras analysed concurrently (all steps are I/O bound)
+MAX_WORKERS = 16
+
+
+def get_regression_states(
+    camera_ids: list[str],
+) -> dict[str, tuple[regression_state.RegressionState, int]]:
+    """Retrieves the stored regression states of the car counts of multiple cameras
+
+    :param camera_ids: The IDs of the cameras for which states shall be retrieved
+    :raises e: If something went wrong while querying
+    :return: A dictionary with camera IDs as keys and tuples of the regression state and the
+    emergency vehicle count in the latest image as values. Cameras without a stored state are
+    omitted, as are cameras whose state has been stored by predict_car_count (without emergency
+    vehicle count), their states are rebuilt.
+    """
+
+    items = dynamo_batch.batch_get_items(
+        dynamodb,
+        table_name,
+        [
+            {"PK": {"S": f"camera#{camera_id}"}, "SK": {"S": regression_state.SORT_KEY}}
+            for camera_id in camera_ids
+        ],
+        "PK, watermark, bucketSize, buckets, emergencyVehicleCount",
+    )
+
+    return {
+        item["PK"]["S"].replace("camera#", "", 1): (
+            regression_state.RegressionState.from_item(item),
+            int(item["emergencyVehicleCount"]["N"]),
+        )
+        for item in items
+        if "emergencyVehicleCount" in item
+    }
+
+
+def analyze_camera(
+    camera_id: str,
+    predict_for: int,
+    stored_state: Optional[tuple[regression_state.RegressionState, int]],
+) -> tuple[regression_state.RegressionState, int]:
+    """Runs the per-camera chain (get images, count cars, count emergency vehicles) for a single
+    camera. Only images newer than the watermark of the stored regression state are considered,
+    the car counts of older images are already part of the state. If there is no state or it is
+    stale, it is rebuilt from all images of the window, where hours already compacted (see
+    compact_time_series) are read as a single hourly aggregate of their car counts. Car counts are
+    predicted for all cameras of the batch at once afterwards.
+
+    :param camera_id: The ID of the camera to analyse
+    :param predict_for: The POSIX timestamp of the time for which the prediction shall be made
+    :param stored_state: The stored regression state and emergency vehicle count of the camera,
+    None if there is none
+    :return: A tuple containing the following values:
+    - updated regression state of the car counts
+    - emergency vehicle count in the latest image
+    """
+
+    earliest_time = predict_for - vehicle_counts.MAX_IMAGE_AGE
+    if stored_state is None or stored_state[0].is_stale(earliest_time):
+        state, emergency_vehicle_count = regression_state.RegressionState(), 0
+        aggregates = retention.get_aggregates(
+            dynamodb, table_name, f"camera#{camera_id}", "hourly", earliest_time, predict_for
+        )
+        state.add_aggregates(aggregates, retention.RESOLUTIONS["hourly"])
+        ranges = retention.get_uncovered_ranges(aggregates, "hourly", earliest_time)
+    else:
+        state, emergency_vehicle_count = stored_state
+        ranges = [(state.watermark + 1, None)]
+
+    # get new images (and images of the window not covered by aggregates)
+    image_uris = {}
+    for earliest, latest in ranges:
+        image_uris.update(
+            vehicle_counts.get_image_uris(dynamodb, table_name, camera_id, earliest, latest)
+        )
+
+    # count vehicles in new images (each image is fetched and analysed at most once)
+    detections = detection_cache.get_detections(camera_id, image_uris)
+    state.add({timestamp: d.car_count for timestamp, d in detections.items()})
+    state.evict(earliest_time)
+
+    # count emergency vehicles in the latest image
+    if detections:
+        emergency_vehicle_count = detections[max(detections)].emergency_vehicle_count
+
+    return state, emergency_vehicle_count
+
+
+@instrumentation.instrumented
+def handler(event, context):
+    """Analyzes a batch of cameras in a single invocation. Does the same as the fine-grained tasks
+    get_images, count_cars, predict_car_count, count_emergency_vehicles and update_vehicles_count
+    for each camera, but
+    - only considers images added since the last run (see analyze_camera and regression_state)
+    - predicts the car counts of all cameras with a single vectorised fit
+    - stores the results of all cameras with batch requests
+
+    The results are stored in DynamoDB directly.
+    """
+    # input from workflow
+    # the POSIX timestamp of the time for which predictions shall be made
+    predict_for: int = event["predictFor"]
+    # the IDs of the cameras to analyse
+    camera_ids: list[str] = event["cameraIds"]
+    # optional: rebuild regression states from all images of the window
+    rebuild: bool = event.get("rebuildModels", False)
+
+    # get stored regression states and analyze cameras concurrently
+    stored_states = {} if rebuild else get_regression_states(camera_ids)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        results = list(
+            executor.map(
+                lambda camera_id: analyze_camera(
+                    camera_id, predict_for, stored_states.get(camera_id)
+                ),
+                camera_ids,
+            )
+        )
+
+    # predict car counts for all cameras at once
+    with instrumentation.phase("Predict"):
+        predictions = regression_state.predict([state for state, _ in results], predict_for)
+    car_count_predictions = [
+        0 if math.isnan(prediction) else max(0, round(prediction))
+        for prediction in predictions.tolist()
+    ]
+
+    # store counts, updated regression states and change tracking rows for all cameras in DynamoDB
+    items = []
+    for camera_id, car_count_prediction, (state, emergency_vehicle_count) in zip(
+        camera_ids, car_count_predictions, results
+    ):
+        items.append(
+            vehicle_counts.create_traffic_count_item(
+                camera_id, predict_for, car_count_prediction, emergency_vehicle_count
+            )
+        )
+        items.append(
+            state.to_item(
+                f"camera#{camera_id}",
+                {"emergencyVehicleCount": {"N": str(emergency_vehicle_count)}},
+            )
+        )
+        items.append(change_tracking.create_item("camera", camera_id, predict_for, state.watermark))
+    dynamo_batch.batch_put_items(dynamodb, table_name, items)
+
+    # no output to workflow required - result stored in DynamoDB directly
+    return {}
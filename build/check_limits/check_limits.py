@@ -1,18 +1,24 @@
 import os
-import boto3
 import logging
 
-from typing import Tuple
+from typing import Optional, Tuple
 from statistics import mean
 
-from boto3.dynamodb.types import TypeDeserializer
+import aws_clients
+import base_entities
+import change_tracking
+import dynamo_batch
+import dynamo_codec
+import instrumentation
+import metadata_cache
+import retention
 
 # setup logging
 logging.getLogger().setLevel(logging.INFO)
 
 # DynamoDB client (as BatchGetItem method is required, that is not available on Table resource)
 table_name = os.environ["DB_NAME"]
-dynamodb = boto3.client("dynamodb")
+dynamodb = aws_clients.client("dynamodb")
 
 # constants
 # number of cameras with the highest load to consider for overall traffic load calculation
@@ -22,7 +28,8 @@ MIN_NUM_EMERGENCY_VEHICLES = 1
 
 
 def get_street_data(street_id: str) -> Tuple[list[str], str, int, float]:
-    """Retrieves the data for a given street from the DynamoDB table.
+    """Retrieves the data for a given street from the DynamoDB table. Street data is static and
+    therefore served from the metadata cache if available.
 
     :param street_id: The ID of the street to retrieve data for.
     :raises e: If something went wrong while querying
@@ -33,11 +40,24 @@ def get_street_data(street_id: str) -> Tuple[list[str], str, int, float]:
     - air quality limit
     """
 
+    return metadata_cache.cache.get_or_load(
+        f"street#{street_id}", lambda: load_street_data(street_id)
+    )
+
+
+def load_street_data(street_id: str) -> Tuple[list[str], str, int, float]:
+    """Retrieves the data for a given street from the DynamoDB table, bypassing the cache.
+
+    :param street_id: The ID of the street to retrieve data for.
+    :raises e: If something went wrong while querying
+    :return: A tuple as returned by get_street_data
+    """
+
     # query table
     try:
         response = dynamodb.get_item(
             TableName=table_name,
-            Key={"PK": {"S": "baseEntity"}, "SK": {"S": f"street#{street_id}"}},
+            Key=base_entities.key(f"street#{street_id}"),
             ProjectionExpression="cameras, station, trafficCapacity, airQualityLimit",
         )
     except Exception as e:
@@ -46,7 +66,7 @@ def get_street_data(street_id: str) -> Tuple[list[str], str, int, float]:
 
     # get data
     item = response["Item"]
-    item = {k: TypeDeserializer().deserialize(v) for k, v in item.items()}
+    item = dynamo_codec.deserialize_item(item)
 
     # extract values
     cameras = item["cameras"]
@@ -60,7 +80,9 @@ def get_street_data(street_id: str) -> Tuple[list[str], str, int, float]:
 def get_car_counts(
     camera_ids: list[str], predict_for: int
 ) -> Tuple[dict[str, int], dict[str, int]]:
-    """Retrieves the car count prediction and the emergency vehicle count for the specified time
+    """Retrieves the car count prediction and the emergency vehicle count for the specified time.
+    Results of cameras that have not been analysed for the specified time are carried forward
+    (see change_tracking.get_results).
 
     :param camera_ids: A list of camera IDs for which data shall be retrieved
     :param predict_for: The time for which data shall be retrieved
@@ -71,29 +93,17 @@ def get_car_counts(
     """
 
     # query table
-    try:
-        response = dynamodb.batch_get_item(
-            RequestItems={
-                table_name: {
-                    "Keys": [
-                        {
-                            "PK": {"S": f"camera#{camera_id}"},
-                            "SK": {"S": f"trafficCount#{predict_for}"},
-                        }
-                        for camera_id in camera_ids
-                    ],
-                    "ProjectionExpression": "PK, carCountPrediction, emergencyVehicleCount",
-                    "ConsistentRead": True,
-                }
-            }
-        )
-    except Exception as e:
-        logging.error(f"Error while querying table: {e}")
-        raise e
+    data = change_tracking.get_results(
+        dynamodb,
+        table_name,
+        [f"camera#{camera_id}" for camera_id in camera_ids],
+        "trafficCount",
+        predict_for,
+        "PK, carCountPrediction, emergencyVehicleCount",
+    )
 
-    # get data and deserialize
-    data = response["Responses"][table_name]
-    data = [{k: TypeDeserializer().deserialize(v) for k, v in d.items()} for d in data]
+    # deserialize
+    data = [dynamo_codec.deserialize_item(d) for d in data]
 
     # create dictionaries to return
     car_count_predictions = {
@@ -107,29 +117,26 @@ def get_car_counts(
 
 
 def get_air_quality_prediction(station_id: str, predict_for: int) -> float:
-    """Retrieves the air quality prediction for the specified time
+    """Retrieves the air quality prediction for the specified time. The prediction of a station
+    that has not been analysed for the specified time is carried forward.
 
     :param station_id: The ID of the station for which data shall be retrieved
     :param predict_for: The time for which data shall be retrieved
     :raises e: If something went wrong while querying
+    :raises KeyError: If there is no prediction for the station
     :return: The air quality prediction
     """
 
     # query table
-    try:
-        response = dynamodb.get_item(
-            TableName=table_name,
-            Key={"PK": {"S": f"station#{station_id}"}, "SK": {"S": f"prediction#{predict_for}"}},
-            ProjectionExpression="airQuality",
-            ConsistentRead=True,
-        )
-    except Exception as e:
-        logging.error(f"Error while querying table: {e}")
-        raise e
+    items = change_tracking.get_results(
+        dynamodb, table_name, [f"station#{station_id}"], "prediction", predict_for, "PK, airQuality"
+    )
+    if not items:
+        raise KeyError(f"No air quality prediction found for station {station_id}")
 
     # get data and deserialize
-    item = response["Item"]
-    item = {k: TypeDeserializer().deserialize(v) for k, v in item.items()}
+    item = items[0]
+    item = dynamo_codec.deserialize_item(item)
 
     # extract value
     air_quality_prediction = float(item["airQuality"])
@@ -137,6 +144,85 @@ def get_air_quality_prediction(station_id: str, predict_for: int) -> float:
     return air_quality_prediction
 
 
+def get_streets_data(street_ids: list[str]) -> dict[str, Tuple[list[str], str, int, float]]:
+    """Retrieves the data for multiple streets from the DynamoDB table. Only streets that are not
+    in the metadata cache are read from the table.
+
+    :param street_ids: The IDs of the streets to retrieve data for
+    :raises e: If something went wrong while querying
+    :return: A dictionary with street IDs as keys and tuples as returned by get_street_data as
+    values. Streets that are not in the table are omitted.
+    """
+
+    streets_data = metadata_cache.cache.get_many_or_load(
+        [f"street#{street_id}" for street_id in street_ids], load_streets_data
+    )
+
+    return {sort_key.replace("street#", "", 1): data for sort_key, data in streets_data.items()}
+
+
+def load_streets_data(sort_keys: list[str]) -> dict[str, Tuple[list[str], str, int, float]]:
+    """Retrieves the data for multiple streets from the DynamoDB table, bypassing the cache.
+
+    :param sort_keys: The sort keys of the streets to retrieve data for ("street#{ID}")
+    :raises e: If something went wrong while querying
+    :return: A dictionary with sort keys as keys and tuples as returned by get_street_data as
+    values. Streets that are not in the table are omitted.
+    """
+
+    # query table
+    items = dynamo_batch.batch_get_items(
+        dynamodb,
+        table_name,
+        [base_entities.key(sort_key) for sort_key in sort_keys],
+        "SK, cameras, station, trafficCapacity, airQualityLimit",
+    )
+
+    # deserialize and extract values
+    streets_data = {}
+    for item in items:
+        item = dynamo_codec.deserialize_item(item)
+        streets_data[item["SK"]] = (
+            item["cameras"],
+            item["station"],
+            int(item["trafficCapacity"]),
+            float(item["airQualityLimit"]),
+        )
+
+    return streets_data
+
+
+def get_air_quality_predictions(station_ids: list[str], predict_for: int) -> dict[str, float]:
+    """Retrieves the air quality predictions of multiple stations for the specified time.
+    Predictions of stations that have not been analysed for the specified time are carried
+    forward.
+
+    :param station_ids: The IDs of the stations for which data shall be retrieved
+    :param predict_for: The time for which data shall be retrieved
+    :raises e: If something went wrong while querying
+    :return: A dictionary with station IDs as keys and air quality predictions as values. Stations
+    without a prediction are omitted.
+    """
+
+    # query table
+    items = change_tracking.get_results(
+        dynamodb,
+        table_name,
+        [f"station#{station_id}" for station_id in station_ids],
+        "prediction",
+        predict_for,
+        "PK, airQuality",
+    )
+
+    # deserialize and extract values
+    air_quality_predictions = {}
+    for item in items:
+        item = dynamo_codec.deserialize_item(item)
+        air_quality_predictions[item["PK"].replace("station#", "", 1)] = float(item["airQuality"])
+
+    return air_quality_predictions
+
+
 def calculate_traffic_load(traffic_capacity: int, car_count_predictions: dict[str, int]) -> float:
     """Calculates the traffic load of a street
 
@@ -202,6 +288,33 @@ def calculate_air_quality_load(air_quality_limit: float, air_quality_prediction:
     return air_quality_load
 
 
+def create_info_item(
+    street_id: str,
+    predict_for: int,
+    traffic_load: float,
+    emergency_vehicles_active: bool,
+    air_quality_load: float,
+) -> dict:
+    """Creates the (serialized) DynamoDB item for the calculated information of the given street
+
+    :param street_id: The ID of the street for which the information has been calculated
+    :param predict_for: The prediction time for which the information has been calculated
+    :param traffic_load: The calculated traffic load as percentage of maximum capacity
+    :param emergency_vehicles_active: True if there are any active emergency vehicles, False otherwise
+    :param air_quality_load: The calculated air quality load as percentage of limit
+    :return: The item to store in the DynamoDB table
+    """
+
+    return {
+        "PK": {"S": f"street#{street_id}"},
+        "SK": {"S": f"info#{predict_for}"},
+        "trafficLoad": {"N": str(traffic_load)},
+        "emergencyVehiclesActive": {"BOOL": emergency_vehicles_active},
+        "airQualityLoad": {"N": str(air_quality_load)},
+        **retention.expires_at("info", predict_for),
+    }
+
+
 def put_info(
     street_id: str,
     predict_for: int,
@@ -209,7 +322,8 @@ def put_info(
     emergency_vehicles_active: bool,
     air_quality_load: float,
 ):
-    """Stores the calculated information for the given street and given prediction time in the DynamoDB table
+    """Stores the calculated information for the given street and given prediction time in the DynamoDB table.
+    The street is marked as processed (see change_tracking).
 
     :param street_id: The ID of the street for which the information shall be stored in DynamoDB
     :param predict_for: The prediction time for which the information shall be stored in DynamoDB
@@ -219,39 +333,25 @@ def put_info(
     :raises e: If something went wrong while storing data in the table
     """
 
-    # put info in DynamoDB
-    try:
-        dynamodb.put_item(
-            TableName=table_name,
-            Item={
-                "PK": {"S": f"street#{street_id}"},
-                "SK": {"S": f"info#{predict_for}"},
-                "trafficLoad": {"N": str(traffic_load)},
-                "emergencyVehiclesActive": {"BOOL": emergency_vehicles_active},
-                "airQualityLoad": {"N": str(air_quality_load)},
-            },
-        )
-    except Exception as e:
-        logging.error(f"Error while putting info in table: {e}")
-        raise e
-
+    # put info and change tracking row in DynamoDB
+    dynamo_batch.batch_put_items(
+        dynamodb,
+        table_name,
+        [
+            create_info_item(
+                street_id, predict_for, traffic_load, emergency_vehicles_active, air_quality_load
+            ),
+            change_tracking.create_item("street", street_id, predict_for),
+        ],
+    )
 
-def handler(event, context):
-    """Determines if limits for a given street are currently being exceeded, e.g.:
-    - current traffic load as percentage of maximum capacity
-    - active emergency vehicles (true/false)
 
-    Input data is retrieved from the DynamoDB table:
-    - Traffic prediction/analysis for all cameras on the street
-    - Air quality prediction for the station covering the street
+def check_street(street_id: str, predict_for: int):
+    """Checks the limits for a single street and stores the result in the DynamoDB table
 
-    The result is stored in DynamoDB directly.
+    :param street_id: The ID of the street for which the limits shall be checked
+    :param predict_for: The POSIX timestamp of the time for which the limits shall be checked
     """
-    # input from workflow
-    # the POSIX timestamp of the time for which the limits shall be checked
-    predict_for: int = event["predictFor"]
-    # the ID of the street for which the limits shall be checked
-    street_id: str = event["streetId"]
 
     # get data for the given street
     cameras, station, traffic_capacity, air_quality_limit = get_street_data(street_id)
@@ -270,5 +370,111 @@ def handler(event, context):
     # store calculated info in DynamoDB
     put_info(street_id, predict_for, traffic_load, emergency_vehicles_active, air_quality_load)
 
+
+def check_streets(street_ids: list[str], predict_for: int) -> list[str]:
+    """Checks the limits for multiple streets at once and stores the results in the DynamoDB table.
+    All input data is retrieved and all results are stored with batch requests, so the number of
+    requests does not grow with the number of streets, but only with the number of items.
+
+    Streets for which the street data or the air quality prediction is missing are skipped (and
+    logged), so a single incomplete street does not fail the whole batch.
+
+    :param street_ids: The IDs of the streets for which the limits shall be checked
+    :param predict_for: The POSIX timestamp of the time for which the limits shall be checked
+    :return: The IDs of the streets that have been skipped
+    """
+
+    # get data for all streets
+    streets_data = get_streets_data(street_ids)
+
+    # get car count predictions and emergency vehicle counts for all cameras covering any street
+    camera_ids = list({camera for cameras, _, _, _ in streets_data.values() for camera in cameras})
+    car_count_predictions, emergency_vehicle_counts = get_car_counts(camera_ids, predict_for)
+
+    # get air quality predictions for all stations covering any street
+    station_ids = list({station for _, station, _, _ in streets_data.values()})
+    air_quality_predictions = get_air_quality_predictions(station_ids, predict_for)
+
+    # calculate limits for each street
+    info_items = []
+    skipped_street_ids = []
+    for street_id in street_ids:
+        if street_id not in streets_data:
+            logging.error(f"No data found for street {street_id}")
+            skipped_street_ids.append(street_id)
+            continue
+        cameras, station, traffic_capacity, air_quality_limit = streets_data[street_id]
+        if station not in air_quality_predictions:
+            logging.error(f"No air quality prediction found for station {station}")
+            skipped_street_ids.append(street_id)
+            continue
+
+        traffic_load = calculate_traffic_load(
+            traffic_capacity,
+            {c: car_count_predictions[c] for c in cameras if c in car_count_predictions},
+        )
+        emergency_vehicles_active = check_emergency_vehicles_active(
+            {c: emergency_vehicle_counts[c] for c in cameras if c in emergency_vehicle_counts}
+        )
+        air_quality_load = calculate_air_quality_load(
+            air_quality_limit, air_quality_predictions[station]
+        )
+        info_items.append(
+            create_info_item(
+                street_id, predict_for, traffic_load, emergency_vehicles_active, air_quality_load
+            )
+        )
+        info_items.append(change_tracking.create_item("street", street_id, predict_for))
+
+    # store calculated info for all streets in DynamoDB, mark them as processed
+    dynamo_batch.batch_put_items(dynamodb, table_name, info_items)
+
+    return skipped_street_ids
+
+
+@instrumentation.instrumented
+def handler(event, context):
+    """Determines if limits for a given street are currently being exceeded, e.g.:
+    - current traffic load as percentage of maximum capacity
+    - active emergency vehicles (true/false)
+
+    Input data is retrieved from the DynamoDB table:
+    - Traffic prediction/analysis for all cameras on the street
+    - Air quality prediction for the station covering the street
+
+    If a list of street IDs is given instead of a single street ID, all streets are checked at once
+    using batch requests (see check_streets). Streets with incomplete input data are skipped, their
+    IDs are logged and returned to the workflow.
+
+    The result is stored in DynamoDB directly.
+
+    Return to workflow (batch mode only):
+    - type: dictionary
+    - skippedStreetIds: the IDs of the streets that have been skipped
+    """
+    # input from workflow
+    # the POSIX timestamp of the time for which the limits shall be checked
+    predict_for: int = event["predictFor"]
+    # the IDs of the streets for which the limits shall be checked (batch mode)
+    street_ids: Optional[list[str]] = event.get("streetIds")
+
+    # drop cached street data if the topology changed since it has been loaded
+    metadata_cache.cache.check_version(dynamodb, table_name)
+
+    if street_ids is not None:
+        skipped_street_ids = check_streets(street_ids, predict_for)
+        if skipped_street_ids:
+            logging.warning(
+                f"Skipped {len(skipped_street_ids)} of {len(street_ids)} streets: "
+                f"{skipped_street_ids}"
+            )
+
+        # output to workflow - results stored in DynamoDB directly
+        return {"skippedStreetIds": skipped_street_ids}
+
+    # the ID of the street for which the limits shall be checked
+    street_id: str = event["streetId"]
+    check_street(street_id, predict_for)
+
     # no output to workflow required - result stored in DynamoDB directly
     return {}
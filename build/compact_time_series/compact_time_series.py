@@ -0,0 +1,255 @@
+import os
+import time
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import aws_clients
+import base_entities
+import dynamo_batch
+import instrumentation
+import retention
+import vehicle_counts
+
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
+
+# the central DynamoDB table (low-level client, as series are compacted from multiple threads)
+table_name = os.environ["DB_NAME"]
+dynamodb = aws_clients.client("dynamodb")
+
+# constants
+# hours are compacted this many seconds after their end, so late data (and the car counts of
+# images analysed by the next workflow run) is part of the aggregate
+COMPACTION_DELAY = 900
+# raw rows without value (images not analysed yet) hold the compaction of their hour back as long
+# as a workflow run may still analyse them, i.e. until they are older than the image window
+MAX_PENDING_AGE = vehicle_counts.MAX_IMAGE_AGE
+# raw rows of a series by entity type: (sort key prefix, attribute holding the value)
+SERIES = {"camera": ("image", "carCount"), "station": ("measurement", "airQuality")}
+# max. number of series compacted concurrently
+MAX_WORKERS = 16
+
+
+def get_progress(entity_type: str, entity_ids: list[str]) -> dict[str, tuple[int, int]]:
+    """Retrieves the compaction progress of multiple cameras or stations
+
+    :param entity_type: The type of the entities, "camera" or "station"
+    :param entity_ids: The IDs of the entities
+    :raises e: If something went wrong while querying
+    :return: A dictionary with entity IDs as keys and tuples of the times up to which hourly and
+    daily aggregates have been created as values. Entities never compacted are omitted.
+    """
+
+    items = dynamo_batch.batch_get_items(
+        dynamodb,
+        table_name,
+        [
+            {"PK": {"S": f"{entity_type}#{entity_id}"}, "SK": {"S": retention.SORT_KEY}}
+            for entity_id in entity_ids
+        ],
+        "PK, hourlyUntil, dailyUntil",
+    )
+
+    return {
+        item["PK"]["S"].replace(f"{entity_type}#", "", 1): (
+            int(item["hourlyUntil"]["N"]),
+            int(item["dailyUntil"]["N"]),
+        )
+        for item in items
+    }
+
+
+def get_raw_values(
+    partition_key: str, prefix: str, attribute: str, earliest_time: int, latest_time: int
+) -> tuple[dict[int, float], list[int]]:
+    """Queries the raw rows of a series within a time range
+
+    :param partition_key: The partition key of the camera or station, e.g. "station#{ID}"
+    :param prefix: The sort key prefix of the raw rows, e.g. "measurement"
+    :param attribute: The attribute holding the value (e.g. missing for images that have not been
+    analysed yet)
+    :param earliest_time: The start of the time range (POSIX timestamp)
+    :param latest_time: The end of the time range (POSIX timestamp, inclusive)
+    :raises e: If something went wrong while querying
+    :return: A tuple containing the following values:
+    - dictionary with POSIX timestamps as keys and values as values
+    - POSIX timestamps of the rows without value
+    """
+
+    values = {}
+    pending = []
+    last_evaluated_key: Optional[dict] = None
+    while True:
+        # query table
+        optional_params = {"ExclusiveStartKey": last_evaluated_key} if last_evaluated_key else {}
+        try:
+            response = dynamodb.query(
+                TableName=table_name,
+                KeyConditionExpression="PK = :pk AND SK BETWEEN :earliest AND :latest",
+                ExpressionAttributeValues={
+                    ":pk": {"S": partition_key},
+                    ":earliest": {"S": f"{prefix}#{earliest_time}"},
+                    ":latest": {"S": f"{prefix}#{latest_time}"},
+                },
+                ProjectionExpression=f"SK, {attribute}",
+                **optional_params,
+            )
+        except Exception as e:
+            logging.error(f"Error while querying DynamoDB: {e}")
+            raise e
+
+        for item in response["Items"]:
+            timestamp = int(item["SK"]["S"].replace(f"{prefix}#", "", 1))
+            if attribute in item:
+                values[timestamp] = float(item[attribute]["N"])
+            else:
+                pending.append(timestamp)
+
+        # check if there are more results
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if last_evaluated_key is None:
+            return values, pending
+
+
+def store_series(items: list[dict]):
+    """Stores the rows created by compact_series. The progress row is stored after all aggregate
+    rows, so an interrupted compaction is repeated instead of skipping aggregates.
+
+    :param items: The aggregate rows and the progress row (last)
+    :raises e: If something went wrong while storing
+    """
+
+    dynamo_batch.batch_put_items(dynamodb, table_name, items[:-1])
+    dynamo_batch.batch_put_items(dynamodb, table_name, items[-1:])
+
+
+def compact_series(
+    entity_type: str, entity_id: str, progress: Optional[tuple[int, int]], compact_until: int
+) -> list[dict]:
+    """Rolls the raw rows of all complete hours since the last compaction of a series up into
+    hourly aggregates, and the hourly aggregates of all complete days up into daily aggregates.
+    Compaction stops at the first hour with a row that has no value yet but may still get one
+    (see MAX_PENDING_AGE), so values written late are part of the aggregate of their hour.
+
+    :param entity_type: The type of the entity, "camera" or "station"
+    :param entity_id: The ID of the entity
+    :param progress: The times up to which hourly and daily aggregates have been created, None if
+    the series has never been compacted (all raw rows still retained are compacted)
+    :param compact_until: Compact no time span ending after the given time (POSIX timestamp)
+    :return: The aggregate rows and the updated progress row (last) to store in the DynamoDB table
+    """
+
+    partition_key = f"{entity_type}#{entity_id}"
+    prefix, attribute = SERIES[entity_type]
+    hour, day = retention.RESOLUTIONS["hourly"], retention.RESOLUTIONS["daily"]
+    hourly_until = compact_until - compact_until % hour
+    daily_until = compact_until - compact_until % day
+    if progress is None:
+        earliest_time = compact_until - retention.RETENTION[prefix]
+        progress = (earliest_time - earliest_time % hour, earliest_time - earliest_time % day)
+    hourly_since, daily_since = progress
+
+    # roll raw values up into hourly aggregates, up to the first hour with a pending row
+    points_by_hour: dict[int, dict[int, float]] = {}
+    if hourly_until > hourly_since:
+        raw_values, pending = get_raw_values(
+            partition_key, prefix, attribute, hourly_since, hourly_until - 1
+        )
+        pending_since = compact_until + COMPACTION_DELAY - MAX_PENDING_AGE
+        pending = [timestamp for timestamp in pending if timestamp >= pending_since]
+        if pending:
+            hourly_until = min(pending) - min(pending) % hour
+            daily_until = min(daily_until, hourly_until - hourly_until % day)
+        for timestamp, value in raw_values.items():
+            if timestamp < hourly_until:
+                points_by_hour.setdefault(timestamp - timestamp % hour, {})[timestamp] = value
+    hourly = {
+        start: retention.Aggregate.of(points, start) for start, points in points_by_hour.items()
+    }
+
+    # roll hourly aggregates (stored and just created) up into daily aggregates
+    daily: dict[int, retention.Aggregate] = {}
+    if daily_until > daily_since:
+        stored = retention.get_aggregates(
+            dynamodb, table_name, partition_key, "hourly", daily_since, daily_until
+        )
+        for start, aggregate in {**stored, **hourly}.items():
+            if daily_since <= start < daily_until:
+                day_start = start - start % day
+                # times relative to the start of the day
+                aggregate = aggregate.shift(start - day_start)
+                daily[day_start] = (
+                    daily[day_start].merge(aggregate) if day_start in daily else aggregate
+                )
+
+    return (
+        [
+            retention.create_aggregate_item(partition_key, "hourly", start, aggregate)
+            for start, aggregate in hourly.items()
+        ]
+        + [
+            retention.create_aggregate_item(partition_key, "daily", start, aggregate)
+            for start, aggregate in daily.items()
+        ]
+        + [
+            {
+                "PK": {"S": partition_key},
+                "SK": {"S": retention.SORT_KEY},
+                "hourlyUntil": {"N": str(max(hourly_until, hourly_since))},
+                "dailyUntil": {"N": str(max(daily_until, daily_since))},
+            }
+        ]
+    )
+
+
+@instrumentation.instrumented
+def handler(event, context):
+    """Compacts the time series of cameras (car counts of analysed images) and stations (air
+    quality measurements): the raw rows of complete hours are rolled up into hourly aggregate rows
+    (count, sum, min, max), hourly aggregates of complete days into daily aggregate rows. Raw rows
+    expire after a few days (see retention.RETENTION), so the history of a series is kept at
+    decreasing resolution while partitions stay bounded. Predictions read hourly aggregates
+    instead of raw rows for compacted parts of their window.
+
+    Runs on a schedule. Each series is compacted from where its last compaction stopped (stored in
+    its "rollup" row), so every raw row is read once. The rows of each series are stored as soon as
+    it has been compacted, so a run that times out keeps the progress of all completed series.
+
+    The results are stored in DynamoDB directly.
+    """
+    # input (optional)
+    # the IDs of the cameras and stations to compact, all if not given
+    entity_ids: dict[str, Optional[list[str]]] = {
+        "camera": event.get("cameraIds"),
+        "station": event.get("stationIds"),
+    }
+    # the POSIX timestamp up to which series shall be compacted (at most)
+    compact_until: int = event.get("compactUntil", int(time.time()) - COMPACTION_DELAY)
+
+    compacted = {}
+    for entity_type, ids in entity_ids.items():
+        # get IDs of all cameras or stations from all shards in DynamoDB
+        if ids is None:
+            ids = base_entities.list_ids(dynamodb, table_name, entity_type)
+
+        # compact series concurrently, store aggregates and progress of each series in DynamoDB
+        progress = get_progress(entity_type, ids)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            list(
+                executor.map(
+                    lambda entity_id: store_series(
+                        compact_series(
+                            entity_type, entity_id, progress.get(entity_id), compact_until
+                        )
+                    ),
+                    ids,
+                )
+            )
+        compacted[entity_type] = len(ids)
+
+    logging.info(f"Compacted series up to {compact_until}: {compacted}")
+
+    # no output required - result stored in DynamoDB directly
+    return {}
@@ -1,11 +1,31 @@
 import os
+import logging
+
+import aws_clients
+import detection
+import instrumentation
+
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
 
 # the name of the bucket where the images are stored
 bucket_name = os.environ["BUCKET_NAME"]
 
+# cache of detection results, shared with count_emergency_vehicles via the central DynamoDB table
+detection_cache = detection.DetectionCache(
+    aws_clients.client("dynamodb"),
+    aws_clients.client("s3"),
+    os.environ["DB_NAME"],
+    bucket_name,
+    detection.create_detector(),
+)
 
+
+@instrumentation.instrumented
 def handler(event: dict, context):
     """Counts cars in a given list of images by using Rekognition.
+    Images that have already been analysed (by this function or by count_emergency_vehicles) are
+    not analysed again, their results are taken from the detection cache.
 
     Return value to workflow:
     - type: dictionary
@@ -13,9 +33,14 @@ def handler(event: dict, context):
     - values: the number of cars in each image as an integer
     """
     # input from workflow
+    # the ID of the camera that took the images
+    camera_id: str = event["cameraId"]
     # dictionary with image creation times (POSIX timestamps) as keys and the keys of the images within the bucket
-    image_uris: dict[int, str] = {int(k): v for k, v in event.items()}
+    image_uris: dict[int, str] = {int(k): v for k, v in event["imageUris"].items()}
+
+    # get detection results (from cache or by analysing the images)
+    detections = detection_cache.get_detections(camera_id, image_uris)
 
     # output to workflow
-    car_counts = {1: 5, 2: 10}  # dummy value for workflow testing - TODO: remove
+    car_counts = {timestamp: d.car_count for timestamp, d in detections.items()}
     return car_counts
@@ -1,14 +1,47 @@
+import os
+import logging
+
+import aws_clients
+import detection
+import instrumentation
+
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
+
+# cache of detection results, shared with count_cars via the central DynamoDB table
+detection_cache = detection.DetectionCache(
+    aws_clients.client("dynamodb"),
+    aws_clients.client("s3"),
+    os.environ["DB_NAME"],
+    os.environ["BUCKET_NAME"],
+    detection.create_detector(),
+)
+
+
+@instrumentation.instrumented
 def handler(event: dict, context):
     """Counts emergency vehicles in the latest image of an image series by using Rekognition.
+    If the image has already been analysed (by this function or by count_cars), the result is
+    taken from the detection cache.
 
     Return value to workflow:
     - type: integer
     - value: the number of emergency vehicles in the latest image
     """
     # input from workflow
+    # the ID of the camera that took the images
+    camera_id: str = event["cameraId"]
     # dictionary with image creation times (POSIX timestamps) as keys and the keys of the images within the bucket
-    image_uris: dict[int, str] = {int(k): v for k, v in event.items()}
+    image_uris: dict[int, str] = {int(k): v for k, v in event["imageUris"].items()}
+
+    # no images available -> no emergency vehicles detected
+    if not image_uris:
+        return 0
+
+    # get detection result of the latest image (from cache or by analysing the image)
+    latest = max(image_uris)
+    detections = detection_cache.get_detections(camera_id, {latest: image_uris[latest]})
 
     # output to workflow
-    emergency_vehicle_count = 2  # dummy value for workflow testing - TODO: remove
+    emergency_vehicle_count = detections[latest].emergency_vehicle_count
     return emergency_vehicle_count
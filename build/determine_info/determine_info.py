@@ -1,3 +1,213 @@
+import os
+import logging
+
+from typing import Optional
+
+import aws_clients
+import base_entities
+import change_tracking
+import display_state
+import dynamo_batch
+import instrumentation
+import metadata_cache
+import retention
+
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
+
+# the central DynamoDB table
+table_name = os.environ["DB_NAME"]
+dynamodb = aws_clients.client("dynamodb")
+
+# constants
+# traffic load (as percentage of maximum capacity) from which traffic is considered congested
+TRAFFIC_JAM_LOAD = 0.8
+# air quality load from which the air quality limit is considered exceeded
+AIR_QUALITY_LIMIT_LOAD = 1.0
+# speed limit in km/h while emergency vehicles are active or traffic is congested
+REDUCED_SPEED_LIMIT = 30
+# reduction of the default speed limit in km/h while the air quality limit is exceeded
+AIR_QUALITY_SPEED_REDUCTION = 20
+# the speed limit is never reduced below this value (in km/h) due to air quality
+MIN_SPEED_LIMIT = 30
+
+
+def get_sections_data(section_ids: list[str]) -> dict[str, tuple[str, int]]:
+    """Retrieves the street and the default speed limit of multiple sections. The topology is
+    static, so data cached in the metadata cache is used, only missing sections are read from the
+    table (with BatchGetItem requests).
+
+    :param section_ids: The IDs of the sections
+    :raises e: If something went wrong while querying
+    :return: A dictionary with section IDs as keys and tuples of the street ID and the default
+    speed limit as values. Sections that are not in the table are omitted.
+    """
+
+    def load(sort_keys: list[str]) -> dict[str, tuple[str, int]]:
+        items = dynamo_batch.batch_get_items(
+            dynamodb,
+            table_name,
+            [base_entities.key(sort_key) for sort_key in sort_keys],
+            "SK, street, defaultSpeedLimit",
+        )
+        return {
+            item["SK"]["S"]: (item["street"]["S"], int(item["defaultSpeedLimit"]["N"]))
+            for item in items
+        }
+
+    sections_data = metadata_cache.cache.get_many_or_load(
+        [f"section#{section_id}" for section_id in section_ids], load
+    )
+
+    return {sort_key.replace("section#", "", 1): data for sort_key, data in sections_data.items()}
+
+
+def get_street_infos(
+    street_ids: list[str], predict_for: int
+) -> dict[str, tuple[float, bool, float]]:
+    """Retrieves the limit analysis values of multiple streets for the specified time (see
+    check_limits). Values of streets that have not been checked for the specified time are carried
+    forward.
+
+    :param street_ids: The IDs of the streets
+    :param predict_for: The POSIX timestamp of the time for which the values shall be retrieved
+    :raises e: If something went wrong while querying
+    :return: A dictionary with street IDs as keys and tuples of the traffic load, whether emergency
+    vehicles are active and the air quality load as values. Streets without values are omitted.
+    """
+
+    items = change_tracking.get_results(
+        dynamodb,
+        table_name,
+        [f"street#{street_id}" for street_id in street_ids],
+        "info",
+        predict_for,
+        "PK, trafficLoad, emergencyVehiclesActive, airQualityLoad",
+    )
+
+    return {
+        item["PK"]["S"].replace("street#", "", 1): (
+            float(item["trafficLoad"]["N"]),
+            item["emergencyVehiclesActive"]["BOOL"],
+            float(item["airQualityLoad"]["N"]),
+        )
+        for item in items
+    }
+
+
+def determine_display(
+    default_speed_limit: int,
+    traffic_load: float,
+    emergency_vehicles_active: bool,
+    air_quality_load: float,
+) -> display_state.Display:
+    """Determines what the signs of a section display
+
+    :param default_speed_limit: The unrestricted speed limit of the section
+    :param traffic_load: The traffic load of the street as percentage of maximum capacity
+    :param emergency_vehicles_active: True if there are any active emergency vehicles on the street
+    :param air_quality_load: The air quality load of the street (1.0 = at limit)
+    :return: The speed limit and information text to display
+    """
+
+    speed_limit = default_speed_limit
+    info = []
+    if emergency_vehicles_active:
+        speed_limit = min(speed_limit, REDUCED_SPEED_LIMIT)
+        info.append("Emergency vehicles active")
+    if traffic_load >= TRAFFIC_JAM_LOAD:
+        speed_limit = min(speed_limit, REDUCED_SPEED_LIMIT)
+        info.append("Traffic jam")
+    if air_quality_load >= AIR_QUALITY_LIMIT_LOAD:
+        reduced_speed_limit = max(
+            MIN_SPEED_LIMIT, default_speed_limit - AIR_QUALITY_SPEED_REDUCTION
+        )
+        speed_limit = min(speed_limit, reduced_speed_limit)
+        info.append("Air quality limit exceeded")
+
+    return display_state.Display(speed_limit, ", ".join(info))
+
+
+def create_info_item(section_id: str, predict_for: int, display: display_state.Display) -> dict:
+    """Creates the (serialized) DynamoDB item for the display state of a section that changed
+
+    :param section_id: The ID of the section
+    :param predict_for: The POSIX timestamp of the time from which the display state is shown
+    :param display: The display state
+    :return: The item to store in the DynamoDB table
+    """
+
+    return {
+        "PK": {"S": f"section#{section_id}"},
+        "SK": {"S": f"info#{predict_for}"},
+        "speedLimit": {"N": str(display.speed_limit)},
+        "text": {"S": display.info},
+        **retention.expires_at("info", predict_for),
+    }
+
+
+def determine_infos(
+    section_ids: list[str], predict_for: int, num_shards: int
+) -> dict[str, display_state.Display]:
+    """Determines the display state of multiple sections and stores the sections whose display
+    state changed. The previous display state is read from the shards of the display state
+    projection the sections belong to, so unchanged sections cause no writes at all. Sections
+    should belong to few shards (get_section_list orders them by shard), as every shard read
+    contains the display state of all of its sections.
+
+    Sections for which the section data or the street info is missing are skipped (and logged).
+
+    :param section_ids: The IDs of the sections
+    :param predict_for: The POSIX timestamp of the time for which the info shall be determined
+    :param num_shards: The number of display state items (see display_state.num_shards)
+    :return: A dictionary with the IDs of the sections whose display state changed as keys and the
+    new display state as values
+    """
+
+    # get data of all sections and the info of their streets
+    sections_data = get_sections_data(section_ids)
+    street_infos = get_street_infos(
+        list({street_id for street_id, _ in sections_data.values()}), predict_for
+    )
+
+    # get currently displayed state (strongly consistent, to not miss changes of the last run)
+    displayed = display_state.get_display_state(
+        dynamodb,
+        table_name,
+        num_shards,
+        {display_state.shard_of(section_id, num_shards) for section_id in section_ids},
+        consistent_read=True,
+    )
+
+    # determine display state of each section, keep changes only
+    changes = {}
+    for section_id in section_ids:
+        if section_id not in sections_data:
+            logging.error(f"No data found for section {section_id}")
+            continue
+        street_id, default_speed_limit = sections_data[section_id]
+        if street_id not in street_infos:
+            logging.error(f"No info found for street {street_id}")
+            continue
+        display = determine_display(default_speed_limit, *street_infos[street_id])
+        if displayed.get(section_id) != display:
+            changes[section_id] = display
+
+    # store changed display states in the projection and as history of the sections
+    display_state.put_changes(dynamodb, table_name, num_shards, changes, predict_for)
+    dynamo_batch.batch_put_items(
+        dynamodb,
+        table_name,
+        [
+            create_info_item(section_id, predict_for, display)
+            for section_id, display in changes.items()
+        ],
+    )
+
+    return changes
+
+
+@instrumentation.instrumented
 def handler(event, context):
     """Determines the info to display for a given section and a given time, e.g.:
     - adjusted speed limit
@@ -8,13 +218,35 @@ def handler(event, context):
     - active emergency vehicles (true/false)
     - unrestricted speed limit for the given section
 
-    The result is stored in DynamoDB directly.
+    If a list of section IDs is given instead of a single section ID, all sections are handled at
+    once using batch requests (see determine_infos).
+
+    The result is stored in DynamoDB directly: the display state of all sections is kept in a few
+    compact items (see display_state), which are only written if a displayed value changes.
     """
     # input from workflow
     # the POSIX timestamp of the time for which the info shall be determined
     predict_for: int = event["predictFor"]
+    # the IDs of the sections for which the info shall be determined (batch mode), otherwise
     # the ID of the section for which the info shall be determined
-    section_id: str = event["sectionId"]
+    section_ids: list[str] = event["sectionIds"] if "sectionIds" in event else [event["sectionId"]]
+    # optional: the number of display state items (as returned by get_section_list)
+    num_shards: Optional[int] = event.get("displayShards")
+
+    # drop cached section data if the topology changed since it has been loaded
+    metadata_cache.cache.check_version(dynamodb, table_name)
+
+    # invoked outside of the workflow: derive the number of display state items from the number
+    # of all sections, as get_section_list does
+    if num_shards is None:
+        section_count = len(
+            metadata_cache.cache.get_or_load(
+                "sectionIds", lambda: base_entities.list_ids(dynamodb, table_name, "section")
+            )
+        )
+        num_shards = display_state.num_shards(section_count)
+
+    determine_infos(section_ids, predict_for, num_shards)
 
     # no output to workflow required - result stored in DynamoDB directly
     return {}
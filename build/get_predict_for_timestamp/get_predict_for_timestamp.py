@@ -1,9 +1,12 @@
 from datetime import datetime
 
+import instrumentation
+
 # flag to indicate if workflow is in debugging mode
 DEBUG = True
 
 
+@instrumentation.instrumented
 def handler(event, context):
     """Creates a POSIX timestamp to define the time for which predictions/info updates are desired.
     For developing/debugging the workflow this value should be hardcoded considering the test dataset.
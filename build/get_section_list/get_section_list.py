@@ -1,73 +1,72 @@
-import boto3
 import os
 import logging
 
-from typing import Tuple, Optional
-
-from boto3.dynamodb.conditions import Key
+import aws_clients
+import base_entities
+import change_tracking
+import display_state
+import instrumentation
+import metadata_cache
 
 # setup logging
 logging.getLogger().setLevel(logging.INFO)
 
-# the central DynamoDB table
-table = boto3.resource("dynamodb").Table(os.environ["DB_NAME"])
-
-
-def get_section_ids_from_table(
-    last_evaluated_key: Optional[dict] = None,
-) -> Tuple[Optional[dict], list[str]]:
-    """Queries the table and retrieves all section IDs. If more IDs are in the table than can be returned
-    with a single query, the last evaluated key will be returned. This can then be re-used in the next
-    query.
-
-    :param last_evaluated_key: The key of the last evaluated key on a previous request, defaults to None
-    :raises e: If something went wrong while querying
-    :return: The last evaluated key (if present) and a list of section IDs
-    """
-
-    # query table
-    optional_params = {"ExclusiveStartKey": last_evaluated_key} if last_evaluated_key else {}
-    try:
-        response = table.query(
-            KeyConditionExpression=(Key("PK").eq("baseEntity") & Key("SK").begins_with("section#")),
-            Select="SPECIFIC_ATTRIBUTES",
-            ProjectionExpression="SK",
-            **optional_params,
-        )
-    except Exception as e:
-        logging.error(f"Error querying DynamoDB: {e}")
-        raise e
-
-    # get section IDs
-    items = response["Items"]
-    section_ids = [item["SK"].replace("section#", "", 1) for item in items]
-
-    # check if there are more results
-    if "LastEvaluatedKey" in response:
-        last_evaluated_key = response["LastEvaluatedKey"]
-    else:
-        last_evaluated_key = None
-
-    return last_evaluated_key, section_ids
+# the central DynamoDB table (low-level client, as shards are queried from multiple threads)
+table_name = os.environ["DB_NAME"]
+dynamodb = aws_clients.client("dynamodb")
 
 
+@instrumentation.instrumented
 def handler(event, context):
     """Gets a list of all available sections and returns their IDs.
 
-    Return value to workflow:
-    - type: list
-    - values: the IDs of all sections in the system
-    """
-    # no input from workflow required
+    If dirtyOnly is set, only the IDs of sections that depend on dirty streets (through their
+    street attribute, see change_tracking) or that are not part of the display state yet (see
+    display_state) are returned. The display state of all other sections is still current.
 
-    # get all sectionIDs from DynamoDB
-    section_ids = []
-    first_request_done = False
-    last_evaluated_key = None
-    while first_request_done == False or last_evaluated_key is not None:
-        first_request_done = True
-        last_evaluated_key, section_ids_batch = get_section_ids_from_table(last_evaluated_key)
-        section_ids.extend(section_ids_batch)
+    The number of display state items is derived from the number of all sections (see
+    display_state.num_shards) and passed on to determine_info, so all functions of a run use the
+    same shards.
 
-    # output to workflow
-    return section_ids
+    Return value to workflow:
+    - type: dict
+    - sectionIds: the IDs of all (dirty) sections in the system, ordered by display state shard
+    - displayShards: the number of display state items
+    """
+    # input from workflow (optional)
+    # true if only the IDs of dirty sections shall be returned
+    dirty_only: bool = event.get("dirtyOnly", False)
+
+    # drop cached IDs if the topology changed since they have been loaded
+    metadata_cache.cache.check_version(dynamodb, table_name)
+
+    # get all section IDs from all shards in DynamoDB (or from the cache of a warm container)
+    section_ids = metadata_cache.cache.get_or_load(
+        "sectionIds", lambda: base_entities.list_ids(dynamodb, table_name, "section")
+    )
+    num_shards = display_state.num_shards(len(section_ids))
+
+    # determine sections that depend on dirty streets or have never been displayed
+    if dirty_only:
+        # the IDs of the dirty streets (as returned by get_street_list)
+        street_ids: list[str] = event["streetIds"]
+        dirty_sort_keys = {f"street#{street_id}" for street_id in street_ids}
+        dependencies = change_tracking.get_dependencies(
+            dynamodb, table_name, "section", section_ids, {"street": "street"}
+        )
+        displayed = display_state.get_display_state(dynamodb, table_name, num_shards)
+        section_ids = [
+            section_id
+            for section_id in section_ids
+            if section_id not in displayed
+            or not dirty_sort_keys.isdisjoint(dependencies.get(section_id, []))
+        ]
+
+    # output to workflow, ordered by display state shard, so the sections of a batch of the
+    # workflow (consecutive IDs) belong to one or two shards, which are all determine_info reads
+    return {
+        "sectionIds": sorted(
+            section_ids, key=lambda section_id: display_state.shard_of(section_id, num_shards)
+        ),
+        "displayShards": num_shards,
+    }
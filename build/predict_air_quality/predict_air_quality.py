@@ -1,22 +1,256 @@
-import boto3
 import os
+import math
+import logging
 
-# the central DynamoDB table
-table = boto3.resource("dynamodb").Table(os.environ["DB_NAME"])
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
+import aws_clients
+import change_tracking
+import dynamo_batch
+import instrumentation
+import regression_state
+import retention
 
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
+
+# the central DynamoDB table (low-level client, as stations are queried from multiple threads)
+table_name = os.environ["DB_NAME"]
+dynamodb = aws_clients.client("dynamodb")
+
+# constants
+MAX_MEASUREMENT_AGE = 7200  # 2h
+# max. number of stations queried concurrently
+MAX_WORKERS = 16
+
+
+def get_measurements(
+    station_id: str, earliest_time: int, latest_time: Optional[int] = None
+) -> dict[int, float]:
+    """Queries the table and retrieves all measurements of a specific station
+
+    :param station_id: The ID of the station for which measurements shall be returned
+    :param earliest_time: Consider no measurements older than the given time (use POSIX timestamp)
+    :param latest_time: Consider no measurements newer than the given time (use POSIX timestamp),
+    defaults to None (no limit)
+    :raises e: If something went wrong while querying
+    :return: A dictionary with the times of the measurements as keys and the measured air quality
+    as values
+    """
+
+    measurements = {}
+    last_evaluated_key: Optional[dict] = None
+    while True:
+        # query table
+        optional_params = {"ExclusiveStartKey": last_evaluated_key} if last_evaluated_key else {}
+        try:
+            response = dynamodb.query(
+                TableName=table_name,
+                # upper bound, as predictions of the station sort after measurements
+                KeyConditionExpression="PK = :pk AND SK BETWEEN :earliest AND :latest",
+                ExpressionAttributeValues={
+                    ":pk": {"S": f"station#{station_id}"},
+                    ":earliest": {"S": f"measurement#{earliest_time}"},
+                    ":latest": {
+                        "S": f"measurement#{latest_time if latest_time is not None else '~'}"
+                    },
+                },
+                ProjectionExpression="SK, airQuality",
+                **optional_params,
+            )
+        except Exception as e:
+            logging.error(f"Error while querying DynamoDB: {e}")
+            raise e
+
+        # get measurement timestamps and values
+        for item in response["Items"]:
+            timestamp = int(item["SK"]["S"].replace("measurement#", "", 1))
+            measurements[timestamp] = float(item["airQuality"]["N"])
+
+        # check if there are more results
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if last_evaluated_key is None:
+            return measurements
+
+
+def get_regression_states(station_ids: list[str]) -> dict[str, regression_state.RegressionState]:
+    """Retrieves the stored regression states of multiple stations from the DynamoDB table
+
+    :param station_ids: The IDs of the stations for which states shall be retrieved
+    :raises e: If something went wrong while querying
+    :return: A dictionary with station IDs as keys and regression states as values. Stations
+    without a stored state are omitted.
+    """
+
+    items = dynamo_batch.batch_get_items(
+        dynamodb,
+        table_name,
+        [
+            {"PK": {"S": f"station#{station_id}"}, "SK": {"S": regression_state.SORT_KEY}}
+            for station_id in station_ids
+        ],
+        "PK, watermark, bucketSize, buckets",
+    )
+
+    return {
+        item["PK"]["S"].replace("station#", "", 1): regression_state.RegressionState.from_item(item)
+        for item in items
+    }
+
+
+def rebuild_regression_state(
+    station_id: str, earliest_time: int, predict_for: int
+) -> regression_state.RegressionState:
+    """Builds the regression state of a station from all measurements of the window. For hours
+    already compacted (see compact_time_series), a single hourly aggregate is read instead of the
+    measurements of the hour.
+
+    :param station_id: The ID of the station
+    :param earliest_time: Consider no measurements older than the given time (use POSIX timestamp)
+    :param predict_for: The POSIX timestamp of the time for which the prediction shall be made
+    :return: The regression state
+    """
+
+    state = regression_state.RegressionState()
+    aggregates = retention.get_aggregates(
+        dynamodb, table_name, f"station#{station_id}", "hourly", earliest_time, predict_for
+    )
+    state.add_aggregates(aggregates, retention.RESOLUTIONS["hourly"])
+    for earliest, latest in retention.get_uncovered_ranges(aggregates, "hourly", earliest_time):
+        state.add(get_measurements(station_id, earliest, latest))
+
+    return state
+
+
+def update_regression_state(
+    station_id: str,
+    state: Optional[regression_state.RegressionState],
+    earliest_time: int,
+    predict_for: int,
+) -> regression_state.RegressionState:
+    """Updates the regression state of a station with all measurements since its watermark. If
+    there is no state or it is stale, it is rebuilt from the window (see rebuild_regression_state).
+
+    :param station_id: The ID of the station
+    :param state: The stored regression state of the station, None if there is none
+    :param earliest_time: Consider no measurements older than the given time (use POSIX timestamp)
+    :param predict_for: The POSIX timestamp of the time for which the prediction shall be made
+    :return: The updated regression state
+    """
+
+    if state is None or state.is_stale(earliest_time):
+        state = rebuild_regression_state(station_id, earliest_time, predict_for)
+    else:
+        state.add(get_measurements(station_id, state.watermark + 1))
+    state.evict(earliest_time)
+
+    return state
+
+
+def predict_air_qualities(
+    station_ids: list[str], predict_for: int, rebuild: bool = False
+) -> tuple[dict[str, float], list[regression_state.RegressionState]]:
+    """Predicts the air quality of multiple stations for a given time. Only measurements newer than
+    the watermark of the stored regression state of a station are queried (concurrently), predictions
+    for all stations are made with a single vectorised fit.
+
+    :param station_ids: The IDs of the stations for which predictions shall be made
+    :param predict_for: The POSIX timestamp of the time for which predictions shall be made
+    :param rebuild: True if stored regression states shall be ignored, defaults to False
+    :return: A tuple containing the following values:
+    - dictionary with station IDs as keys and the predicted air quality (between 0.0 and 1.0) as
+    values, stations without measurements are omitted
+    - updated regression states of all stations (in the order of the given station IDs)
+    """
+
+    # get stored regression states of all stations
+    earliest_time = predict_for - MAX_MEASUREMENT_AGE
+    stored_states = {} if rebuild else get_regression_states(station_ids)
+
+    # update regression states with new measurements
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        states = list(
+            executor.map(
+                lambda station_id: update_regression_state(
+                    station_id, stored_states.get(station_id), earliest_time, predict_for
+                ),
+                station_ids,
+            )
+        )
+
+    # predict for all stations at once
+    with instrumentation.phase("Predict"):
+        predictions = regression_state.predict(states, predict_for)
+
+    air_quality_predictions = {}
+    for station_id, prediction in zip(station_ids, predictions.tolist()):
+        if math.isnan(prediction):
+            logging.error(f"No measurements found for station {station_id}")
+            continue
+        air_quality_predictions[station_id] = min(1.0, max(0.0, prediction))
+
+    return air_quality_predictions, states
+
+
+def create_prediction_item(station_id: str, predict_for: int, air_quality: float) -> dict:
+    """Creates the (serialized) DynamoDB item for the air quality prediction of a station
+
+    :param station_id: The ID of the station
+    :param predict_for: The POSIX timestamp of the time for which the prediction has been made
+    :param air_quality: The predicted air quality
+    :return: The item to store in the DynamoDB table
+    """
+
+    return {
+        "PK": {"S": f"station#{station_id}"},
+        "SK": {"S": f"prediction#{predict_for}"},
+        "airQuality": {"N": str(air_quality)},
+        **retention.expires_at("prediction", predict_for),
+    }
+
+
+@instrumentation.instrumented
 def handler(event, context):
     """Retrieves measurements for a specific station from the DynamoDB table
     and makes a prediction for a specified time using linear regression or any
     other suitably simple model.
     No measurements older than a defined amount of time should be considered.
     The prediction is stored in the DynamoDB table again.
+
+    Measurements are not re-read each run: a regression state per station (sufficient statistics
+    of the window) is updated with new measurements only and stored in the table (see
+    regression_state). Set rebuildModels to rebuild all states from all measurements of the window.
+
+    If a list of station IDs is given instead of a single station ID, predictions for all stations
+    are made at once (see predict_air_qualities) and stored with batch requests.
     """
     # input from workflow
     # the POSIX timestamp of the time for which an air quality prediction shall be made
     predict_for: int = event["predictFor"]
+    # the IDs of the stations for which the prediction shall be made (batch mode), otherwise
     # the ID of the station for which the prediction shall be made
-    station_id: str = event["stationId"]
+    station_ids: list[str] = event["stationIds"] if "stationIds" in event else [event["stationId"]]
+    # optional: rebuild regression states from all measurements of the window
+    rebuild: bool = event.get("rebuildModels", False)
+
+    # predict
+    air_quality_predictions, states = predict_air_qualities(station_ids, predict_for, rebuild)
+
+    # store predictions, updated regression states and change tracking rows in DynamoDB
+    dynamo_batch.batch_put_items(
+        dynamodb,
+        table_name,
+        [
+            create_prediction_item(station_id, predict_for, air_quality)
+            for station_id, air_quality in air_quality_predictions.items()
+        ]
+        + [state.to_item(f"station#{station_id}") for station_id, state in zip(station_ids, states)]
+        + [
+            change_tracking.create_item("station", station_id, predict_for, state.watermark)
+            for station_id, state in zip(station_ids, states)
+        ],
+    )
 
     # no output to workflow - result stored in DynamoDB directly
     return {}
@@ -1,17 +1,124 @@
+import os
+import math
+import logging
+
+from typing import Optional
+
+import aws_clients
+import instrumentation
+import regression_state
+import vehicle_counts
+
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
+
+# the central DynamoDB table
+table_name = os.environ["DB_NAME"]
+dynamodb = aws_clients.client("dynamodb")
+
+
+def get_regression_state(camera_id: str) -> Optional[regression_state.RegressionState]:
+    """Retrieves the stored regression state of the car counts of a camera
+
+    :param camera_id: The ID of the camera
+    :raises e: If something went wrong while querying
+    :return: The regression state, None if there is none
+    """
+
+    try:
+        response = dynamodb.get_item(
+            TableName=table_name,
+            Key={"PK": {"S": f"camera#{camera_id}"}, "SK": {"S": regression_state.SORT_KEY}},
+            ProjectionExpression="watermark, bucketSize, buckets",
+        )
+    except Exception as e:
+        logging.error(f"Error while querying DynamoDB: {e}")
+        raise e
+
+    item = response.get("Item")
+    return regression_state.RegressionState.from_item(item) if item else None
+
+
+def update_regression_state(
+    state: Optional[regression_state.RegressionState],
+    car_counts: dict[int, int],
+    earliest_time: int,
+) -> regression_state.RegressionState:
+    """Updates the regression state of a camera with the car counts of all images newer than its
+    watermark. If there is no state or it is stale, it is rebuilt from all car counts of the window
+    (the given car counts cover the whole window, see get_images).
+
+    :param state: The stored regression state of the camera, None if there is none
+    :param car_counts: A dictionary with POSIX timestamps as keys and car counts as values
+    :param earliest_time: Consider no car counts older than the given time (use POSIX timestamp)
+    :return: The updated regression state
+    """
+
+    if state is None or state.is_stale(earliest_time):
+        state = regression_state.RegressionState()
+        state.add({t: count for t, count in car_counts.items() if t >= earliest_time})
+    else:
+        state.add({t: count for t, count in car_counts.items() if t > state.watermark})
+    state.evict(earliest_time)
+
+    return state
+
+
+@instrumentation.instrumented
 def handler(event, context):
     """Uses car counts for specific times to predict the car count for another time using linear
     regression or any other reasonably simple prediction model.
 
+    Car counts are not refitted each run: a regression state per camera (sufficient statistics of
+    the window) is updated with the car counts of new images only and stored in the table (see
+    regression_state), as analyze_cameras does. Set rebuildModels to rebuild the state from all car
+    counts of the window.
+
+    If car counts of multiple cameras are given (carCounts instead of carCount), the predictions for
+    all cameras are made at once with a single vectorised fit (see forecasting), without any
+    regression state.
+
     Return to workflow:
-    - type: int
+    - type: int (dict[string, int] with camera IDs as keys for multiple cameras)
     - value: the number of cars predicted for the given time
     """
     # input from workflow
     # the POSIX timestamp of the time for which the predict shall be made
     predict_for: int = event["predictFor"]
+
+    # batch of cameras
+    if "carCounts" in event:
+        # a dictionary with camera IDs as keys and car counts (as for a single camera) as values
+        car_counts: dict[str, dict[int, int]] = {
+            camera_id: {int(k): v for k, v in counts.items()}
+            for camera_id, counts in event["carCounts"].items()
+        }
+        predictions = vehicle_counts.predict_car_counts(list(car_counts.values()), predict_for)
+
+        # output to workflow
+        return dict(zip(car_counts.keys(), predictions))
+
+    # the ID of the camera that took the images
+    camera_id: str = event["cameraId"]
     # a dictionary of car counts for specific times, where the key is the time (POSIX timestamp) and the value is the car count
     car_count: dict[int, int] = {int(k): v for k, v in event["carCount"].items()}
+    # optional: rebuild the regression state from all car counts of the window
+    rebuild: bool = event.get("rebuildModels", False)
+
+    # update the stored regression state with new car counts and predict
+    earliest_time = predict_for - vehicle_counts.MAX_IMAGE_AGE
+    stored_state = None if rebuild else get_regression_state(camera_id)
+    state = update_regression_state(stored_state, car_count, earliest_time)
+    with instrumentation.phase("Predict"):
+        (prediction,) = regression_state.predict([state], predict_for).tolist()
+
+    # store the updated regression state in DynamoDB
+    try:
+        dynamodb.put_item(TableName=table_name, Item=state.to_item(f"camera#{camera_id}"))
+    except Exception as e:
+        logging.error(f"Error while storing regression state in DynamoDB: {e}")
+        raise e
 
     # output to workflow
-    car_count_preediction = 10  # dummy value for workflow testing - TODO: remove
-    return car_count_preediction
+    car_count_prediction = 0 if math.isnan(prediction) else max(0, round(prediction))
+    return car_count_prediction
@@ -0,0 +1,79 @@
+import threading
+
+import instrumentation
+
+# constants
+# max. number of pooled (kept-alive) connections per client, at least the number of threads using
+# a client concurrently (thread pools of the functions and shared modules, see MAX_WORKERS)
+MAX_POOL_CONNECTIONS = 64
+# seconds to wait for a connection to be established / for a response
+CONNECT_TIMEOUT = 2
+READ_TIMEOUT = 20
+# max. number of attempts of a request (standard retry mode: exponential backoff with jitter on
+# throttling and transient errors)
+MAX_ATTEMPTS = 5
+
+# clients created so far, by service name (clients are thread-safe and shared by all modules)
+_clients: dict = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name: str):
+    """Returns the low-level client of a service, created on first use. All clients share a tuned
+    configuration (connection pool, TCP keep-alive, retries) and are instrumented (see
+    instrumentation.instrument).
+
+    :param service_name: The name of the service, e.g. "dynamodb"
+    :return: The client
+    """
+
+    client = _clients.get(service_name)
+    if client is None:
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                # imported on first use, so importing a function does not load boto3/botocore
+                import boto3
+                from botocore.config import Config
+
+                config = Config(
+                    max_pool_connections=MAX_POOL_CONNECTIONS,
+                    connect_timeout=CONNECT_TIMEOUT,
+                    read_timeout=READ_TIMEOUT,
+                    tcp_keepalive=True,
+                    retries={"mode": "standard", "max_attempts": MAX_ATTEMPTS},
+                )
+                client = instrumentation.instrument(boto3.client(service_name, config=config))
+                _clients[service_name] = client
+
+    return client
+
+
+class LazyClient:
+    """Stands in for the low-level client of a service at module level. The client is created
+    when it is used for the first time (see get_client), i.e. within the first invocation instead
+    of while the function is imported."""
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+
+    def __getattr__(self, name: str):
+        return getattr(get_client(self.service_name), name)
+
+
+def client(service_name: str) -> LazyClient:
+    """Returns a lazily created low-level client of a service, e.g. client("dynamodb")
+
+    :param service_name: The name of the service
+    :return: The client
+    """
+
+    return LazyClient(service_name)
+
+
+def reset():
+    """Drops all clients, e.g. to create them again within mocked services or after the default
+    boto3 session has been replaced"""
+
+    with _lock:
+        _clients.clear()
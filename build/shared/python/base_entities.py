@@ -0,0 +1,136 @@
+import os
+import zlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+# constants
+# number of partitions base entities are spread across ("baseEntity#0" to "baseEntity#{n-1}")
+NUM_SHARDS = int(os.environ.get("BASE_ENTITY_SHARDS", "8"))
+# max. number of shards queried concurrently when listing base entities
+MAX_WORKERS = 16
+# partition key prefix of base entities
+PARTITION_KEY_PREFIX = "baseEntity"
+
+
+def shard_of(sort_key: str, num_shards: int = NUM_SHARDS) -> int:
+    """Determines the shard of a base entity. The shard only depends on the sort key, so every
+    reader and writer derives the same partition key without any lookup.
+
+    :param sort_key: The sort key of the base entity, e.g. "street#{ID}"
+    :param num_shards: The total number of shards, defaults to NUM_SHARDS
+    :return: The shard number between 0 and num_shards - 1
+    """
+
+    return zlib.crc32(sort_key.encode()) % num_shards
+
+
+def partition_key(sort_key: str, num_shards: int = NUM_SHARDS) -> str:
+    """Determines the partition key of a base entity
+
+    :param sort_key: The sort key of the base entity, e.g. "street#{ID}"
+    :param num_shards: The total number of shards, defaults to NUM_SHARDS
+    :return: The partition key, e.g. "baseEntity#3"
+    """
+
+    return f"{PARTITION_KEY_PREFIX}#{shard_of(sort_key, num_shards)}"
+
+
+def key(sort_key: str, num_shards: int = NUM_SHARDS) -> dict:
+    """Creates the (serialized) primary key of a base entity, e.g. for GetItem or BatchGetItem
+
+    :param sort_key: The sort key of the base entity, e.g. "street#{ID}"
+    :param num_shards: The total number of shards, defaults to NUM_SHARDS
+    :return: The primary key
+    """
+
+    return {"PK": {"S": partition_key(sort_key, num_shards)}, "SK": {"S": sort_key}}
+
+
+def query_shard(dynamodb, table_name: str, shard: int, entity_type: str) -> list[str]:
+    """Queries a single shard and retrieves the IDs of all base entities of the given type,
+    following pagination.
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param shard: The shard to query
+    :param entity_type: The type of the base entities, e.g. "camera"
+    :raises e: If something went wrong while querying
+    :return: The IDs of all base entities of the given type within the shard
+    """
+
+    prefix = f"{entity_type}#"
+    ids = []
+    last_evaluated_key: Optional[dict] = None
+    while True:
+        # query table
+        optional_params = {"ExclusiveStartKey": last_evaluated_key} if last_evaluated_key else {}
+        try:
+            response = dynamodb.query(
+                TableName=table_name,
+                KeyConditionExpression="PK = :pk AND begins_with(SK, :prefix)",
+                ExpressionAttributeValues={
+                    ":pk": {"S": f"{PARTITION_KEY_PREFIX}#{shard}"},
+                    ":prefix": {"S": prefix},
+                },
+                ProjectionExpression="SK",
+                **optional_params,
+            )
+        except Exception as e:
+            logging.error(f"Error querying DynamoDB: {e}")
+            raise e
+
+        # get IDs
+        ids.extend(item["SK"]["S"].replace(prefix, "", 1) for item in response["Items"])
+
+        # check if there are more results
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if last_evaluated_key is None:
+            return ids
+
+
+def iter_ids(
+    dynamodb, table_name: str, entity_type: str, num_shards: int = NUM_SHARDS
+) -> Iterator[list[str]]:
+    """Queries all shards concurrently and yields the IDs of the base entities of the given type
+    shard by shard, in the order in which the shards complete.
+
+    :param dynamodb: The low-level DynamoDB client (clients are thread-safe, resources are not)
+    :param table_name: The name of the table
+    :param entity_type: The type of the base entities, e.g. "camera"
+    :param num_shards: The total number of shards, defaults to NUM_SHARDS
+    :raises e: If something went wrong while querying any shard
+    :return: The IDs of all base entities of one shard per iteration
+    """
+
+    with ThreadPoolExecutor(max_workers=min(num_shards, MAX_WORKERS)) as executor:
+        futures = [
+            executor.submit(query_shard, dynamodb, table_name, shard, entity_type)
+            for shard in range(num_shards)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def list_ids(
+    dynamodb, table_name: str, entity_type: str, num_shards: int = NUM_SHARDS
+) -> list[str]:
+    """Retrieves the IDs of all base entities of the given type from all shards (see iter_ids)
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param entity_type: The type of the base entities, e.g. "camera"
+    :param num_shards: The total number of shards, defaults to NUM_SHARDS
+    :raises e: If something went wrong while querying any shard
+    :return: The sorted IDs of all base entities of the given type
+    """
+
+    ids = []
+    for shard_ids in iter_ids(dynamodb, table_name, entity_type, num_shards):
+        ids.extend(shard_ids)
+
+    # sort to return the same order on each run, independent of shard completion order
+    ids.sort()
+
+    return ids
@@ -0,0 +1,372 @@
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import base_entities
+import dynamo_batch
+import dynamo_codec
+import metadata_cache
+
+# constants
+# sort key of the change tracking row of an entity (partition key: "{type}#{ID}")
+SORT_KEY = "changes"
+# max. age in seconds of a result that is carried forward, entities are processed again after that
+# time even without changes, so results follow the sliding window of images and measurements
+MAX_RESULT_AGE = 1800  # 30min
+# sort key of the row that records the latest image/measurement an entity received (partition key:
+# "{type}#{ID}"), written by everyone writing images/measurements (see create_received_item)
+RECEIVED_SORT_KEY = "received"
+# max. number of entities queried concurrently
+MAX_WORKERS = 16
+
+
+class Watermark(NamedTuple):
+    """Change tracking state of an entity, as stored in its change tracking row"""
+
+    # the POSIX timestamp of the time for which the stored results of the entity have been made
+    processed_for: int
+    # the POSIX timestamp of the latest image/measurement included in the results (if any)
+    latest_data: Optional[int] = None
+
+
+def create_item(
+    entity_type: str, entity_id: str, processed_for: int, latest_data: Optional[int] = None
+) -> dict:
+    """Creates the (serialized) change tracking row of an entity. To be stored together with the
+    results of the entity, once they have been stored successfully.
+
+    :param entity_type: The type of the entity, e.g. "camera"
+    :param entity_id: The ID of the entity
+    :param processed_for: The POSIX timestamp of the time for which results have been made
+    :param latest_data: The POSIX timestamp of the latest image/measurement included in the
+    results, defaults to None
+    :return: The item to store in the DynamoDB table
+    """
+
+    item = {
+        "PK": {"S": f"{entity_type}#{entity_id}"},
+        "SK": {"S": SORT_KEY},
+        "processedFor": {"N": str(processed_for)},
+    }
+    if latest_data is not None:
+        item["latestData"] = {"N": str(latest_data)}
+
+    return item
+
+
+def get_watermarks(
+    dynamodb, table_name: str, entity_type: str, entity_ids: list[str]
+) -> dict[str, Watermark]:
+    """Retrieves the change tracking state of multiple entities of the same type
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param entity_type: The type of the entities, e.g. "camera"
+    :param entity_ids: The IDs of the entities
+    :raises e: If something went wrong while querying
+    :return: A dictionary with entity IDs as keys and watermarks as values. Entities that have
+    never been processed are omitted.
+    """
+
+    items = dynamo_batch.batch_get_items(
+        dynamodb,
+        table_name,
+        [
+            {"PK": {"S": f"{entity_type}#{entity_id}"}, "SK": {"S": SORT_KEY}}
+            for entity_id in entity_ids
+        ],
+        "PK, processedFor, latestData",
+    )
+
+    return {
+        item["PK"]["S"].replace(f"{entity_type}#", "", 1): Watermark(
+            int(item["processedFor"]["N"]),
+            int(item["latestData"]["N"]) if "latestData" in item else None,
+        )
+        for item in items
+    }
+
+
+def is_expired(watermark: Optional[Watermark], predict_for: int) -> bool:
+    """Checks if the stored results of an entity can not be carried forward to the given time
+
+    :param watermark: The watermark of the entity, None if it has never been processed
+    :param predict_for: The POSIX timestamp of the time for which results are required
+    :return: True if the entity has to be processed again, False otherwise
+    """
+
+    return (
+        watermark is None
+        or watermark.processed_for > predict_for
+        or watermark.processed_for < predict_for - MAX_RESULT_AGE
+    )
+
+
+def create_received_item(entity_type: str, entity_id: str, latest_data: int) -> dict:
+    """Creates the (serialized) row that records the latest image/measurement an entity received.
+    To be stored together with the images/measurements of the entity (e.g. by scripts/load_data.py),
+    so dirty entities are found without querying their data (see get_dirty_data_ids).
+
+    :param entity_type: The type of the entity, "camera" or "station"
+    :param entity_id: The ID of the entity
+    :param latest_data: The POSIX timestamp of the latest image/measurement of the entity
+    :return: The item to store in the DynamoDB table
+    """
+
+    return {
+        "PK": {"S": f"{entity_type}#{entity_id}"},
+        "SK": {"S": RECEIVED_SORT_KEY},
+        "latestData": {"N": str(latest_data)},
+    }
+
+
+def get_received_data(
+    dynamodb, table_name: str, entity_type: str, entity_ids: list[str]
+) -> dict[str, int]:
+    """Retrieves the timestamps of the latest images/measurements multiple entities received (see
+    create_received_item)
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param entity_type: The type of the entities, "camera" or "station"
+    :param entity_ids: The IDs of the entities
+    :raises e: If something went wrong while querying
+    :return: A dictionary with entity IDs as keys and POSIX timestamps as values. Entities that
+    have never received data are omitted.
+    """
+
+    items = dynamo_batch.batch_get_items(
+        dynamodb,
+        table_name,
+        [
+            {"PK": {"S": f"{entity_type}#{entity_id}"}, "SK": {"S": RECEIVED_SORT_KEY}}
+            for entity_id in entity_ids
+        ],
+        "PK, latestData",
+    )
+
+    return {
+        item["PK"]["S"].replace(f"{entity_type}#", "", 1): int(item["latestData"]["N"])
+        for item in items
+    }
+
+
+def get_dirty_data_ids(
+    dynamodb, table_name: str, entity_type: str, entity_ids: list[str], predict_for: int
+) -> list[str]:
+    """Determines the entities that received new data (images/measurements) since they have been
+    processed last, or whose results can not be carried forward to the given time. New data is
+    detected by the rows written along with it (see create_received_item).
+
+    :param dynamodb: The low-level DynamoDB client (clients are thread-safe, resources are not)
+    :param table_name: The name of the table
+    :param entity_type: The type of the entities, "camera" or "station"
+    :param entity_ids: The IDs of all entities of the given type
+    :param predict_for: The POSIX timestamp of the time for which results are required
+    :raises e: If something went wrong while querying
+    :return: The IDs of the dirty entities (in the order of the given IDs)
+    """
+
+    # both are read with BatchGetItem requests, no entity's images/measurements are queried
+    watermarks = get_watermarks(dynamodb, table_name, entity_type, entity_ids)
+    received_data = get_received_data(dynamodb, table_name, entity_type, entity_ids)
+
+    dirty_ids = []
+    for entity_id in entity_ids:
+        watermark = watermarks.get(entity_id)
+        if is_expired(watermark, predict_for):
+            dirty_ids.append(entity_id)
+            continue
+        latest = received_data.get(entity_id)
+        if latest is not None and (watermark.latest_data is None or latest > watermark.latest_data):
+            dirty_ids.append(entity_id)
+
+    return dirty_ids
+
+
+def get_dependencies(
+    dynamodb,
+    table_name: str,
+    entity_type: str,
+    entity_ids: list[str],
+    attributes: dict[str, str],
+) -> dict[str, list[str]]:
+    """Retrieves the entities the given entities depend on, e.g. the cameras and the station of a
+    street. The topology is static and therefore served from the metadata cache if available.
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param entity_type: The type of the entities, e.g. "street"
+    :param entity_ids: The IDs of the entities
+    :param attributes: The attributes of the base entity that reference other entities (an ID or
+    a list of IDs) as keys and the type of the referenced entities as values, e.g.
+    {"cameras": "camera", "station": "station"}
+    :raises e: If something went wrong while querying
+    :return: A dictionary with entity IDs as keys and the sort keys of the referenced entities
+    (e.g. "camera#{ID}") as values. Entities that are not in the table are omitted.
+    """
+
+    def load(cache_keys: list[str]) -> dict[str, list[str]]:
+        items = dynamo_batch.batch_get_items(
+            dynamodb,
+            table_name,
+            [
+                base_entities.key(cache_key.replace("dependencies#", "", 1))
+                for cache_key in cache_keys
+            ],
+            ", ".join(["SK", *attributes]),
+        )
+
+        dependencies = {}
+        for item in items:
+            item = dynamo_codec.deserialize_item(item)
+            references = []
+            for attribute, referenced_type in attributes.items():
+                values = item.get(attribute, [])
+                values = [values] if isinstance(values, str) else values
+                references.extend(f"{referenced_type}#{value}" for value in values)
+            dependencies[f"dependencies#{item['SK']}"] = references
+
+        return dependencies
+
+    dependencies = metadata_cache.cache.get_many_or_load(
+        [f"dependencies#{entity_type}#{entity_id}" for entity_id in entity_ids], load
+    )
+
+    return {
+        cache_key.replace(f"dependencies#{entity_type}#", "", 1): references
+        for cache_key, references in dependencies.items()
+    }
+
+
+def get_dirty_dependent_ids(
+    dynamodb,
+    table_name: str,
+    entity_type: str,
+    entity_ids: list[str],
+    attributes: dict[str, str],
+    dirty_sort_keys: set[str],
+    predict_for: int,
+) -> list[str]:
+    """Determines the entities that depend on a dirty entity (see get_dependencies), or whose
+    results can not be carried forward to the given time.
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param entity_type: The type of the entities, e.g. "street"
+    :param entity_ids: The IDs of all entities of the given type
+    :param attributes: The attributes that reference other entities (see get_dependencies)
+    :param dirty_sort_keys: The sort keys of the dirty referenced entities, e.g. "camera#{ID}"
+    :param predict_for: The POSIX timestamp of the time for which results are required
+    :raises e: If something went wrong while querying
+    :return: The IDs of the dirty entities (in the order of the given IDs)
+    """
+
+    dependencies = get_dependencies(dynamodb, table_name, entity_type, entity_ids, attributes)
+    watermarks = get_watermarks(dynamodb, table_name, entity_type, entity_ids)
+
+    return [
+        entity_id
+        for entity_id in entity_ids
+        if is_expired(watermarks.get(entity_id), predict_for)
+        or not dirty_sort_keys.isdisjoint(dependencies.get(entity_id, []))
+    ]
+
+
+def get_latest_result(
+    dynamodb,
+    table_name: str,
+    partition_key: str,
+    result_prefix: str,
+    predict_for: int,
+    projection_expression: str,
+) -> Optional[dict]:
+    """Retrieves the latest result of an entity that can be carried forward to the given time
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param partition_key: The partition key of the entity, e.g. "camera#{ID}"
+    :param result_prefix: The sort key prefix of the results, e.g. "trafficCount"
+    :param predict_for: The POSIX timestamp of the time for which the result is required
+    :param projection_expression: The attributes to retrieve
+    :raises e: If something went wrong while querying
+    :return: The (serialized) item of the result, None if there is none
+    """
+
+    # query table (newest first, only the first item is required)
+    try:
+        response = dynamodb.query(
+            TableName=table_name,
+            KeyConditionExpression="PK = :pk AND SK BETWEEN :earliest AND :latest",
+            ExpressionAttributeValues={
+                ":pk": {"S": partition_key},
+                ":earliest": {"S": f"{result_prefix}#{predict_for - MAX_RESULT_AGE}"},
+                ":latest": {"S": f"{result_prefix}#{predict_for}"},
+            },
+            ProjectionExpression=projection_expression,
+            ConsistentRead=True,
+            ScanIndexForward=False,
+            Limit=1,
+        )
+    except Exception as e:
+        logging.error(f"Error while querying DynamoDB: {e}")
+        raise e
+
+    return response["Items"][0] if response["Items"] else None
+
+
+def get_results(
+    dynamodb,
+    table_name: str,
+    partition_keys: list[str],
+    result_prefix: str,
+    predict_for: int,
+    projection_expression: str,
+) -> list[dict]:
+    """Retrieves the results of multiple entities for the given time. Entities that have not been
+    dirty have no result for the given time, their latest result is carried forward instead (see
+    get_latest_result).
+
+    :param dynamodb: The low-level DynamoDB client (clients are thread-safe, resources are not)
+    :param table_name: The name of the table
+    :param partition_keys: The partition keys of the entities, e.g. "camera#{ID}"
+    :param result_prefix: The sort key prefix of the results, e.g. "trafficCount"
+    :param predict_for: The POSIX timestamp of the time for which the results are required
+    :param projection_expression: The attributes to retrieve, must include PK
+    :raises e: If something went wrong while querying
+    :return: The (serialized) items of the results, in no particular order. Entities without a
+    result are omitted.
+    """
+
+    # get results for the given time
+    items = dynamo_batch.batch_get_items(
+        dynamodb,
+        table_name,
+        [
+            {"PK": {"S": partition_key}, "SK": {"S": f"{result_prefix}#{predict_for}"}}
+            for partition_key in partition_keys
+        ],
+        projection_expression,
+        consistent_read=True,
+    )
+
+    # carry forward the latest results of the other entities
+    found = {item["PK"]["S"] for item in items}
+    missing = [partition_key for partition_key in partition_keys if partition_key not in found]
+    if missing:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            latest_items = executor.map(
+                lambda partition_key: get_latest_result(
+                    dynamodb,
+                    table_name,
+                    partition_key,
+                    result_prefix,
+                    predict_for,
+                    projection_expression,
+                ),
+                missing,
+            )
+            items.extend(item for item in latest_items if item is not None)
+
+    return items
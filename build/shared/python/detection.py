@@ -0,0 +1,327 @@
+import os
+import time
+import zlib
+import logging
+import threading
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+import dynamo_batch
+import instrumentation
+
+# constants
+# label detected by Rekognition for (normal) cars
+CAR_LABEL = "Car"
+# labels detected by Rekognition for emergency vehicles
+EMERGENCY_VEHICLE_LABELS = {"Ambulance", "Fire Truck", "Police Car"}
+# min. confidence (in percent) for a label detected by Rekognition to be considered
+MIN_CONFIDENCE = 70.0
+# max. number of detection results kept in memory, least recently used results are evicted first
+MAX_CACHED_DETECTIONS = 8192
+# max. number of images fetched and analysed concurrently
+MAX_WORKERS = 8
+# S3 keys of images are unique (they contain the time the image was taken) and images are never
+# overwritten, so cached results are trusted without re-reading the object. If True, the ETag stored
+# with a cached result is compared against a HEAD request of the object instead.
+VERIFY_ETAG = False
+# seconds the function may run (set by the stack, see iac/main_stack.py), Lambda's default if unset
+FUNCTION_TIMEOUT = float(os.environ.get("FUNCTION_TIMEOUT", 3))
+# seconds an image is claimed by the invocation that analyses it. count_cars and
+# count_emergency_vehicles run in parallel and usually need the same image, the invocation that
+# does not get the claim waits for the result of the other one instead of analysing the image, too.
+# If the claim expires without a result (e.g. the other invocation failed), the image is analysed.
+# A quarter of the function timeout, so a waiting invocation outlives the claim and still has time
+# to analyse the image itself.
+CLAIM_TIMEOUT = FUNCTION_TIMEOUT / 4
+# seconds between two reads of the result of an image claimed by another invocation
+CLAIM_POLL_INTERVAL = 0.1
+
+
+class Detection(NamedTuple):
+    """Result of the analysis of a single image"""
+
+    car_count: int
+    emergency_vehicle_count: int
+
+
+class Detector(ABC):
+    """Counts vehicles in an image"""
+
+    @abstractmethod
+    def detect(self, image: bytes) -> Detection:
+        """Counts the cars and the emergency vehicles in an image
+
+        :param image: The content of the image file
+        :return: The counts of vehicles in the image
+        """
+
+
+class RekognitionDetector(Detector):
+    """Counts vehicles with a single DetectLabels request to Rekognition per image"""
+
+    def __init__(self, rekognition=None) -> None:
+        self.rekognition = rekognition or aws_clients.client("rekognition")
+
+    def detect(self, image: bytes) -> Detection:
+        try:
+            response = self.rekognition.detect_labels(
+                Image={"Bytes": image}, MinConfidence=MIN_CONFIDENCE
+            )
+        except Exception as e:
+            logging.error(f"Error while detecting labels: {e}")
+            raise e
+
+        # a label without bounding boxes still indicates at least one vehicle
+        counts = {
+            label["Name"]: max(len(label.get("Instances", [])), 1) for label in response["Labels"]
+        }
+
+        return Detection(
+            car_count=counts.get(CAR_LABEL, 0),
+            emergency_vehicle_count=sum(counts.get(label, 0) for label in EMERGENCY_VEHICLE_LABELS),
+        )
+
+
+class StubDetector(Detector):
+    """Derives deterministic counts from the image content without calling any service, to be
+    used for tests and benchmarks (set environment variable DETECTOR=stub)"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def detect(self, image: bytes) -> Detection:
+        self.calls += 1
+        checksum = zlib.crc32(image)
+        return Detection(car_count=checksum % 40, emergency_vehicle_count=int(checksum % 10 == 0))
+
+
+def create_detector() -> Detector:
+    """Creates the detector selected by the environment variable DETECTOR ("rekognition" or "stub")
+
+    :return: The detector
+    """
+
+    detectors = {"rekognition": RekognitionDetector, "stub": StubDetector}
+    return detectors[os.environ.get("DETECTOR", "rekognition")]()
+
+
+class DetectionCache:
+    """Provides the detection results of images, analysing each image at most once.
+
+    Results are cached in two layers: in memory (LRU, survives across warm invocations) and in the
+    central table as attributes (carCount, emergencyVehicleCount, detectionETag) of the image rows
+    (PK "camera#{ID}", SK "image#{timestamp}"). Only images that are found in neither layer are
+    fetched from S3 (once for both counts) and passed to the detector. Before an image is analysed,
+    it is claimed with a conditional write (attribute detectionClaimedUntil), so concurrent
+    invocations analysing the same image wait for the result instead (see CLAIM_TIMEOUT).
+    """
+
+    def __init__(
+        self,
+        dynamodb,
+        s3,
+        table_name: str,
+        bucket_name: str,
+        detector: Detector,
+        max_size: int = MAX_CACHED_DETECTIONS,
+    ) -> None:
+        self.dynamodb = dynamodb
+        self.s3 = s3
+        self.table_name = table_name
+        self.bucket_name = bucket_name
+        self.detector = detector
+        self.max_size = max_size
+        # S3 key -> (ETag, detection), ordered from least to most recently used
+        self._memory: OrderedDict[str, tuple[str, Detection]] = OrderedDict()
+        # held for every access of _memory, the cache is shared by the threads of analyze_cameras
+        self._lock = threading.Lock()
+
+    def _recall(self, image_key: str) -> Optional[tuple[str, Detection]]:
+        with self._lock:
+            cached = self._memory.get(image_key)
+            if cached is not None:
+                self._memory.move_to_end(image_key)
+            return cached
+
+    def _remember(self, image_key: str, etag: str, detection: Detection):
+        with self._lock:
+            self._memory[image_key] = (etag, detection)
+            self._memory.move_to_end(image_key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def _is_current(self, image_key: str, etag: str) -> bool:
+        if not VERIFY_ETAG:
+            return True
+        try:
+            response = self.s3.head_object(Bucket=self.bucket_name, Key=image_key)
+        except Exception as e:
+            logging.error(f"Error while reading image metadata: {e}")
+            raise e
+        return response["ETag"] == etag
+
+    def _get_from_table(self, camera_id: str, timestamps: list[int]) -> dict[int, tuple]:
+        """Reads the cached results of the given images of a camera from the table"""
+
+        items = dynamo_batch.batch_get_items(
+            self.dynamodb,
+            self.table_name,
+            [
+                {"PK": {"S": f"camera#{camera_id}"}, "SK": {"S": f"image#{timestamp}"}}
+                for timestamp in timestamps
+            ],
+            "SK, carCount, emergencyVehicleCount, detectionETag",
+        )
+
+        return {
+            int(item["SK"]["S"].replace("image#", "", 1)): (
+                item["detectionETag"]["S"],
+                Detection(int(item["carCount"]["N"]), int(item["emergencyVehicleCount"]["N"])),
+            )
+            for item in items
+            if "detectionETag" in item
+        }
+
+    def _claim(self, camera_id: str, timestamp: int) -> Optional[bool]:
+        """Claims an image for analysis, unless another invocation holds an unexpired claim. Images
+        whose row does not exist (anymore, e.g. deleted after expiring) cannot be claimed, the
+        condition keeps the claim from creating a row without image key and expiry time.
+
+        :return: True if the image has been claimed, False if another invocation holds the claim,
+        None if the image cannot be claimed
+        """
+
+        now = time.time()
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={"PK": {"S": f"camera#{camera_id}"}, "SK": {"S": f"image#{timestamp}"}},
+                UpdateExpression="SET detectionClaimedUntil = :until",
+                ConditionExpression=(
+                    "attribute_exists(PK) AND "
+                    "(attribute_not_exists(detectionClaimedUntil) OR detectionClaimedUntil < :now)"
+                ),
+                ExpressionAttributeValues={
+                    ":until": {"N": str(now + CLAIM_TIMEOUT)},
+                    ":now": {"N": str(now)},
+                },
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                logging.error(f"Error while claiming image: {e}")
+                raise e
+            # the current row is only returned if it exists
+            return False if "Item" in e.response else None
+        except Exception as e:
+            logging.error(f"Error while claiming image: {e}")
+            raise e
+        return True
+
+    def _store(self, camera_id: str, timestamp: int, etag: str, detection: Detection):
+        """Stores the result of an image in its row, unless the row does not exist (anymore)"""
+
+        # update instead of put, to keep all other attributes of the image row
+        try:
+            self.dynamodb.update_item(
+                TableName=self.table_name,
+                Key={"PK": {"S": f"camera#{camera_id}"}, "SK": {"S": f"image#{timestamp}"}},
+                UpdateExpression=(
+                    "SET carCount = :carCount, emergencyVehicleCount = :emergencyVehicleCount, "
+                    "detectionETag = :etag"
+                ),
+                ConditionExpression="attribute_exists(PK)",
+                ExpressionAttributeValues={
+                    ":carCount": {"N": str(detection.car_count)},
+                    ":emergencyVehicleCount": {"N": str(detection.emergency_vehicle_count)},
+                    ":etag": {"S": etag},
+                },
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                logging.error(f"Error while storing detection result in table: {e}")
+                raise e
+        except Exception as e:
+            logging.error(f"Error while storing detection result in table: {e}")
+            raise e
+
+    def _detect(self, camera_id: str, timestamp: int, image_key: str) -> tuple[str, Detection]:
+        """Fetches a single image, analyses it and stores the result in the table. If the image is
+        claimed by another invocation, its result is awaited instead. Images that cannot be claimed
+        are analysed, but their result is only kept in memory."""
+
+        claimed = self._claim(camera_id, timestamp)
+        while claimed is False:
+            cached = self._get_from_table(camera_id, [timestamp]).get(timestamp)
+            if cached is not None and self._is_current(image_key, cached[0]):
+                return cached
+            time.sleep(CLAIM_POLL_INTERVAL)
+            claimed = self._claim(camera_id, timestamp)
+
+        try:
+            response = self.s3.get_object(Bucket=self.bucket_name, Key=image_key)
+            image = response["Body"].read()
+        except Exception as e:
+            logging.error(f"Error while fetching image: {e}")
+            raise e
+
+        etag = response["ETag"]
+        with instrumentation.phase("Detect"):
+            detection = self.detector.detect(image)
+        instrumentation.add("ImagesAnalysed")
+
+        if claimed:
+            self._store(camera_id, timestamp, etag, detection)
+
+        return etag, detection
+
+    def get_detections(self, camera_id: str, image_uris: dict[int, str]) -> dict[int, Detection]:
+        """Returns the detection results for the given images of a camera
+
+        :param camera_id: The ID of the camera that took the images
+        :param image_uris: A dictionary with the times at which the images have been taken as keys
+        and the keys of the images within the bucket as values
+        :raises e: If something went wrong while reading or storing results or fetching images
+        :return: A dictionary with the times at which the images have been taken as keys and the
+        detection results as values
+        """
+
+        detections = {}
+
+        # 1st layer: memory
+        missing: dict[int, str] = {}
+        for timestamp, image_key in image_uris.items():
+            cached = self._recall(image_key)
+            if cached is not None and self._is_current(image_key, cached[0]):
+                detections[timestamp] = cached[1]
+            else:
+                missing[timestamp] = image_key
+
+        # 2nd layer: table
+        if missing:
+            for timestamp, (etag, detection) in self._get_from_table(
+                camera_id, list(missing)
+            ).items():
+                image_key = missing[timestamp]
+                if self._is_current(image_key, etag):
+                    self._remember(image_key, etag, detection)
+                    detections[timestamp] = detection
+                    del missing[timestamp]
+
+        # analyse remaining images concurrently (fetching images is I/O bound)
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(len(missing), MAX_WORKERS)) as executor:
+                results = executor.map(
+                    lambda item: self._detect(camera_id, *item), list(missing.items())
+                )
+                for (timestamp, image_key), (etag, detection) in zip(missing.items(), results):
+                    self._remember(image_key, etag, detection)
+                    detections[timestamp] = detection
+
+        return detections
@@ -0,0 +1,215 @@
+import math
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, NamedTuple, Optional
+
+from botocore.exceptions import ClientError
+
+import base_entities
+import dynamo_batch
+
+# constants
+# max. average number of sections per display state item. Each item holds the display state of
+# its sections (~50 bytes per section) and is read and written as a whole, so items stay small
+# (~25KB, far below the 400KB item limit) whatever the number of sections (see num_shards).
+MAX_SECTIONS_PER_SHARD = 500
+# prefix of the partition keys of the display state items (each item has a partition of its own:
+# "display#{num_shards}#{shard}", sort key: SORT_KEY)
+PARTITION_KEY = "display"
+# sort key of the display state items
+SORT_KEY = "state"
+# max. number of shard items updated concurrently
+MAX_WORKERS = 16
+# max. number of sections set by a single UpdateItem request (the condition expression has a
+# clause per section and expressions must not exceed 4KB)
+MAX_SECTIONS_PER_UPDATE = 40
+
+
+class Display(NamedTuple):
+    """What the signs of a section display"""
+
+    # the speed limit in km/h
+    speed_limit: int
+    # additional information, e.g. "Traffic jam" (empty if there is none)
+    info: str
+
+
+def num_shards(section_count: int) -> int:
+    """Determines the number of display state items for the given number of sections: the
+    smallest power of two that keeps MAX_SECTIONS_PER_SHARD sections per item on average. As a
+    power of two, it only changes if the number of sections doubles (or halves).
+
+    The shard count is part of the keys of the items, so after a change all sections are missing
+    from the display state and are written once more (the items of the previous count are not
+    read any more).
+
+    :param section_count: The number of all sections in the system
+    :return: The number of shards
+    """
+
+    return 2 ** math.ceil(math.log2(max(1, math.ceil(section_count / MAX_SECTIONS_PER_SHARD))))
+
+
+def shard_of(section_id: str, num_shards: int) -> int:
+    """Determines the display state item holding the display state of a section
+
+    :param section_id: The ID of the section
+    :param num_shards: The number of shards (see num_shards)
+    :return: The shard of the section
+    """
+
+    return base_entities.shard_of(f"section#{section_id}", num_shards)
+
+
+def key(num_shards: int, shard: int) -> dict:
+    """Creates the (serialized) primary key of a display state item
+
+    :param num_shards: The number of shards (see num_shards)
+    :param shard: The shard
+    :return: The primary key
+    """
+
+    return {"PK": {"S": f"{PARTITION_KEY}#{num_shards}#{shard}"}, "SK": {"S": SORT_KEY}}
+
+
+def get_display_state(
+    dynamodb,
+    table_name: str,
+    num_shards: int,
+    shards: Optional[Iterable[int]] = None,
+    consistent_read: bool = False,
+) -> dict[str, Display]:
+    """Retrieves the display state of all sections of the given shards, i.e. of the whole city
+    if no shards are given (BatchGetItem requests)
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param num_shards: The number of shards (see num_shards)
+    :param shards: The shards to retrieve, defaults to None (all shards)
+    :param consistent_read: True for strongly consistent reads, defaults to False
+    :raises e: If something went wrong while querying
+    :return: A dictionary with section IDs as keys and their display state as values. Sections that
+    have never been displayed are omitted.
+    """
+
+    shards = range(num_shards) if shards is None else shards
+    items = dynamo_batch.batch_get_items(
+        dynamodb, table_name, [key(num_shards, shard) for shard in shards], None, consistent_read
+    )
+
+    return {
+        section_id: Display(int(value["M"]["speedLimit"]["N"]), value["M"]["text"]["S"])
+        for item in items
+        for section_id, value in item.items()
+        if "M" in value
+    }
+
+
+def update_sections(
+    dynamodb,
+    table_name: str,
+    num_shards: int,
+    shard: int,
+    changes: list[tuple[str, Display]],
+    updated_for: int,
+):
+    """Sets the display state of sections of the same shard with a single UpdateItem request,
+    unless any of them has already been updated for a later time
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param num_shards: The number of shards (see num_shards)
+    :param shard: The shard of the sections
+    :param changes: The IDs of the sections and their new display state
+    :param updated_for: The POSIX timestamp of the time for which the display state has been
+    determined
+    :raises ClientError: If something went wrong while updating, e.g. if a section has been updated
+    for a later time (ConditionalCheckFailedException)
+    """
+
+    dynamodb.update_item(
+        TableName=table_name,
+        Key=key(num_shards, shard),
+        UpdateExpression="SET " + ", ".join(f"#s{i} = :s{i}" for i in range(len(changes))),
+        ConditionExpression=" AND ".join(
+            f"(attribute_not_exists(#s{i}) OR #s{i}.updatedFor <= :t)" for i in range(len(changes))
+        ),
+        ExpressionAttributeNames={
+            f"#s{i}": section_id for i, (section_id, _) in enumerate(changes)
+        },
+        ExpressionAttributeValues={
+            ":t": {"N": str(updated_for)},
+            **{
+                f":s{i}": {
+                    "M": {
+                        "speedLimit": {"N": str(display.speed_limit)},
+                        "text": {"S": display.info},
+                        "updatedFor": {"N": str(updated_for)},
+                    }
+                }
+                for i, (_, display) in enumerate(changes)
+            },
+        },
+    )
+
+
+def put_changes(
+    dynamodb, table_name: str, num_shards: int, changes: dict[str, Display], updated_for: int
+):
+    """Stores the display state of the given sections, with one UpdateItem request per shard (and
+    up to MAX_SECTIONS_PER_UPDATE sections). Only the given sections are set, so concurrent updates
+    of other sections of the same shard are not lost. Sections that have already been updated for
+    a later time (by an overlapping later run) are skipped: if a request fails because of one of
+    them, its sections are updated one by one.
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param num_shards: The number of shards (see num_shards)
+    :param changes: A dictionary with section IDs as keys and their new display state as values
+    :param updated_for: The POSIX timestamp of the time for which the display state has been
+    determined
+    :raises e: If something went wrong while updating
+    """
+
+    changes_by_shard: dict[int, list[tuple[str, Display]]] = {}
+    for section_id, display in changes.items():
+        changes_by_shard.setdefault(shard_of(section_id, num_shards), []).append(
+            (section_id, display)
+        )
+
+    def update_chunk(shard: int, request_changes: list[tuple[str, Display]]):
+        try:
+            update_sections(dynamodb, table_name, num_shards, shard, request_changes, updated_for)
+            return
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                logging.error(f"Error while updating display state: {e}")
+                raise e
+        except Exception as e:
+            logging.error(f"Error while updating display state: {e}")
+            raise e
+
+        # at least one section has been updated for a later time -> skip it, update all others
+        for section_id, display in request_changes:
+            try:
+                update_sections(
+                    dynamodb, table_name, num_shards, shard, [(section_id, display)], updated_for
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                    logging.error(f"Error while updating display state: {e}")
+                    raise e
+                logging.info(f"Display state of section {section_id} updated for a later time")
+            except Exception as e:
+                logging.error(f"Error while updating display state: {e}")
+                raise e
+
+    def update(shard: int):
+        # requests of the same item one after another, shards concurrently
+        shard_changes = changes_by_shard[shard]
+        for i in range(0, len(shard_changes), MAX_SECTIONS_PER_UPDATE):
+            update_chunk(shard, shard_changes[i : i + MAX_SECTIONS_PER_UPDATE])
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(update, changes_by_shard))
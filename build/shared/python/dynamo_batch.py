@@ -0,0 +1,148 @@
+import time
+import logging
+
+from typing import Iterable, Optional
+
+from botocore.exceptions import ClientError
+
+import instrumentation
+
+# constants
+# max. number of keys per BatchGetItem request (limit defined by DynamoDB)
+BATCH_GET_SIZE = 100
+# max. number of requests per BatchWriteItem request (limit defined by DynamoDB)
+BATCH_WRITE_SIZE = 25
+# max. number of retries for unprocessed keys/items of a batch request
+MAX_BATCH_RETRIES = 8
+# base delay in seconds for the exponential backoff between retries of a batch request
+BATCH_RETRY_BASE_DELAY = 0.05
+# error codes of requests rejected due to throttling, retried like unprocessed items
+THROTTLING_ERRORS = {
+    "ProvisionedThroughputExceededException",
+    "RequestLimitExceeded",
+    "ThrottlingException",
+}
+
+
+def chunks(values: list, size: int) -> Iterable[list]:
+    """Splits a list into consecutive chunks
+
+    :param values: The list to split
+    :param size: The max. size of each chunk
+    :return: The chunks of the list
+    """
+
+    return (values[i : i + size] for i in range(0, len(values), size))
+
+
+def backoff(retries: int, what: str):
+    """Sleeps before the next retry of a batch request (exponential backoff)
+
+    :param retries: The number of retries done so far
+    :param what: Description of the unprocessed entries for the error message
+    :raises RuntimeError: If MAX_BATCH_RETRIES retries have already been done
+    """
+
+    if retries >= MAX_BATCH_RETRIES:
+        raise RuntimeError(f"{what} still unprocessed after {retries} retries")
+    instrumentation.add("BatchRetries")
+    time.sleep(BATCH_RETRY_BASE_DELAY * 2**retries)
+
+
+def batch_get_items(
+    dynamodb,
+    table_name: str,
+    keys: list[dict],
+    projection_expression: Optional[str],
+    consistent_read: bool = False,
+) -> list[dict]:
+    """Retrieves the items with the given keys from a DynamoDB table using as few BatchGetItem
+    requests as possible. Keys are split into chunks of BATCH_GET_SIZE, keys that DynamoDB returns
+    as unprocessed are retried with exponential backoff.
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param keys: The (serialized) primary keys of the items to retrieve
+    :param projection_expression: The attributes to retrieve for each item, None for all
+    :param consistent_read: True if strongly consistent reads shall be used, defaults to False
+    :raises e: If something went wrong while querying
+    :raises RuntimeError: If keys are still unprocessed after MAX_BATCH_RETRIES retries
+    :return: The (serialized) items that have been found, in no particular order
+    """
+
+    items = []
+    for keys_chunk in chunks(keys, BATCH_GET_SIZE):
+        request_items = {table_name: {"Keys": keys_chunk, "ConsistentRead": consistent_read}}
+        if projection_expression is not None:
+            request_items[table_name]["ProjectionExpression"] = projection_expression
+        retries = 0
+        while request_items:
+            # query table
+            try:
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+            except Exception as e:
+                logging.error(f"Error while querying table: {e}")
+                raise e
+
+            items.extend(response["Responses"].get(table_name, []))
+
+            # retry unprocessed keys (if any) after backing off
+            request_items = response.get("UnprocessedKeys", {})
+            if request_items:
+                backoff(retries, "Keys")
+                retries += 1
+
+    return items
+
+
+def batch_write(dynamodb, table_name: str, write_requests: list[dict]):
+    """Executes the given write requests (PutRequest/DeleteRequest) on a DynamoDB table using as
+    few BatchWriteItem requests as possible. Requests are split into chunks of BATCH_WRITE_SIZE,
+    requests that DynamoDB returns as unprocessed or rejects due to throttling (once the retries of
+    the client are exhausted) are retried with exponential backoff.
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param write_requests: The write requests, e.g. {"PutRequest": {"Item": item}}
+    :raises e: If something went wrong while writing to the table
+    :raises RuntimeError: If requests are still unprocessed after MAX_BATCH_RETRIES retries
+    """
+
+    for write_requests_chunk in chunks(write_requests, BATCH_WRITE_SIZE):
+        request_items = {table_name: write_requests_chunk}
+        retries = 0
+        while request_items:
+            # write to DynamoDB
+            try:
+                response = dynamodb.batch_write_item(RequestItems=request_items)
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in THROTTLING_ERRORS:
+                    logging.error(f"Error while writing items to table: {e}")
+                    raise e
+                # retry whole request after backing off
+                backoff(retries, "Throttled items")
+                retries += 1
+                continue
+            except Exception as e:
+                logging.error(f"Error while writing items to table: {e}")
+                raise e
+
+            # retry unprocessed requests (if any) after backing off
+            request_items = response.get("UnprocessedItems", {})
+            if request_items:
+                backoff(retries, "Items")
+                retries += 1
+
+
+def batch_put_items(dynamodb, table_name: str, items: list[dict]):
+    """Puts the given items in a DynamoDB table using as few BatchWriteItem requests as possible
+    (see batch_write).
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param items: The (serialized) items to put in the table
+    :raises e: If something went wrong while storing data in the table
+    :raises RuntimeError: If items are still unprocessed after MAX_BATCH_RETRIES retries
+    """
+
+    batch_write(dynamodb, table_name, [{"PutRequest": {"Item": item}} for item in items])
@@ -0,0 +1,59 @@
+from typing import Any
+
+
+def deserialize_number(value: str):
+    """Converts a DynamoDB number into an int, or into a float if it has a fractional part or an
+    exponent. Unlike boto3's TypeDeserializer no Decimal is created, callers convert numbers to int
+    or float anyway.
+
+    :param value: The number as transmitted by DynamoDB, e.g. "0.75"
+    :return: The number
+    """
+
+    if "." in value or "e" in value or "E" in value:
+        return float(value)
+    return int(value)
+
+
+def deserialize(value: dict) -> Any:
+    """Converts a DynamoDB attribute value into a Python value, e.g. {"N": "5"} -> 5. Cheaper than
+    boto3's TypeDeserializer (no type lookup by reflection, no Decimal context), with the same
+    result types except for numbers (see deserialize_number).
+
+    :param value: The (serialized) attribute value, a dictionary with a single type key
+    :raises TypeError: If the type of the value is unknown
+    :return: The value
+    """
+
+    # membership tests instead of unpacking the single key, most frequent types first
+    if "S" in value:
+        return value["S"]
+    if "N" in value:
+        return deserialize_number(value["N"])
+    if "L" in value:
+        return [deserialize(element) for element in value["L"]]
+    if "M" in value:
+        return {key: deserialize(element) for key, element in value["M"].items()}
+    if "BOOL" in value:
+        return value["BOOL"]
+    if "SS" in value:
+        return set(value["SS"])
+    if "NS" in value:
+        return {deserialize_number(element) for element in value["NS"]}
+    if "NULL" in value:
+        return None
+    if "B" in value:
+        return value["B"]
+    if "BS" in value:
+        return set(value["BS"])
+    raise TypeError(f"Unknown DynamoDB type {next(iter(value), None)}")
+
+
+def deserialize_item(item: dict) -> dict:
+    """Converts a (serialized) DynamoDB item into a dictionary of Python values
+
+    :param item: The item as returned by the low-level client
+    :return: The attribute names as keys and the deserialized values as values
+    """
+
+    return {name: deserialize(value) for name, value in item.items()}
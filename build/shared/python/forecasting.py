@@ -0,0 +1,154 @@
+import math
+
+from abc import ABC, abstractmethod
+from typing import Mapping, Sequence, Union
+
+import numpy as np
+
+
+def flatten(series: Sequence[Mapping[int, float]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Converts ragged series (one dictionary of POSIX timestamps and values per series) to flat
+    arrays, which is the input format of all models.
+
+    :param series: The series, e.g. the car counts of multiple cameras
+    :return: A tuple containing three arrays of equal length:
+    - index of the series each point belongs to
+    - POSIX timestamps of the points
+    - values of the points
+    """
+
+    lengths = np.fromiter((len(s) for s in series), dtype=np.int64, count=len(series))
+    index = np.repeat(np.arange(len(series)), lengths)
+    times = np.fromiter((t for s in series for t in s.keys()), dtype=np.float64, count=index.size)
+    values = np.fromiter(
+        (v for s in series for v in s.values()), dtype=np.float64, count=index.size
+    )
+
+    return index, times, values
+
+
+class Model(ABC):
+    """Prediction model fitted to many series at once with vectorised operations"""
+
+    @abstractmethod
+    def predict(
+        self,
+        index: np.ndarray,
+        times: np.ndarray,
+        values: np.ndarray,
+        num_series: int,
+        predict_for: np.ndarray,
+    ) -> np.ndarray:
+        """Fits the model to each series and predicts the value of each series at a given time
+
+        :param index: The index of the series each point belongs to (see flatten)
+        :param times: The POSIX timestamps of the points
+        :param values: The values of the points
+        :param num_series: The total number of series (series may have no points)
+        :param predict_for: The POSIX timestamps to predict for, one per series
+        :return: The predictions, one per series (NaN for series without points)
+        """
+
+
+class LinearModel(Model):
+    """Least squares linear regression. A series with a single point (or with all points at the
+    same time) results in a constant prediction."""
+
+    def predict(self, index, times, values, num_series, predict_for):
+        # center times on the prediction time, so the prediction is the intercept of the fit and
+        # large POSIX timestamps do not cause a loss of precision
+        t = times - predict_for[index]
+        n = np.bincount(index, minlength=num_series).astype(np.float64)
+        sum_t = np.bincount(index, t, minlength=num_series)
+        sum_y = np.bincount(index, values, minlength=num_series)
+        sum_tt = np.bincount(index, t * t, minlength=num_series)
+        sum_ty = np.bincount(index, t * values, minlength=num_series)
+
+        return fit_linear(n, sum_t, sum_y, sum_tt, sum_ty)
+
+
+class ExponentialModel(Model):
+    """Exponentially weighted average, the weight of a point halves every half_life seconds
+    before the latest point of its series."""
+
+    def __init__(self, half_life: float = 1800.0) -> None:
+        self.half_life = half_life
+
+    def predict(self, index, times, values, num_series, predict_for):
+        latest = np.full(num_series, -np.inf)
+        np.maximum.at(latest, index, times)
+        weights = np.exp2(-(latest[index] - times) / self.half_life)
+        sum_w = np.bincount(index, weights, minlength=num_series)
+        sum_wy = np.bincount(index, weights * values, minlength=num_series)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sum_wy / sum_w
+
+
+class LastValueModel(Model):
+    """Predicts the latest value of each series"""
+
+    def predict(self, index, times, values, num_series, predict_for):
+        predictions = np.full(num_series, np.nan)
+        # sort by series, then by time, and reverse -> the first point of each series is its latest
+        # one, np.unique returns the position of the first occurrence of each series
+        order = np.lexsort((times, index))[::-1]
+        series, latest = np.unique(index[order], return_index=True)
+        predictions[series] = values[order[latest]]
+
+        return predictions
+
+
+# available models by name
+MODELS: dict[str, Model] = {
+    "linear": LinearModel(),
+    "exponential": ExponentialModel(),
+    "last": LastValueModel(),
+}
+
+
+def fit_linear(
+    n: np.ndarray, sum_t: np.ndarray, sum_y: np.ndarray, sum_tt: np.ndarray, sum_ty: np.ndarray
+) -> np.ndarray:
+    """Computes least squares linear regressions from the sufficient statistics of many series and
+    returns their intercepts, i.e. the predictions at t = 0.
+
+    :param n: The number of points of each series
+    :param sum_t: The sum of times of each series
+    :param sum_y: The sum of values of each series
+    :param sum_tt: The sum of squared times of each series
+    :param sum_ty: The sum of products of time and value of each series
+    :return: The intercepts (NaN for series without points)
+    """
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        denominator = n * sum_tt - sum_t * sum_t
+        # relative threshold, as the denominator suffers from cancellation if all times are equal
+        constant = np.abs(denominator) <= 1e-9 * np.maximum(n * sum_tt, 1.0)
+        slope = np.where(constant, 0.0, (n * sum_ty - sum_t * sum_y) / denominator)
+        return (sum_y - slope * sum_t) / n
+
+
+def forecast(
+    series: Sequence[Mapping[int, float]],
+    predict_for: Union[int, Sequence[int]],
+    model: Union[str, Model] = "linear",
+    default: float = math.nan,
+) -> np.ndarray:
+    """Predicts the value of many series at once
+
+    :param series: The series, one dictionary of POSIX timestamps and values per series
+    :param predict_for: The POSIX timestamp to predict for, either one for all or one per series
+    :param model: The model (or name of a model in MODELS) to use, defaults to "linear"
+    :param default: The prediction for series without points, defaults to NaN
+    :return: The predictions, one per series
+    """
+
+    if isinstance(model, str):
+        model = MODELS[model]
+
+    index, times, values = flatten(series)
+    predict_for = np.broadcast_to(np.asarray(predict_for, dtype=np.float64), (len(series),))
+    predictions = model.predict(index, times, values, len(series), predict_for)
+
+    return np.where(np.isnan(predictions), default, predictions)
@@ -0,0 +1,405 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextvars
+import functools
+
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+# constants
+# CloudWatch namespace of all metrics
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "TrafficWorkflow")
+# max. number of metrics per EMF document (limit defined by CloudWatch)
+MAX_METRICS = 100
+# environment variable holding the sampling interval in seconds, enables the sampling profiler
+# for all invocations if set (the event key "profile" enables it for a single invocation)
+PROFILE_ENV = "PROFILE_SAMPLE_INTERVAL"
+# default sampling interval of the profiler in seconds
+PROFILE_INTERVAL = 0.005
+# number of hottest code locations reported by the profiler
+PROFILE_TOP = 15
+# modules whose frames on top of a stack indicate an idle thread (e.g. waiting pool workers), such
+# stacks are not sampled
+IDLE_MODULES = {"threading.py", "queue.py"}
+# operations for which DynamoDB reports the consumed capacity, split into reads and writes
+READ_OPERATIONS = {"GetItem", "BatchGetItem", "Query", "Scan", "TransactGetItems"}
+WRITE_OPERATIONS = {
+    "PutItem",
+    "UpdateItem",
+    "DeleteItem",
+    "BatchWriteItem",
+    "TransactWriteItems",
+}
+
+# units of CloudWatch metrics
+COUNT = "Count"
+MILLISECONDS = "Milliseconds"
+BYTES = "Bytes"
+
+# receives each EMF document as a single line, e.g. replaced by tests or the local workflow
+sink: Callable[[str], None] = print
+
+
+class Recorder:
+    """Collects the metrics of a single invocation (thread-safe). Metrics added multiple times are
+    summed up."""
+
+    def __init__(self, function_name: str):
+        self._lock = threading.Lock()
+        self.function_name = function_name
+        self.values: Counter = Counter()
+        self.units: dict[str, str] = {}
+
+    def add(self, name: str, value: float, unit: str = COUNT):
+        with self._lock:
+            self.values[name] += value
+            self.units[name] = unit
+
+    def to_documents(self, properties: Optional[dict] = None) -> list[dict]:
+        """Creates the CloudWatch Embedded Metric Format documents of all metrics
+
+        :param properties: Additional (non-metric) properties to log, defaults to None
+        :return: The documents, each with at most MAX_METRICS metrics
+        """
+
+        with self._lock:
+            names = sorted(self.values)
+            values = dict(self.values)
+
+        documents = []
+        for i in range(0, max(len(names), 1), MAX_METRICS):
+            chunk = names[i : i + MAX_METRICS]
+            documents.append(
+                {
+                    "_aws": {
+                        "Timestamp": int(time.time() * 1000),
+                        "CloudWatchMetrics": [
+                            {
+                                "Namespace": NAMESPACE,
+                                "Dimensions": [["FunctionName"]],
+                                "Metrics": [
+                                    {"Name": name, "Unit": self.units[name]} for name in chunk
+                                ],
+                            }
+                        ],
+                    },
+                    "FunctionName": self.function_name,
+                    **(properties or {}),
+                    **{name: values[name] for name in chunk},
+                }
+            )
+
+        return documents
+
+
+# recorder of the current invocation. Threads started by a handler (e.g. thread pools) do not
+# inherit it and fall back to the latest active recorder, which is exact within Lambda (one
+# invocation per container at a time).
+_recorder: contextvars.ContextVar[Optional[Recorder]] = contextvars.ContextVar(
+    "recorder", default=None
+)
+_active_recorder: Optional[Recorder] = None
+
+
+def current() -> Optional[Recorder]:
+    """Returns the recorder of the current invocation, None outside of instrumented handlers"""
+
+    return _recorder.get() or _active_recorder
+
+
+def add(name: str, value: float = 1, unit: str = COUNT):
+    """Adds a value to a metric of the current invocation (ignored outside of instrumented
+    handlers)
+
+    :param name: The name of the metric, e.g. "BatchRetries"
+    :param value: The value to add, defaults to 1
+    :param unit: The CloudWatch unit of the metric, defaults to COUNT
+    """
+
+    recorder = current()
+    if recorder is not None:
+        recorder.add(name, value, unit)
+
+
+@contextmanager
+def phase(name: str):
+    """Measures the time spent in a phase of an invocation (metric "{name}Time"). Can be used as
+    context manager or as decorator, phases entered multiple times are summed up.
+
+    :param name: The name of the phase, e.g. "Predict"
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(f"{name}Time", (time.perf_counter() - start) * 1000, MILLISECONDS)
+
+
+def get_process_age() -> Optional[float]:
+    """Determines the seconds since the start of the current process (Linux only)
+
+    :return: The age of the process, None if it cannot be determined
+    """
+
+    try:
+        with open("/proc/self/stat") as stat_file, open("/proc/uptime") as uptime_file:
+            stat = stat_file.read()
+            uptime = float(uptime_file.read().split()[0])
+    except OSError:
+        return None
+
+    # field 22 (start time in clock ticks since boot), counted after the command name
+    start_ticks = int(stat.rsplit(")", 1)[1].split()[19])
+
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+def get_payload_size(payload) -> int:
+    """Determines the size of an event or result as passed between workflow states (JSON)
+
+    :param payload: The event or result
+    :return: The size in bytes
+    """
+
+    return len(json.dumps(payload, default=str))
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads at a fixed interval and counts the code locations
+    found on top of the stacks (self) and anywhere within the stacks (total)"""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if (
+                    thread_id == self._thread.ident
+                    or os.path.basename(frame.f_code.co_filename) in IDLE_MODULES
+                ):
+                    continue
+                self.samples += 1
+                self.self_counts[self._location(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    location = self._location(frame, line=False)
+                    if location not in seen:
+                        seen.add(location)
+                        self.total_counts[location] += 1
+                    frame = frame.f_back
+
+    @staticmethod
+    def _location(frame, line: bool = True) -> str:
+        code = frame.f_code
+        location = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+        return f"{location}:{frame.f_lineno}" if line else location
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def report(self, top: int = PROFILE_TOP) -> dict:
+        """Summarises the samples
+
+        :param top: The number of hottest code locations to report, defaults to PROFILE_TOP
+        :return: The number of samples and the hottest locations with their sample counts
+        """
+
+        return {
+            "samples": self.samples,
+            "interval": self.interval,
+            "self": self.self_counts.most_common(top),
+            "total": self.total_counts.most_common(top),
+        }
+
+
+def get_profile_interval(event) -> Optional[float]:
+    """Determines if (and how often) the stacks of an invocation shall be sampled: if the event key
+    "profile" is set (the state machine forwards it from the execution input to all of its tasks,
+    so a whole run is profiled) or the environment variable of the function is set.
+
+    :param event: The event of the invocation
+    :return: The sampling interval in seconds, None if profiling is switched off
+    """
+
+    if isinstance(event, dict) and event.get("profile"):
+        return float(os.environ.get(PROFILE_ENV) or PROFILE_INTERVAL)
+    if os.environ.get(PROFILE_ENV):
+        return float(os.environ[PROFILE_ENV])
+    return None
+
+
+def instrumented(handler: Callable) -> Callable:
+    """Decorates the handler of a Lambda function: records the duration, the sizes of event and
+    result and whether the invocation is a cold start (together with the time spent before the
+    first invocation, i.e. starting the runtime and importing the function), and emits all metrics
+    of the invocation (see add, phase and instrument) as EMF log line when it ends.
+
+    :param handler: The handler function
+    :return: The instrumented handler function
+    """
+
+    function_name = handler.__module__
+    import_time = get_process_age()
+    state = {"cold": True}
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _active_recorder
+
+        recorder = Recorder(function_name)
+        token = _recorder.set(recorder)
+        _active_recorder = recorder
+        cold, state["cold"] = state["cold"], False
+        if cold and import_time is not None:
+            recorder.add("ImportTime", import_time * 1000, MILLISECONDS)
+        recorder.add("ColdStart", int(cold))
+        recorder.add("EventSize", get_payload_size(event), BYTES)
+
+        interval = get_profile_interval(event)
+        profiler = SamplingProfiler(interval) if interval else None
+        if profiler is not None:
+            profiler.start()
+
+        start = time.perf_counter()
+        try:
+            result = handler(event, context)
+            recorder.add("ResultSize", get_payload_size(result), BYTES)
+            return result
+        except Exception:
+            recorder.add("Errors", 1)
+            raise
+        finally:
+            recorder.add("Duration", (time.perf_counter() - start) * 1000, MILLISECONDS)
+            properties = {}
+            if context is not None and hasattr(context, "aws_request_id"):
+                properties["RequestId"] = context.aws_request_id
+            if profiler is not None:
+                profiler.stop()
+                properties["Profile"] = profiler.report()
+            for document in recorder.to_documents(properties):
+                sink(json.dumps(document))
+            _recorder.reset(token)
+            if _active_recorder is recorder:
+                _active_recorder = None
+
+    return wrapper
+
+
+def before_call(model, context: dict, **kwargs):
+    if current() is not None:
+        context["instrumentationStart"] = time.perf_counter()
+
+
+def provide_client_params(params: dict, model, **kwargs):
+    recorder = current()
+    if recorder is None:
+        return
+
+    # request consumed capacity of DynamoDB operations (not overriding explicit settings)
+    if model.name in READ_OPERATIONS or model.name in WRITE_OPERATIONS:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+    # count written items and continued queries (pagination depth)
+    if model.name in ("PutItem", "UpdateItem", "DeleteItem"):
+        recorder.add("DynamoDBItemsWritten", 1)
+    elif model.name == "BatchWriteItem":
+        recorder.add(
+            "DynamoDBItemsWritten",
+            sum(len(requests) for requests in params.get("RequestItems", {}).values()),
+        )
+    elif model.name in ("Query", "Scan") and "ExclusiveStartKey" in params:
+        recorder.add("DynamoDBContinuedPages", 1)
+
+
+def after_call(http_response, parsed: dict, model, context: dict, **kwargs):
+    recorder = current()
+    if recorder is None:
+        return
+
+    prefix = model.service_model.service_id.replace(" ", "")
+    recorder.add(f"{prefix}{model.name}Calls", 1)
+    if "instrumentationStart" in context:
+        latency = (time.perf_counter() - context["instrumentationStart"]) * 1000
+        recorder.add(f"{prefix}{model.name}Time", latency, MILLISECONDS)
+    recorder.add(f"{prefix}Retries", parsed.get("ResponseMetadata", {}).get("RetryAttempts", 0))
+    if http_response is not None:
+        recorder.add(
+            f"{prefix}ResponseSize", int(http_response.headers.get("content-length", 0)), BYTES
+        )
+
+    # DynamoDB: consumed capacity (single dict or one per table) and items read
+    consumed = parsed.get("ConsumedCapacity")
+    if consumed is not None:
+        consumed = consumed if isinstance(consumed, list) else [consumed]
+        capacity = sum(c.get("CapacityUnits", 0) for c in consumed)
+        kind = "Read" if model.name in READ_OPERATIONS else "Write"
+        recorder.add(f"DynamoDBConsumed{kind}Capacity", capacity)
+    if "Items" in parsed:
+        recorder.add("DynamoDBItemsRead", len(parsed["Items"]))
+    elif "Responses" in parsed and isinstance(parsed["Responses"], dict):
+        recorder.add("DynamoDBItemsRead", sum(len(items) for items in parsed["Responses"].values()))
+    elif "Item" in parsed:
+        recorder.add("DynamoDBItemsRead", 1)
+
+
+def instrument(client):
+    """Records the requests of a low-level client within instrumented handlers: calls and latency
+    per operation, retries, request and response sizes, and for DynamoDB items read/written,
+    continued query pages and consumed capacity (ReturnConsumedCapacity is requested for all
+    operations). Requests made outside of instrumented handlers are not changed.
+
+    :param client: The low-level client, e.g. boto3.client("dynamodb")
+    :return: The same client
+    """
+
+    prefix = client.meta.service_model.service_id.replace(" ", "")
+
+    def before_send(request, **kwargs):
+        recorder = current()
+        if recorder is not None:
+            request_size = int(request.headers.get("Content-Length", 0))
+            recorder.add(f"{prefix}RequestSize", request_size, BYTES)
+
+    events = client.meta.events
+    events.register("provide-client-params", provide_client_params)
+    events.register("before-call", before_call)
+    events.register("after-call", after_call)
+    events.register("before-send", before_send)
+
+    return client
+
+
+def parse(lines: Iterable[str]) -> list[dict]:
+    """Extracts the metrics from EMF log lines, e.g. to aggregate them locally. Other lines are
+    skipped.
+
+    :param lines: The log lines
+    :return: For each EMF document a dictionary with the function name, the properties and the
+    metric values
+    """
+
+    documents = []
+    for line in lines:
+        try:
+            document = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(document, dict) and "_aws" in document:
+            documents.append({k: v for k, v in document.items() if k != "_aws"})
+
+    return documents
@@ -0,0 +1,197 @@
+import time
+import logging
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+# constants
+# max. number of entries kept in the cache, least recently used entries are evicted first
+MAX_SIZE = 4096
+# max. time in seconds an entry is served from the cache before it has to be reloaded
+TTL = 900.0
+# min. time in seconds between two reads of the topology version item
+VERSION_CHECK_INTERVAL = 60.0
+# key of the item holding the topology version, to be incremented on each change of base entities
+TOPOLOGY_VERSION_KEY = {"PK": {"S": "baseEntity"}, "SK": {"S": "topologyVersion"}}
+
+
+class MetadataCache:
+    """In-process LRU cache with TTL for static data from the baseEntity partition (topology).
+
+    An instance created at module scope survives across warm invocations of a Lambda function.
+    All entries are dropped as soon as the topology version item in the table changes, which is
+    checked with a single GetItem request at most every version_check_interval seconds.
+
+    Cached values are shared between callers and must not be modified.
+    """
+
+    def __init__(
+        self,
+        max_size: int = MAX_SIZE,
+        ttl: float = TTL,
+        version_check_interval: float = VERSION_CHECK_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._clock = clock
+        # key -> (time of insertion, value), ordered from least to most recently used
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._version: Optional[int] = None
+        self._last_version_check: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._lookup(key) is not None
+
+    def _lookup(self, key: Hashable) -> Optional[tuple[float, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._clock() - entry[0] >= self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the cached value for the given key
+
+        :param key: The key of the value
+        :param default: The value to return if the key is not cached (or expired), defaults to None
+        :return: The cached value or the default value
+        """
+
+        entry = self._lookup(key)
+        return entry[1] if entry is not None else default
+
+    def put(self, key: Hashable, value: Any):
+        """Adds a value to the cache, evicting the least recently used entries if necessary
+
+        :param key: The key of the value
+        :param value: The value to cache
+        """
+
+        self._entries[key] = (self._clock(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Returns the cached value for the given key, loads and caches it if not cached
+
+        :param key: The key of the value
+        :param loader: Function returning the value, called if the key is not cached
+        :return: The (cached or loaded) value
+        """
+
+        entry = self._lookup(key)
+        if entry is not None:
+            return entry[1]
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def get_many_or_load(
+        self, keys: Iterable[Hashable], loader: Callable[[list[Hashable]], dict[Hashable, Any]]
+    ) -> dict[Hashable, Any]:
+        """Returns the cached values for the given keys, loads all missing values at once
+
+        :param keys: The keys of the values
+        :param loader: Function taking a list of missing keys and returning a dictionary with the
+        loaded values (keys that cannot be loaded may be omitted and are not cached)
+        :return: A dictionary with the (cached or loaded) values of all keys that could be found
+        """
+
+        values = {}
+        missing_keys = []
+        for key in keys:
+            entry = self._lookup(key)
+            if entry is not None:
+                values[key] = entry[1]
+            else:
+                missing_keys.append(key)
+
+        if missing_keys:
+            loaded_values = loader(missing_keys)
+            for key, value in loaded_values.items():
+                self.put(key, value)
+            values.update(loaded_values)
+
+        return values
+
+    def clear(self):
+        """Removes all entries from the cache"""
+
+        self._entries.clear()
+
+    def check_version(self, dynamodb, table_name: str, force: bool = False) -> bool:
+        """Reads the topology version item from the table and clears the cache if the version
+        changed since the last check. The item is read at most every version_check_interval seconds.
+
+        :param dynamodb: The low-level DynamoDB client (for a Table resource use table.meta.client)
+        :param table_name: The name of the table holding the topology version item
+        :param force: Read the version item even if the last check is recent, defaults to False
+        :raises e: If something went wrong while querying
+        :return: True if the cache has been cleared, False otherwise
+        """
+
+        now = self._clock()
+        if (
+            not force
+            and self._last_version_check is not None
+            and now - self._last_version_check < self.version_check_interval
+        ):
+            return False
+
+        # query table
+        try:
+            response = dynamodb.get_item(
+                TableName=table_name, Key=TOPOLOGY_VERSION_KEY, ProjectionExpression="versionNumber"
+            )
+        except Exception as e:
+            logging.error(f"Error while querying table: {e}")
+            raise e
+
+        # missing version item: topology has never been changed since initial load
+        version = int(response["Item"]["versionNumber"]["N"]) if "Item" in response else 0
+        self._last_version_check = now
+
+        invalidated = self._version is not None and version != self._version
+        if invalidated:
+            self.clear()
+        self._version = version
+
+        return invalidated
+
+
+def bump_topology_version(dynamodb, table_name: str) -> int:
+    """Increments the topology version, which invalidates all metadata caches on their next
+    version check. Has to be called after base entities have been created, changed or deleted.
+
+    :param dynamodb: The low-level DynamoDB client (for a Table resource use table.meta.client)
+    :param table_name: The name of the table holding the topology version item
+    :raises e: If something went wrong while updating the version item
+    :return: The new topology version
+    """
+
+    try:
+        response = dynamodb.update_item(
+            TableName=table_name,
+            Key=TOPOLOGY_VERSION_KEY,
+            UpdateExpression="ADD versionNumber :one",
+            ExpressionAttributeValues={":one": {"N": "1"}},
+            ReturnValues="UPDATED_NEW",
+        )
+    except Exception as e:
+        logging.error(f"Error while updating topology version: {e}")
+        raise e
+
+    return int(response["Attributes"]["versionNumber"]["N"])
+
+
+# cache shared by all users within the same (warm) Lambda container
+cache = MetadataCache()
@@ -0,0 +1,176 @@
+from typing import Mapping, Optional, Sequence
+
+import numpy as np
+
+import forecasting
+import retention
+
+# constants
+# width in seconds of the time buckets sufficient statistics are aggregated in. Points leave the
+# sliding window bucket by bucket, so the window start is exact to one bucket.
+BUCKET_SIZE = 600
+# sort key of the row holding the regression state of a camera or station
+SORT_KEY = "model"
+
+
+class RegressionState:
+    """Running sufficient statistics (n, sum t, sum y, sum t², sum ty) of a series for linear
+    regression, so a prediction only requires the points added since the last update (watermark)
+    instead of all points of the window.
+
+    Statistics are kept per time bucket, with times relative to the start of their bucket (to not
+    lose precision with POSIX timestamps). Buckets that fall out of the window are evicted.
+    """
+
+    def __init__(
+        self,
+        watermark: Optional[int] = None,
+        buckets: Optional[dict[int, list[float]]] = None,
+        bucket_size: int = BUCKET_SIZE,
+    ) -> None:
+        # time of the latest point added, None if no point has been added yet
+        self.watermark = watermark
+        # bucket start -> [n, sum t, sum y, sum t², sum ty]
+        self.buckets = buckets if buckets is not None else {}
+        self.bucket_size = bucket_size
+
+    def add(self, points: Mapping[int, float]):
+        """Adds points to the statistics. Points must be newer than the watermark.
+
+        :param points: A dictionary with POSIX timestamps as keys and values as values
+        """
+
+        for timestamp, y in points.items():
+            start = timestamp - timestamp % self.bucket_size
+            t = timestamp - start
+            stats = self.buckets.setdefault(start, [0.0, 0.0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += t
+            stats[2] += y
+            stats[3] += t * t
+            stats[4] += t * y
+            if self.watermark is None or timestamp > self.watermark:
+                self.watermark = timestamp
+
+    def add_aggregates(self, aggregates: Mapping[int, retention.Aggregate], size: int):
+        """Adds summaries of the points of time spans (see retention.Aggregate). Their statistics
+        are exact, but all points of a time span are kept in the bucket at its middle, i.e. they
+        leave the window together when half of the time span has left it (raw points leave it
+        bucket by bucket). Advances the watermark to the end of the latest time span, as its
+        points must not be added again.
+
+        :param aggregates: A dictionary with the POSIX timestamps of the starts of the time spans
+        as keys and aggregates (with times relative to these starts) as values
+        :param size: The width of the time spans in seconds
+        """
+
+        for start, aggregate in aggregates.items():
+            middle = start + size // 2
+            bucket_start = middle - middle % self.bucket_size
+            # times relative to the start of the bucket instead of the time span
+            aggregate = aggregate.shift(start - bucket_start)
+            stats = self.buckets.setdefault(bucket_start, [0.0, 0.0, 0.0, 0.0, 0.0])
+            stats[0] += aggregate.count
+            stats[1] += aggregate.sum_t
+            stats[2] += aggregate.sum
+            stats[3] += aggregate.sum_tt
+            stats[4] += aggregate.sum_ty
+            end = start + size - 1
+            if self.watermark is None or end > self.watermark:
+                self.watermark = end
+
+    def evict(self, earliest_time: int):
+        """Removes all buckets that end before the given time
+
+        :param earliest_time: The start of the window (POSIX timestamp)
+        """
+
+        for start in [s for s in self.buckets if s + self.bucket_size <= earliest_time]:
+            del self.buckets[start]
+
+    def is_stale(self, earliest_time: int) -> bool:
+        """Checks if the state has to be rebuilt from all points of the window, i.e. if it has never
+        been updated or not since the start of the window or with a different bucket size.
+
+        :param earliest_time: The start of the window (POSIX timestamp)
+        :return: True if the state has to be rebuilt, False otherwise
+        """
+
+        return (
+            self.watermark is None
+            or self.watermark < earliest_time
+            or self.bucket_size != BUCKET_SIZE
+        )
+
+    def sums(self, predict_for: int) -> np.ndarray:
+        """Combines the statistics of all buckets, with times relative to the prediction time
+
+        :param predict_for: The POSIX timestamp of the time for which the prediction shall be made
+        :return: An array [n, sum t, sum y, sum t², sum ty]
+        """
+
+        sums = np.zeros(5)
+        for start, (n, sum_t, sum_y, sum_tt, sum_ty) in self.buckets.items():
+            # shift times by the offset of the bucket: t' = t + o
+            o = float(start - predict_for)
+            sums += (
+                n,
+                sum_t + n * o,
+                sum_y,
+                sum_tt + 2 * o * sum_t + n * o * o,
+                sum_ty + o * sum_y,
+            )
+
+        return sums
+
+    def to_item(self, partition_key: str, attributes: Optional[dict] = None) -> dict:
+        """Creates the (serialized) DynamoDB item holding the state
+
+        :param partition_key: The partition key of the camera or station, e.g. "station#{ID}"
+        :param attributes: Additional (serialized) attributes to store, defaults to None
+        :return: The item to store in the DynamoDB table
+        """
+
+        return {
+            "PK": {"S": partition_key},
+            "SK": {"S": SORT_KEY},
+            "watermark": {"N": str(self.watermark if self.watermark is not None else 0)},
+            "bucketSize": {"N": str(self.bucket_size)},
+            "buckets": {
+                "M": {
+                    str(start): {"L": [{"N": repr(float(v))} for v in stats]}
+                    for start, stats in self.buckets.items()
+                }
+            },
+            **(attributes or {}),
+        }
+
+    @classmethod
+    def from_item(cls, item: dict) -> "RegressionState":
+        """Restores the state from a (serialized) DynamoDB item created by to_item
+
+        :param item: The item
+        :return: The state
+        """
+
+        return cls(
+            watermark=int(item["watermark"]["N"]),
+            buckets={
+                int(start): [float(v["N"]) for v in stats["L"]]
+                for start, stats in item["buckets"]["M"].items()
+            },
+            bucket_size=int(item["bucketSize"]["N"]),
+        )
+
+
+def predict(states: Sequence[RegressionState], predict_for: int) -> np.ndarray:
+    """Predicts the value of many series at once from their states (see forecasting.fit_linear)
+
+    :param states: The regression states, one per series
+    :param predict_for: The POSIX timestamp of the time for which the predictions shall be made
+    :return: The predictions, one per series (NaN for series without points)
+    """
+
+    sums = np.array([state.sums(predict_for) for state in states]).reshape(-1, 5)
+
+    return forecasting.fit_linear(*sums.T)
@@ -0,0 +1,213 @@
+import logging
+
+from typing import NamedTuple, Optional
+
+# constants
+# name of the attribute DynamoDB deletes expired items by (TTL attribute of the central table)
+TTL_ATTRIBUTE = "expiresAt"
+# seconds rows are kept after the time they refer to, by sort key prefix
+RETENTION = {
+    # raw data, older parts are kept as aggregates (see compact_time_series)
+    "image": 7 * 86400,
+    "measurement": 7 * 86400,
+    # results, only the latest ones are read (see change_tracking.MAX_RESULT_AGE)
+    "trafficCount": 2 * 86400,
+    "prediction": 2 * 86400,
+    "info": 2 * 86400,
+    # aggregates
+    "hourly": 31 * 86400,
+    "daily": 400 * 86400,
+}
+# width in seconds of the time span summarised by an aggregate row, by sort key prefix
+RESOLUTIONS = {"hourly": 3600, "daily": 86400}
+# sort key of the row holding the compaction progress of a camera or station
+SORT_KEY = "rollup"
+
+
+class Aggregate(NamedTuple):
+    """Summary of the points of a series within a time span. Besides count, sum, min and max, the
+    sufficient statistics for linear regression are kept (times relative to the start of the
+    span), so regressions over aggregates are exact (see RegressionState.add_aggregates)."""
+
+    count: int
+    sum: float
+    min: float
+    max: float
+    # sum of times, of squared times and of products of time and value
+    sum_t: float = 0.0
+    sum_tt: float = 0.0
+    sum_ty: float = 0.0
+
+    def merge(self, other: "Aggregate") -> "Aggregate":
+        """Combines two aggregates whose times are relative to the same start (see shift)"""
+
+        return Aggregate(
+            self.count + other.count,
+            self.sum + other.sum,
+            min(self.min, other.min),
+            max(self.max, other.max),
+            self.sum_t + other.sum_t,
+            self.sum_tt + other.sum_tt,
+            self.sum_ty + other.sum_ty,
+        )
+
+    def shift(self, offset: int) -> "Aggregate":
+        """Makes the times relative to a start the given number of seconds before the current one,
+        e.g. to merge hourly aggregates into a daily one (t' = t + offset)"""
+
+        return self._replace(
+            sum_t=self.sum_t + self.count * offset,
+            sum_tt=self.sum_tt + 2 * offset * self.sum_t + self.count * offset * offset,
+            sum_ty=self.sum_ty + offset * self.sum,
+        )
+
+    @classmethod
+    def of(cls, points: dict[int, float], start: int) -> "Aggregate":
+        """Summarises points, with times relative to the given start of their time span"""
+
+        values = list(points.values())
+        times = [timestamp - start for timestamp in points]
+        return cls(
+            len(values),
+            sum(values),
+            min(values),
+            max(values),
+            float(sum(times)),
+            float(sum(t * t for t in times)),
+            sum(t * y for t, y in zip(times, values)),
+        )
+
+
+def expires_at(row_type: str, timestamp: int) -> dict:
+    """Creates the (serialized) TTL attribute of a row
+
+    :param row_type: The sort key prefix of the row, e.g. "measurement" (see RETENTION)
+    :param timestamp: The POSIX timestamp the row refers to, e.g. the time of the measurement
+    :return: The attribute to add to the item
+    """
+
+    return {TTL_ATTRIBUTE: {"N": str(timestamp + RETENTION[row_type])}}
+
+
+def create_aggregate_item(
+    partition_key: str, resolution: str, start: int, aggregate: Aggregate
+) -> dict:
+    """Creates the (serialized) DynamoDB item of an aggregate row
+
+    :param partition_key: The partition key of the camera or station, e.g. "station#{ID}"
+    :param resolution: The resolution of the aggregate, "hourly" or "daily"
+    :param start: The POSIX timestamp of the start of the summarised time span
+    :param aggregate: The aggregate
+    :return: The item to store in the DynamoDB table
+    """
+
+    return {
+        "PK": {"S": partition_key},
+        "SK": {"S": f"{resolution}#{start}"},
+        "count": {"N": str(aggregate.count)},
+        "sum": {"N": repr(float(aggregate.sum))},
+        "min": {"N": repr(float(aggregate.min))},
+        "max": {"N": repr(float(aggregate.max))},
+        "sumT": {"N": repr(float(aggregate.sum_t))},
+        "sumTT": {"N": repr(float(aggregate.sum_tt))},
+        "sumTY": {"N": repr(float(aggregate.sum_ty))},
+        **expires_at(resolution, start),
+    }
+
+
+def get_aggregates(
+    dynamodb,
+    table_name: str,
+    partition_key: str,
+    resolution: str,
+    earliest_time: int,
+    latest_time: int,
+) -> dict[int, Aggregate]:
+    """Queries the aggregate rows of a camera or station whose time span lies within a time range
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param partition_key: The partition key of the camera or station, e.g. "station#{ID}"
+    :param resolution: The resolution of the aggregates, "hourly" or "daily"
+    :param earliest_time: The start of the time range (POSIX timestamp)
+    :param latest_time: The end of the time range (POSIX timestamp, exclusive)
+    :raises e: If something went wrong while querying
+    :return: A dictionary with the starts of the time spans as keys and aggregates as values
+    """
+
+    size = RESOLUTIONS[resolution]
+    # first span starting within the range, last span ending within the range
+    first_start = -(-earliest_time // size) * size
+    last_start = latest_time - size
+    if last_start < first_start:
+        return {}
+
+    aggregates = {}
+    last_evaluated_key: Optional[dict] = None
+    while True:
+        # query table
+        optional_params = {"ExclusiveStartKey": last_evaluated_key} if last_evaluated_key else {}
+        try:
+            response = dynamodb.query(
+                TableName=table_name,
+                KeyConditionExpression="PK = :pk AND SK BETWEEN :earliest AND :latest",
+                ExpressionAttributeValues={
+                    ":pk": {"S": partition_key},
+                    ":earliest": {"S": f"{resolution}#{first_start}"},
+                    ":latest": {"S": f"{resolution}#{last_start}"},
+                },
+                ProjectionExpression="SK, #count, #sum, #min, #max, sumT, sumTT, sumTY",
+                ExpressionAttributeNames={
+                    "#count": "count",
+                    "#sum": "sum",
+                    "#min": "min",
+                    "#max": "max",
+                },
+                **optional_params,
+            )
+        except Exception as e:
+            logging.error(f"Error while querying DynamoDB: {e}")
+            raise e
+
+        for item in response["Items"]:
+            start = int(item["SK"]["S"].replace(f"{resolution}#", "", 1))
+            aggregates[start] = Aggregate(
+                int(item["count"]["N"]),
+                float(item["sum"]["N"]),
+                float(item["min"]["N"]),
+                float(item["max"]["N"]),
+                float(item["sumT"]["N"]),
+                float(item["sumTT"]["N"]),
+                float(item["sumTY"]["N"]),
+            )
+
+        # check if there are more results
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if last_evaluated_key is None:
+            return aggregates
+
+
+def get_uncovered_ranges(
+    aggregates: dict[int, Aggregate], resolution: str, earliest_time: int
+) -> list[tuple[int, Optional[int]]]:
+    """Determines the time ranges of a window not covered by its aggregates, i.e. for which raw
+    rows have to be read. Aggregates are created in order (see compact_time_series), so only the
+    start of the window before the first aggregate and the time after the last one are uncovered
+    (time spans between aggregates do not contain any points).
+
+    :param aggregates: The aggregates within the window (see get_aggregates)
+    :param resolution: The resolution of the aggregates, "hourly" or "daily"
+    :param earliest_time: The start of the window (POSIX timestamp)
+    :return: The uncovered time ranges as tuples of their first and last time (POSIX timestamps),
+    the last time of the latest range is None (open-ended)
+    """
+
+    if not aggregates:
+        return [(earliest_time, None)]
+
+    ranges: list[tuple[int, Optional[int]]] = []
+    if min(aggregates) > earliest_time:
+        ranges.append((earliest_time, min(aggregates) - 1))
+    ranges.append((max(aggregates) + RESOLUTIONS[resolution], None))
+
+    return ranges
@@ -0,0 +1,104 @@
+import logging
+
+from typing import Optional
+
+import retention
+
+# constants
+MAX_IMAGE_AGE = 7200  # 2h
+
+
+def get_image_uris(
+    dynamodb,
+    table_name: str,
+    camera_id: str,
+    earliest_time: int,
+    latest_time: Optional[int] = None,
+) -> dict[int, str]:
+    """Queries the table and retrieves all image URIS for a specific camera as well as the
+    times at which they have been taken.
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param camera_id: The ID of the camera for which images shall be returned
+    :param earliest_time: Consider no images older than the given time (use POSIX timestamp)
+    :param latest_time: Consider no images newer than the given time (use POSIX timestamp),
+    defaults to None (no limit)
+    :raises e: If something went wrong while querying
+    :return: A dictionary with the times at which the images have been taken as keys and the
+    image URIs as values.
+    """
+
+    # query table
+    try:
+        response = dynamodb.query(
+            TableName=table_name,
+            # upper bound, as other rows of the camera (e.g. "trafficCount#...") sort after images
+            KeyConditionExpression="PK = :pk AND SK BETWEEN :earliest AND :latest",
+            ExpressionAttributeValues={
+                ":pk": {"S": f"camera#{camera_id}"},
+                ":earliest": {"S": f"image#{earliest_time}"},
+                ":latest": {"S": f"image#{latest_time if latest_time is not None else '~'}"},
+            },
+            ProjectionExpression="SK, URI",
+            ScanIndexForward=False,  # to guarantee that newer images are retrieved, in unexpected case pagination takes place
+        )
+    except Exception as e:
+        logging.error(f"Error while querying DynamoDB: {e}")
+        raise e
+
+    # get image timestamps and URIs
+    items = response["Items"]
+    image_uris = {int(item["SK"]["S"].replace("image#", "", 1)): item["URI"]["S"] for item in items}
+
+    return image_uris
+
+
+def predict_car_counts(car_counts: list[dict[int, int]], predict_for: int) -> list[int]:
+    """Predicts the car counts of many cameras for a given time at once, using a linear
+    regression over the historic car counts of each camera (see forecasting)
+
+    :param car_counts: One dictionary per camera with POSIX timestamps as keys and car counts as
+    values
+    :param predict_for: The POSIX timestamp of the time for which the predictions shall be made
+    :return: The predicted car counts (never negative, 0 for cameras without car counts)
+    """
+
+    # imported here, so functions that do not predict (e.g. get_images) do not load numpy
+    import forecasting
+
+    predictions = forecasting.forecast(car_counts, predict_for, "linear", default=0.0)
+
+    return [max(0, round(prediction)) for prediction in predictions.tolist()]
+
+
+def predict_car_count(car_counts: dict[int, int], predict_for: int) -> int:
+    """Predicts the car count of a single camera for a given time (see predict_car_counts)
+
+    :param car_counts: A dictionary with POSIX timestamps as keys and car counts as values
+    :param predict_for: The POSIX timestamp of the time for which the prediction shall be made
+    :return: The predicted car count (never negative), 0 if there are no car counts
+    """
+
+    return predict_car_counts([car_counts], predict_for)[0]
+
+
+def create_traffic_count_item(
+    camera_id: str, predict_for: int, car_count_prediction: int, emergency_vehicle_count: int
+) -> dict:
+    """Creates the (serialized) DynamoDB item for the vehicle counts of a camera
+
+    :param camera_id: The ID of the camera
+    :param predict_for: The POSIX timestamp of the time for which the counts have been determined
+    :param car_count_prediction: The prediction of the car count
+    :param emergency_vehicle_count: The emergency vehicle count in the latest image
+    :return: The item to store in the DynamoDB table
+    """
+
+    return {
+        "PK": {"S": f"camera#{camera_id}"},
+        "SK": {"S": f"trafficCount#{predict_for}"},
+        "carCountPrediction": {"N": str(car_count_prediction)},
+        "emergencyVehicleCount": {"N": str(emergency_vehicle_count)},
+        **retention.expires_at("trafficCount", predict_for),
+    }
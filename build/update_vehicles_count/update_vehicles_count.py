@@ -1,13 +1,25 @@
-import boto3
 import os
+import logging
+
+import aws_clients
+import change_tracking
+import dynamo_batch
+import instrumentation
+import vehicle_counts
+
+# setup logging
+logging.getLogger().setLevel(logging.INFO)
 
 # the central DynamoDB table
-table = boto3.resource("dynamodb").Table(os.environ["DB_NAME"])
+table_name = os.environ["DB_NAME"]
+dynamodb = aws_clients.client("dynamodb")
 
 
+@instrumentation.instrumented
 def handler(event, context):
     """Takes car count prediction and emergency vehicle count for a specific camera
-    and a specific prediction time and stores the result in the central DynamoDB table."""
+    and a specific prediction time and stores the result in the central DynamoDB table.
+    The camera is marked as processed up to the latest of its images (see change_tracking)."""
     # input from workflow
     # the POSIX timestamp of the time for which predictions have been made and vehicle counts have been checked
     predict_for: int = event["predictFor"]
@@ -17,6 +29,21 @@ def handler(event, context):
     car_count_prediction: int = event["counts"]["carCountPrediction"]
     # the emergency vehicle count, based on the latest historic image
     emergency_vehicle_count: int = event["counts"]["emergencyVehicleCount"]
+    # the images the counts are based on (keys: POSIX timestamps, as strings due to JSON)
+    image_uris: dict[str, str] = event.get("imageUris", {})
+
+    # store counts and change tracking row in DynamoDB
+    latest_image = max((int(timestamp) for timestamp in image_uris), default=None)
+    dynamo_batch.batch_put_items(
+        dynamodb,
+        table_name,
+        [
+            vehicle_counts.create_traffic_count_item(
+                camera_id, predict_for, car_count_prediction, emergency_vehicle_count
+            ),
+            change_tracking.create_item("camera", camera_id, predict_for, latest_image),
+        ],
+    )
 
     # no output to workflow required - result stored in DynamoDB directly
     return {}
@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 
+import argparse
 import json
 import os
 import random
 import uuid
 from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional, TextIO
 
-def generate_sensor_data(datapoints: int = 10):
-    start_time: datetime = datetime.now()
+def generate_sensor_data(datapoints: int = 10, start_time: Optional[datetime] = None):
+    start_time: datetime = start_time or datetime.now()
     start_value: float = 0.5
 
     progression_value: float = random.choice([-0.05, 0.0, 0.05])
@@ -23,10 +25,10 @@ def generate_sensor_data(datapoints: int = 10):
         for i in range(datapoints)
     ]
 
-def generate_sensor_station():
+def generate_sensor_station(datapoints: int = 10, start_time: Optional[datetime] = None):
     return {
         "station_id": str(uuid.uuid4()),
-        "measurements": generate_sensor_data(),
+        "measurements": generate_sensor_data(datapoints, start_time),
     }
 
 def generate_camera(camera_folder_path: str):
@@ -35,6 +37,100 @@ def generate_camera(camera_folder_path: str):
         "images_path": camera_folder_path,
     }
 
+def generate_image_history(sample_images: list[str], images: int, start_time: datetime):
+    # One image every 5 minutes, each referencing one of the sample images (relative to the images
+    # folder)
+    return [
+        {int((start_time + timedelta(minutes=i * 5)).timestamp()): random.choice(sample_images)}
+        for i in range(images)
+    ]
+
+def generate_synthetic_street(
+    street_index: int,
+    cameras: int,
+    images: int,
+    measurements: int,
+    sample_images: list[str],
+    start_time: datetime,
+):
+    street_name: str = f"street_{street_index}"
+    synthetic_cameras: list[dict] = []
+    for _ in range(cameras):
+        camera: dict = generate_camera(os.path.basename(random.choice(sample_images)))
+        camera["images"] = generate_image_history(sample_images, images, start_time)
+        synthetic_cameras.append(camera)
+
+    return {
+        "street_name": street_name,
+        "cameras": synthetic_cameras,
+        "sensor_station": generate_sensor_station(measurements, start_time),
+        "sections": [
+            generate_street_section(street_name)
+        ],
+        "trafficCapacity": random.choice([5, 10, 15, 20, 25, 30, 35, 40,]),
+        "airQualityLimit": random.uniform(0.5, 1.0),
+    }
+
+def iter_city(
+    streets: int,
+    cameras_per_street: int = 10,
+    images_per_camera: int = 24,
+    measurements_per_station: int = 12,
+    sample_images: Optional[list[str]] = None,
+    start_time: Optional[datetime] = None,
+) -> Iterator[dict]:
+    """Generates a synthetic city of configurable size in the format of data.json street by street,
+    e.g. for benchmarks (see scripts/benchmark.py). In addition to images_path, cameras contain an
+    image history ("images") referencing the sample images, as a list of {timestamp: path relative
+    to the images folder}."""
+    if sample_images is None:
+        images_path: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+        sample_images = [
+            f"{street}/{image}"
+            for street in sorted(os.listdir(images_path))
+            for image in sorted(os.listdir(os.path.join(images_path, street)))
+        ]
+    start_time = start_time or datetime.now()
+
+    for i in range(1, streets + 1):
+        yield generate_synthetic_street(
+            i,
+            cameras_per_street,
+            images_per_camera,
+            measurements_per_station,
+            sample_images,
+            start_time,
+        )
+
+def generate_city(
+    streets: int,
+    cameras_per_street: int = 10,
+    images_per_camera: int = 24,
+    measurements_per_station: int = 12,
+    sample_images: Optional[list[str]] = None,
+    start_time: Optional[datetime] = None,
+) -> list[dict]:
+    """Generates a synthetic city of configurable size in the format of data.json (see iter_city)"""
+    return list(
+        iter_city(
+            streets,
+            cameras_per_street,
+            images_per_camera,
+            measurements_per_station,
+            sample_images,
+            start_time,
+        )
+    )
+
+def write_streaming(dataset: Iterable[dict], json_file: TextIO):
+    """Writes a dataset as a JSON array with one street per line, without holding it in memory as a
+    whole (see scripts/load_data.py, which reads it street by street)"""
+    json_file.write("[")
+    for i, street in enumerate(dataset):
+        json_file.write(",\n" if i else "\n")
+        json.dump(street, json_file)
+    json_file.write("\n]\n")
+
 def generate_street_section(street_name):
     return {
         "section_id": str(uuid.uuid4()),
@@ -57,14 +153,44 @@ def generate_street(street_name: str, camera_folder_paths):
     }
 
 if __name__ == "__main__":
-    script_dir: str = os.path.dirname(os.path.abspath(__file__))
-    images_folder_name: str = "images"
-    images_path: str = os.path.join(script_dir, images_folder_name)
-    streets: list[str] = os.listdir(images_path)
+    parser = argparse.ArgumentParser(
+        description="Generates data.json from the sample images or a synthetic city"
+    )
+    parser.add_argument(
+        "--streets", type=int, help="generate a synthetic city with the given number of streets"
+    )
+    parser.add_argument("--cameras-per-street", type=int, default=10)
+    parser.add_argument("--images-per-camera", type=int, default=24)
+    parser.add_argument("--measurements-per-station", type=int, default=12)
+    parser.add_argument("--output", default="data.json")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="write street by street (one per line) instead of indented",
+    )
+    args = parser.parse_args()
+
+    if args.streets:
+        dataset: Iterable[dict] = iter_city(
+            args.streets,
+            args.cameras_per_street,
+            args.images_per_camera,
+            args.measurements_per_station,
+        )
+    else:
+        script_dir: str = os.path.dirname(os.path.abspath(__file__))
+        images_folder_name: str = "images"
+        images_path: str = os.path.join(script_dir, images_folder_name)
+        streets: list[str] = os.listdir(images_path)
 
-    streets: list[str] = [street for street in streets]
-    dataset: list[dict] = [generate_street(street, os.listdir(os.path.join(images_path, street))) for street in streets]
-    json_data: str = json.dumps(dataset, indent=2)
+        streets: list[str] = [street for street in streets]
+        dataset: Iterable[dict] = (
+            generate_street(street, os.listdir(os.path.join(images_path, street)))
+            for street in streets
+        )
 
-    with open('data.json', 'w') as json_file:
-        json_file.write(json_data)
+    with open(args.output, 'w') as json_file:
+        if args.stream:
+            write_streaming(dataset, json_file)
+        else:
+            json_file.write(json.dumps(list(dataset), indent=2))
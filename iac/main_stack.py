@@ -1,8 +1,13 @@
 import builtins
 import os
 
-from aws_cdk import RemovalPolicy, Stack
+from typing import Optional
+
+from aws_cdk import Duration, RemovalPolicy, Stack
 from aws_cdk import aws_dynamodb as dynamodb
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as events_targets
+from aws_cdk import aws_iam as iam
 from aws_cdk import aws_lambda as lambda_
 from aws_cdk import aws_s3 as s3
 from aws_cdk import aws_stepfunctions as sfn
@@ -11,9 +16,37 @@ from constructs import Construct
 
 dirname = os.path.dirname(__file__)
 
+# number of partitions base entities are spread across (see build/shared/python/base_entities.py)
+BASE_ENTITY_SHARDS = 8
+# number of streets checked by a single invocation of check_limits (batch mode)
+STREET_BATCH_SIZE = 50
+# number of sections handled by a single invocation of determine_info (batch mode)
+SECTION_BATCH_SIZE = 100
+# timeout and memory (in MB) of the functions analysing the images of a single camera. The timeout
+# also bounds how long an image is claimed for analysis (see build/shared/python/detection.py).
+DETECTION_TIMEOUT = Duration.minutes(1)
+DETECTION_MEMORY_SIZE = 512
+# attribute holding the time at which a row expires (see build/shared/python/retention.py)
+TTL_ATTRIBUTE = "expiresAt"
+
 
 class MainStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        camera_batch_size: Optional[int] = None,
+        incremental: bool = False,
+        **kwargs,
+    ) -> None:
+        """Creates the central table and bucket, all Lambda functions and the workflow.
+
+        :param camera_batch_size: If set, cameras are analysed in batches of the given size by the
+        fused analyze_cameras function instead of the fine-grained per-camera tasks, defaults to None
+        :param incremental: If True, each run only processes cameras and stations with new data and
+        the streets and sections depending on them, all other results are carried forward (see
+        build/shared/python/change_tracking.py), defaults to False
+        """
         super().__init__(scope, construct_id, **kwargs)
 
         # central table and bucket
@@ -24,76 +57,192 @@ class MainStack(Stack):
             sort_key=dynamodb.Attribute(name="SK", type=dynamodb.AttributeType.STRING),
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute=TTL_ATTRIBUTE,
         )
 
         central_bucket = s3.Bucket(self, "central_bucket")
 
+        # layer with modules shared by all Lambda functions (see build/shared)
+        shared_layer = lambda_.LayerVersion(
+            self,
+            "shared_layer",
+            code=lambda_.Code.from_asset(os.path.join(".", "build", "shared")),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
+        )
+        # layer with third-party packages (e.g. numpy), see scripts/build_dependencies.sh
+        dependencies_layer = lambda_.LayerVersion(
+            self,
+            "dependencies_layer",
+            code=lambda_.Code.from_asset(os.path.join(".", "build", "dependencies")),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11],
+        )
+        shared_layers = [dependencies_layer, shared_layer]
+
         # Lambda functions with attached permissions
         lambda_env_variables = {
             "DB_NAME": central_table.table_name,
             "BUCKET_NAME": central_bucket.bucket_name,
+            "BASE_ENTITY_SHARDS": str(BASE_ENTITY_SHARDS),
+            # CloudWatch namespace of the metrics emitted by all functions (see
+            # build/shared/python/instrumentation.py)
+            "METRICS_NAMESPACE": construct_id,
         }
         get_predict_for_timestamp = WorkflowLambda(
-            self, "get_predict_for_timestamp", lambda_env_variables
+            self, "get_predict_for_timestamp", lambda_env_variables, shared_layers
         )
 
-        get_camera_list = WorkflowLambda(self, "get_camera_list", lambda_env_variables)
+        get_camera_list = WorkflowLambda(
+            self, "get_camera_list", lambda_env_variables, shared_layers
+        )
         central_table.grant_read_data(get_camera_list.function)
 
-        get_images = WorkflowLambda(self, "get_images", lambda_env_variables)
+        get_images = WorkflowLambda(self, "get_images", lambda_env_variables, shared_layers)
         central_table.grant_read_data(get_images.function)
 
-        count_cars = WorkflowLambda(self, "count_cars", lambda_env_variables)
+        # permission to analyse images, required by both vehicle counting functions
+        detect_labels_policy = iam.PolicyStatement(
+            actions=["rekognition:DetectLabels"], resources=["*"]
+        )
+
+        count_cars = WorkflowLambda(
+            self,
+            "count_cars",
+            lambda_env_variables,
+            shared_layers,
+            timeout=DETECTION_TIMEOUT,
+            memory_size=DETECTION_MEMORY_SIZE,
+        )
         central_bucket.grant_read(count_cars.function)
+        central_table.grant_read_write_data(count_cars.function)
+        count_cars.function.add_to_role_policy(detect_labels_policy)
 
-        predict_car_count = WorkflowLambda(self, "predict_car_count", lambda_env_variables)
+        predict_car_count = WorkflowLambda(
+            self, "predict_car_count", lambda_env_variables, shared_layers
+        )
+        central_table.grant_read_write_data(predict_car_count.function)
 
         count_emergency_vehicles = WorkflowLambda(
-            self, "count_emergency_vehicles", lambda_env_variables
+            self,
+            "count_emergency_vehicles",
+            lambda_env_variables,
+            shared_layers,
+            timeout=DETECTION_TIMEOUT,
+            memory_size=DETECTION_MEMORY_SIZE,
         )
         central_bucket.grant_read(count_emergency_vehicles.function)
+        central_table.grant_read_write_data(count_emergency_vehicles.function)
+        count_emergency_vehicles.function.add_to_role_policy(detect_labels_policy)
 
-        update_vehicles_count = WorkflowLambda(self, "update_vehicles_count", lambda_env_variables)
+        update_vehicles_count = WorkflowLambda(
+            self, "update_vehicles_count", lambda_env_variables, shared_layers
+        )
         central_table.grant_write_data(update_vehicles_count.function)
 
-        get_station_list = WorkflowLambda(self, "get_station_list", lambda_env_variables)
+        # fused alternative to the per-camera tasks above (see camera_batch_size)
+        analyze_cameras = WorkflowLambda(
+            self,
+            "analyze_cameras",
+            lambda_env_variables,
+            shared_layers,
+            timeout=Duration.minutes(5),
+        )
+        central_bucket.grant_read(analyze_cameras.function)
+        central_table.grant_read_write_data(analyze_cameras.function)
+        analyze_cameras.function.add_to_role_policy(detect_labels_policy)
+
+        get_station_list = WorkflowLambda(
+            self, "get_station_list", lambda_env_variables, shared_layers
+        )
         central_table.grant_read_data(get_station_list.function)
 
-        predict_air_quality = WorkflowLambda(self, "predict_air_quality", lambda_env_variables)
+        predict_air_quality = WorkflowLambda(
+            self, "predict_air_quality", lambda_env_variables, shared_layers
+        )
         central_table.grant_read_write_data(predict_air_quality.function)
 
-        get_street_list = WorkflowLambda(self, "get_street_list", lambda_env_variables)
+        get_street_list = WorkflowLambda(
+            self, "get_street_list", lambda_env_variables, shared_layers
+        )
         central_table.grant_read_data(get_street_list.function)
 
-        check_limits = WorkflowLambda(self, "check_limits", lambda_env_variables)
+        check_limits = WorkflowLambda(self, "check_limits", lambda_env_variables, shared_layers)
         central_table.grant_read_write_data(check_limits.function)
 
-        get_section_list = WorkflowLambda(self, "get_section_list", lambda_env_variables)
+        get_section_list = WorkflowLambda(
+            self, "get_section_list", lambda_env_variables, shared_layers
+        )
         central_table.grant_read_data(get_section_list.function)
 
-        determine_info = WorkflowLambda(self, "determine_info", lambda_env_variables)
+        determine_info = WorkflowLambda(self, "determine_info", lambda_env_variables, shared_layers)
         central_table.grant_read_write_data(determine_info.function)
 
+        # compaction of time series, runs hourly (after the compaction delay of the past hour)
+        compact_time_series = WorkflowLambda(
+            self,
+            "compact_time_series",
+            lambda_env_variables,
+            shared_layers,
+            timeout=Duration.minutes(15),
+        )
+        central_table.grant_read_write_data(compact_time_series.function)
+        events.Rule(
+            self,
+            "compact_time_series_schedule",
+            schedule=events.Schedule.cron(minute="20"),
+            targets=[events_targets.LambdaFunction(compact_time_series.function)],
+        )
+
         # workflow
 
+        # run options given in the execution input (e.g. {"profile": true} to profile all
+        # invocations of the run, see build/shared/python/instrumentation.py), with defaults
+        workflow_default_run_options = sfn.Pass(
+            self,
+            "Default run options",
+            parameters={"defaults": {"profile": False}, "input.$": "$"},
+        )
+        workflow_apply_run_options = sfn.Pass(
+            self,
+            "Apply run options",
+            parameters={"options.$": "States.JsonMerge($.defaults, $.input, false)"},
+            output_path="$.options",
+        )
+        # run options forwarded to the tasks of Map iterations and tasks with explicit payloads
+        run_options = {"profile.$": "$.profile"}
+
         workflow_get_predict_for_timestamp = tasks.LambdaInvoke(
             self,
             "Get predict for timestamp",
             lambda_function=get_predict_for_timestamp.function,
             payload_response_only=True,
-            result_selector={"predictFor.$": "$"},
+            result_path="$.predictFor",
         )
 
         # parallel: analyze-input-data
-        workflow_analyze_input_data = sfn.Parallel(
-            self, "Analyze input data", result_path=sfn.JsonPath.DISCARD
-        )
+        if incremental:
+            # keep the IDs of the dirty cameras and stations to determine dirty streets
+            workflow_analyze_input_data = sfn.Parallel(
+                self,
+                "Analyze input data",
+                result_selector={
+                    "cameraIds.$": "$[0].cameraIds",
+                    "stationIds.$": "$[1].stationIds",
+                },
+                result_path="$.dirty",
+            )
+        else:
+            workflow_analyze_input_data = sfn.Parallel(
+                self, "Analyze input data", result_path=sfn.JsonPath.DISCARD
+            )
+        # list tasks only return the IDs of dirty entities in incremental runs
+        dirty_only_payload = {"predictFor.$": "$.predictFor", "dirtyOnly": True, **run_options}
         # branch 1 of parallel: analyze-input-data
         workflow_get_camera_list = tasks.LambdaInvoke(
             self,
             "Get camera list",
             lambda_function=get_camera_list.function,
             payload_response_only=True,
+            payload=sfn.TaskInput.from_object(dirty_only_payload) if incremental else None,
             result_path="$.cameraIds",
         )
         # parallelFor: analyze-data-per-camera
@@ -102,7 +251,12 @@ class MainStack(Stack):
             "Analyze data per camera",
             max_concurrency=40,
             items_path="$.cameraIds",
-            parameters={"cameraId.$": "$$.Map.Item.Value", "predictFor.$": "$.predictFor"},
+            parameters={
+                "cameraId.$": "$$.Map.Item.Value",
+                "predictFor.$": "$.predictFor",
+                **run_options,
+            },
+            result_path=sfn.JsonPath.DISCARD,
         )
         workflow_get_images = tasks.LambdaInvoke(
             self,
@@ -127,7 +281,9 @@ class MainStack(Stack):
             "Count cars",
             lambda_function=count_cars.function,
             payload_response_only=True,
-            input_path="$.imageUris",
+            payload=sfn.TaskInput.from_object(
+                {"cameraId.$": "$.cameraId", "imageUris.$": "$.imageUris", **run_options}
+            ),
             result_path="$.carCount",
         )
         workflow_predict_car_count = tasks.LambdaInvoke(
@@ -144,7 +300,9 @@ class MainStack(Stack):
             "Count emergency vehicles",
             lambda_function=count_emergency_vehicles.function,
             payload_response_only=True,
-            input_path="$.imageUris",
+            payload=sfn.TaskInput.from_object(
+                {"cameraId.$": "$.cameraId", "imageUris.$": "$.imageUris", **run_options}
+            ),
             result_selector={"emergencyVehicleCount.$": "$"},
         )
         workflow_count_all_vehicles.branch(workflow_count_emergency_vehicles)
@@ -159,15 +317,54 @@ class MainStack(Stack):
                 workflow_update_vehicles_count
             )
         )
-        workflow_analyze_input_data.branch(
-            workflow_get_camera_list.next(workflow_analyze_data_per_camera)
-        )
+        if camera_batch_size:
+            # fused alternative: split camera IDs into batches, each batch is analysed by one invocation
+            workflow_partition_camera_list = sfn.Pass(
+                self,
+                "Partition camera list",
+                parameters={
+                    "batches": sfn.JsonPath.array_partition(
+                        sfn.JsonPath.list_at("$.cameraIds"), camera_batch_size
+                    )
+                },
+                result_path="$.cameraIdBatches",
+            )
+            # parallelFor: analyze-data-per-camera-batch
+            workflow_analyze_data_per_camera_batch = sfn.Map(
+                self,
+                "Analyze data per camera batch",
+                max_concurrency=40,
+                items_path="$.cameraIdBatches.batches",
+                parameters={
+                    "cameraIds.$": "$$.Map.Item.Value",
+                    "predictFor.$": "$.predictFor",
+                    **run_options,
+                },
+                result_path=sfn.JsonPath.DISCARD,
+            )
+            workflow_analyze_cameras = tasks.LambdaInvoke(
+                self,
+                "Analyze cameras",
+                lambda_function=analyze_cameras.function,
+                payload_response_only=True,
+            )
+            workflow_analyze_data_per_camera_batch.iterator(workflow_analyze_cameras)
+            workflow_analyze_input_data.branch(
+                workflow_get_camera_list.next(workflow_partition_camera_list).next(
+                    workflow_analyze_data_per_camera_batch
+                )
+            )
+        else:
+            workflow_analyze_input_data.branch(
+                workflow_get_camera_list.next(workflow_analyze_data_per_camera)
+            )
         # branch 2 of parallel: analyze-input-data
         workflow_get_station_list = tasks.LambdaInvoke(
             self,
             "Get station list",
             lambda_function=get_station_list.function,
             payload_response_only=True,
+            payload=sfn.TaskInput.from_object(dirty_only_payload) if incremental else None,
             result_path="$.stationIds",
         )
         ## parallelFor: analyze-data-per-station
@@ -176,7 +373,12 @@ class MainStack(Stack):
             "Analyze data per station",
             max_concurrency=40,
             items_path="$.stationIds",
-            parameters={"stationId.$": "$$.Map.Item.Value", "predictFor.$": "$.predictFor"},
+            parameters={
+                "stationId.$": "$$.Map.Item.Value",
+                "predictFor.$": "$.predictFor",
+                **run_options,
+            },
+            result_path=sfn.JsonPath.DISCARD,
         )
         workflow_predict_air_quality = tasks.LambdaInvoke(
             self,
@@ -194,16 +396,43 @@ class MainStack(Stack):
             "Get street list",
             lambda_function=get_street_list.function,
             payload_response_only=True,
+            payload=(
+                sfn.TaskInput.from_object(
+                    {
+                        **dirty_only_payload,
+                        "cameraIds.$": "$.dirty.cameraIds",
+                        "stationIds.$": "$.dirty.stationIds",
+                    }
+                )
+                if incremental
+                else None
+            ),
             result_path="$.streetIds",
         )
 
+        # split street IDs into batches, so each check_limits invocation handles multiple streets
+        workflow_partition_street_list = sfn.Pass(
+            self,
+            "Partition street list",
+            parameters={
+                "batches": sfn.JsonPath.array_partition(
+                    sfn.JsonPath.list_at("$.streetIds"), STREET_BATCH_SIZE
+                )
+            },
+            result_path="$.streetIdBatches",
+        )
+
         # parallelFor: check-limits-per-street
         workflow_check_limits_per_street = sfn.Map(
             self,
             "Check limits per street",
             max_concurrency=40,
-            items_path="$.streetIds",
-            parameters={"streetId.$": "$$.Map.Item.Value", "predictFor.$": "$.predictFor"},
+            items_path="$.streetIdBatches.batches",
+            parameters={
+                "streetIds.$": "$$.Map.Item.Value",
+                "predictFor.$": "$.predictFor",
+                **run_options,
+            },
             result_path=sfn.JsonPath.DISCARD,
         )
         workflow_check_limits = tasks.LambdaInvoke(
@@ -219,7 +448,24 @@ class MainStack(Stack):
             "Get section list",
             lambda_function=get_section_list.function,
             payload_response_only=True,
-            result_path="$.sectionIds",
+            payload=(
+                sfn.TaskInput.from_object({**dirty_only_payload, "streetIds.$": "$.streetIds"})
+                if incremental
+                else None
+            ),
+            result_path="$.sections",
+        )
+
+        # split section IDs into batches, so each determine_info invocation handles multiple sections
+        workflow_partition_section_list = sfn.Pass(
+            self,
+            "Partition section list",
+            parameters={
+                "batches": sfn.JsonPath.array_partition(
+                    sfn.JsonPath.list_at("$.sections.sectionIds"), SECTION_BATCH_SIZE
+                )
+            },
+            result_path="$.sectionIdBatches",
         )
 
         # parallelFor: determine-info-per-section
@@ -227,8 +473,15 @@ class MainStack(Stack):
             self,
             "Determine info per section",
             max_concurrency=40,
-            items_path="$.sectionIds",
-            parameters={"sectionId.$": "$$.Map.Item.Value", "predictFor.$": "$.predictFor"},
+            items_path="$.sectionIdBatches.batches",
+            parameters={
+                "sectionIds.$": "$$.Map.Item.Value",
+                "predictFor.$": "$.predictFor",
+                # all batches use the display state items of the same shard count (see
+                # build/shared/python/display_state.py)
+                "displayShards.$": "$.sections.displayShards",
+                **run_options,
+            },
             result_path=sfn.JsonPath.DISCARD,
         )
         workflow_determine_info = tasks.LambdaInvoke(
@@ -241,10 +494,14 @@ class MainStack(Stack):
 
         # workflow definition
         workflow = (
-            workflow_get_predict_for_timestamp.next(workflow_analyze_input_data)
+            workflow_default_run_options.next(workflow_apply_run_options)
+            .next(workflow_get_predict_for_timestamp)
+            .next(workflow_analyze_input_data)
             .next(workflow_get_street_list)
+            .next(workflow_partition_street_list)
             .next(workflow_check_limits_per_street)
             .next(workflow_get_section_list)
+            .next(workflow_partition_section_list)
             .next(workflow_determine_info_per_section)
         )
 
@@ -255,7 +512,15 @@ class MainStack(Stack):
 
 
 class WorkflowLambda(Construct):
-    def __init__(self, scope: Construct, id: str, env: dict) -> None:
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        env: dict,
+        layers: list[lambda_.ILayerVersion],
+        timeout: Optional[Duration] = None,
+        memory_size: Optional[int] = None,
+    ) -> None:
         super().__init__(scope, id)
         self._function = lambda_.Function(
             self,
@@ -263,7 +528,14 @@ class WorkflowLambda(Construct):
             code=lambda_.Code.from_asset(os.path.join(".", "build", id)),
             handler=f"{id}.handler",
             runtime=lambda_.Runtime.PYTHON_3_11,
-            environment=env,
+            # functions derive time limits of their own from the timeout (3 seconds by default)
+            environment={
+                **env,
+                "FUNCTION_TIMEOUT": str(timeout.to_seconds() if timeout else 3),
+            },
+            layers=layers,
+            timeout=timeout,
+            memory_size=memory_size,
         )
 
     @property
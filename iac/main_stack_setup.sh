@@ -44,6 +44,7 @@ count_cars
 predict_car_count
 count_emergency_vehicles
 update_vehicles_count
+analyze_cameras
 get_station_list
 predict_air_quality
 get_street_list
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""Benchmarks the workflow locally against a synthetic city of configurable size.
+
+A synthetic city is generated (see data/generate_data_json.py) and loaded into moto mocks of
+DynamoDB and S3 (see scripts/load_data.py), then the workflow defined by MainStack is executed in-process (see
+scripts/local_workflow.py). Vehicles are counted by the stub detector (DETECTOR=stub), so no
+Rekognition calls are made. Each run reports:
+- end-to-end wall time
+- latency percentiles per Task state
+- DynamoDB requests and items read/written per operation
+- consumed capacity units, retries and cold starts per function (as emitted by the instrumented
+  handlers, see build/shared/python/instrumentation.py)
+- peak memory (max. resident set size, and traced Python allocations with --trace-memory)
+
+Between runs the prediction time advances by --interval seconds and a fraction of the cameras and
+stations receives new data (--new-data), e.g. to measure incremental runs (--incremental).
+
+Usage: python scripts/benchmark.py [--streets n] [--cameras-per-street n] [--images-per-camera n]
+[--measurements-per-station n] [--runs n] [--camera-batch-size n] [--incremental] [--json file]
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+from collections import Counter
+from datetime import datetime
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+images_dir = os.path.join(root_dir, "data", "images")
+
+# environment of the Lambda functions, required before handlers are loaded
+os.environ.setdefault("DB_NAME", "central_table")
+os.environ.setdefault("BUCKET_NAME", "central_bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("DETECTOR", "stub")
+
+sys.path.insert(0, os.path.join(root_dir, "data"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import boto3  # noqa: E402
+from moto import mock_dynamodb, mock_s3  # noqa: E402
+
+import generate_data_json  # noqa: E402
+import load_data  # noqa: E402
+import local_workflow  # noqa: E402
+
+local_workflow.add_build_paths()
+
+import change_tracking  # noqa: E402
+import dynamo_batch  # noqa: E402
+
+# constants
+# interval in seconds between images of a camera, as generated by generate_data_json
+IMAGE_INTERVAL = 300
+# interval in seconds between measurements of a station, as generated by generate_data_json
+MEASUREMENT_INTERVAL = 600
+# percentiles reported for state latencies
+PERCENTILES = (50, 90, 99)
+
+
+class RequestCounter:
+    """Counts DynamoDB requests and the items read and written per operation (thread-safe). Must
+    be registered before clients are created, as clients copy the event handlers of the session.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.items_read: Counter = Counter()
+        self.items_written: Counter = Counter()
+
+    def register(self, session: boto3.Session):
+        session.events.register("before-parameter-build.dynamodb", self.before_parameter_build)
+        session.events.register("after-call.dynamodb", self.after_call)
+
+    def before_parameter_build(self, params: dict, model, **kwargs):
+        if model.name in ("PutItem", "UpdateItem", "DeleteItem"):
+            written = 1
+        elif model.name == "BatchWriteItem":
+            written = sum(len(requests) for requests in params["RequestItems"].values())
+        else:
+            return
+        with self._lock:
+            self.items_written[model.name] += written
+
+    def after_call(self, parsed: dict, model, **kwargs):
+        if "Items" in parsed:
+            read = len(parsed["Items"])
+        elif "Responses" in parsed:
+            read = sum(len(items) for items in parsed["Responses"].values())
+        else:
+            read = 1 if "Item" in parsed else 0
+        with self._lock:
+            self.requests[model.name] += 1
+            self.items_read[model.name] += read
+
+    def clear(self):
+        with self._lock:
+            self.requests.clear()
+            self.items_read.clear()
+            self.items_written.clear()
+
+
+def create_new_data_items(dataset: list[dict], fraction: float, timestamp: int) -> list[dict]:
+    """Creates new images and measurements for a random fraction of the cameras and stations
+
+    :param dataset: The dataset
+    :param fraction: The fraction of cameras and stations that receive new data
+    :param timestamp: The POSIX timestamp of the new data
+    :return: The items to store in the DynamoDB table
+    """
+
+    items = []
+    for street in dataset:
+        for camera in street["cameras"]:
+            if random.random() < fraction:
+                path = next(iter(camera["images"][-1].values()))
+                items.append(
+                    {
+                        "PK": {"S": f"camera#{camera['camera_id']}"},
+                        "SK": {"S": f"image#{timestamp}"},
+                        "URI": {"S": path},
+                    }
+                )
+                items.append(
+                    change_tracking.create_received_item("camera", camera["camera_id"], timestamp)
+                )
+        if random.random() < fraction:
+            station_id = street["sensor_station"]["station_id"]
+            items.append(
+                {
+                    "PK": {"S": f"station#{station_id}"},
+                    "SK": {"S": f"measurement#{timestamp}"},
+                    "airQuality": {"N": str(random.uniform(0.0, 1.0))},
+                }
+            )
+            items.append(change_tracking.create_received_item("station", station_id, timestamp))
+
+    return items
+
+
+def create_resources(dynamodb, s3, table_name: str, bucket_name: str):
+    """Creates the central table and bucket (as defined by MainStack) within the mocks"""
+
+    dynamodb.create_table(
+        TableName=table_name,
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    s3.create_bucket(Bucket=bucket_name)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Determines a percentile of the given values (nearest rank)"""
+
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def create_report(
+    wall_time: float,
+    metrics: local_workflow.Metrics,
+    counter: RequestCounter,
+    traced_peak: int,
+) -> dict:
+    """Summarises the measurements of a single run
+
+    :return: The report of the run
+    """
+
+    return {
+        "wallTime": wall_time,
+        "states": {
+            state_name: {
+                "count": len(latencies),
+                **{f"p{p}": percentile(latencies, p) for p in PERCENTILES},
+                "max": max(latencies),
+            }
+            for state_name, latencies in sorted(metrics.latencies.items())
+        },
+        "dynamodb": {
+            operation: {
+                "requests": counter.requests[operation],
+                "itemsRead": counter.items_read[operation],
+                "itemsWritten": counter.items_written[operation],
+            }
+            for operation in sorted(counter.requests)
+        },
+        "functions": {
+            function_name: {
+                "coldStarts": counters["ColdStart"],
+                "readCapacity": counters["DynamoDBConsumedReadCapacity"],
+                "writeCapacity": counters["DynamoDBConsumedWriteCapacity"],
+                "retries": counters["DynamoDBRetries"] + counters["BatchRetries"],
+            }
+            for function_name, counters in sorted(metrics.functions.items())
+        },
+        # max. resident set size of the process (KiB on Linux), includes the mocked services
+        "maxRss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "tracedPeak": traced_peak,
+    }
+
+
+def print_report(run: int, report: dict):
+    """Prints the report of a single run"""
+
+    print(f"\nRun {run}: {report['wallTime']:.3f}s end-to-end")
+    print(f"{'state':<32}{'count':>8}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+    for state_name, latencies in report["states"].items():
+        print(
+            f"{state_name:<32}{latencies['count']:>8}"
+            + "".join(f"{latencies[f'p{p}'] * 1000:>10.1f}" for p in PERCENTILES)
+        )
+    print(f"{'DynamoDB operation':<32}{'requests':>10}{'read':>10}{'written':>10}")
+    for operation, counts in report["dynamodb"].items():
+        print(
+            f"{operation:<32}{counts['requests']:>10}{counts['itemsRead']:>10}"
+            f"{counts['itemsWritten']:>10}"
+        )
+    print(f"{'function':<32}{'cold':>10}{'read CU':>10}{'write CU':>10}{'retries':>10}")
+    for function_name, counts in report["functions"].items():
+        print(
+            f"{function_name:<32}{counts['coldStarts']:>10}{counts['readCapacity']:>10.1f}"
+            f"{counts['writeCapacity']:>10.1f}{counts['retries']:>10}"
+        )
+    print(f"peak memory: {report['maxRss'] / 2**20:.1f} MiB max. RSS", end="")
+    if report["tracedPeak"]:
+        print(f", {report['tracedPeak'] / 2**20:.1f} MiB traced", end="")
+    print()
+
+
+def run_benchmark(args: argparse.Namespace) -> list[dict]:
+    """Generates a synthetic city, loads it into mocked services and runs the workflow
+
+    :param args: The parsed command line arguments
+    :return: The reports of all runs
+    """
+
+    table_name = os.environ["DB_NAME"]
+    bucket_name = os.environ["BUCKET_NAME"]
+    random.seed(args.seed)
+
+    # the latest images and measurements are taken at the time of the first prediction
+    predict_for = int(datetime(2024, 1, 1).timestamp())
+    history = max(
+        args.images_per_camera * IMAGE_INTERVAL,
+        args.measurements_per_station * MEASUREMENT_INTERVAL,
+    )
+    dataset = generate_data_json.generate_city(
+        args.streets,
+        args.cameras_per_street,
+        args.images_per_camera,
+        args.measurements_per_station,
+        start_time=datetime.fromtimestamp(predict_for - history),
+    )
+
+    with mock_dynamodb(), mock_s3():
+        # count requests of all clients created from now on (mocks replace the default session)
+        boto3.setup_default_session()
+        counter = RequestCounter()
+        counter.register(boto3.DEFAULT_SESSION)
+
+        dynamodb = boto3.client("dynamodb")
+        s3 = boto3.client("s3")
+        create_resources(dynamodb, s3, table_name, bucket_name)
+
+        # load city
+        written = load_data.load_items(dynamodb, table_name, dataset)
+        uploaded = load_data.upload_images(s3, bucket_name, images_dir)
+        logging.info(f"Loaded {written} items and {uploaded} images")
+
+        # the prediction time is set by the benchmark instead of get_predict_for_timestamp
+        current = {"predictFor": predict_for}
+        workflow = local_workflow.LocalWorkflow.from_stack(
+            handlers={"get_predict_for_timestamp": lambda event, context: current["predictFor"]},
+            camera_batch_size=args.camera_batch_size,
+            incremental=args.incremental,
+        )
+
+        reports = []
+        for run in range(1, args.runs + 1):
+            if run > 1:
+                current["predictFor"] += args.interval
+                new_items = create_new_data_items(dataset, args.new_data, current["predictFor"])
+                dynamo_batch.batch_put_items(dynamodb, table_name, new_items)
+
+            counter.clear()
+            workflow.metrics.clear()
+            if args.trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            workflow.run({})
+            wall_time = time.perf_counter() - start
+            traced_peak = 0
+            if args.trace_memory:
+                traced_peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            report = create_report(wall_time, workflow.metrics, counter, traced_peak)
+            print_report(run, report)
+            reports.append(report)
+
+    return reports
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks the workflow against a synthetic city")
+    parser.add_argument("--streets", type=int, default=10, help="number of streets")
+    parser.add_argument("--cameras-per-street", type=int, default=10)
+    parser.add_argument("--images-per-camera", type=int, default=24)
+    parser.add_argument("--measurements-per-station", type=int, default=12)
+    parser.add_argument("--runs", type=int, default=1, help="number of consecutive runs")
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=60,
+        help="seconds between the prediction times of runs",
+    )
+    parser.add_argument(
+        "--new-data",
+        type=float,
+        default=0.1,
+        help="fraction of cameras and stations with new data before each further run",
+    )
+    parser.add_argument("--camera-batch-size", type=int, help="analyse cameras in batches")
+    parser.add_argument("--incremental", action="store_true", help="only process dirty entities")
+    parser.add_argument("--trace-memory", action="store_true", help="trace Python allocations")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic city")
+    parser.add_argument("--json", help="write the reports of all runs to the given file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+    args = parse_args()
+    reports = run_benchmark(args)
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump({"arguments": vars(args), "runs": reports}, json_file, indent=2)
@@ -0,0 +1,11 @@
+#!/bin/bash
+
+echo "Installing third-party packages of the dependencies layer"
+pip install \
+    -r build/dependencies/requirements.txt \
+    --target build/dependencies/python \
+    --platform manylinux2014_x86_64 \
+    --implementation cp \
+    --python-version 3.11 \
+    --only-binary=:all: \
+    --upgrade
@@ -1,2 +1,3 @@
+call .\scripts\build_dependencies.bat
 cdk deploy --outputs-file config.json
 py .\iac\post_deploy.py
\ No newline at end of file
@@ -1,3 +1,4 @@
 #!/bin/bash
+./scripts/build_dependencies.sh
 cdk deploy --outputs-file config.json
 python3 ./iac/post_deploy.py
\ No newline at end of file
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""Loads a dataset in the format of data.json (see data/generate_data_json.py) into the central
+table and uploads the images into the central bucket.
+
+The dataset is parsed street by street, so files of any size can be loaded with bounded memory.
+Rows (base entities, "image#" and "measurement#" rows and the "received" rows of their cameras
+and stations, see doc/dynamo-access-patterns.md) are
+written by parallel BatchWriteItem workers (unprocessed and throttled items are retried with
+backoff, see build/shared/python/dynamo_batch.py). Images are uploaded concurrently, large files
+as multipart uploads.
+
+Image and measurement rows expire a few days after they have been taken or loaded, whichever is
+later (see build/shared/python/retention.py), so historic datasets are kept for the retention
+period as well. Pass --no-ttl to keep the rows.
+
+With --checkpoint, the number of completely loaded streets and the uploaded images are appended to
+the given file, so an interrupted load continues where it stopped when started again.
+
+Usage: python scripts/load_data.py --table <table name> --bucket <bucket name> [--data file]
+[--images dir] [--workers n] [--checkpoint file] [--skip-items] [--skip-images] [--no-ttl]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, Optional, TextIO
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, os.path.join(root_dir, "build", "shared", "python"))
+
+import base_entities  # noqa: E402
+import change_tracking  # noqa: E402
+import dynamo_batch  # noqa: E402
+import metadata_cache  # noqa: E402
+import retention  # noqa: E402
+
+# constants
+# number of characters read from the dataset at once (doubled while a street does not fit)
+READ_SIZE = 1 << 20  # 1MiB
+# number of concurrent BatchWriteItem requests and image uploads
+MAX_WORKERS = 8
+# images larger than this are uploaded in parts (multipart upload)
+MULTIPART_THRESHOLD = 8 << 20  # 8MiB
+# min. number of seconds between two checkpoint writes
+CHECKPOINT_INTERVAL = 5.0
+# format of the names of image files in data.json, e.g. "2023-12-18_17-55.png"
+IMAGE_NAME_FORMAT = "%Y-%m-%d"
+
+
+class Checkpoint:
+    def __init__(self, path: Optional[str] = None):
+        """Progress of a load, appended to a file (one JSON record per line) if a path is given
+
+        :param path: The path of the checkpoint file, defaults to None (no checkpoints)
+        """
+
+        self.path = path
+        # number of streets (from the start of the dataset) whose rows have all been written
+        self.streets = 0
+        # keys of the uploaded images
+        self.images: set[str] = set()
+        # progress not yet appended to the file
+        self._saved_streets = 0
+        self._unsaved_images: list[str] = []
+        self._saved_at = 0.0
+        # True if the file ends within a record (interrupted while saving)
+        self._incomplete = False
+
+        if path and os.path.exists(path):
+            with open(path) as checkpoint_file:
+                for line in checkpoint_file:
+                    self._incomplete = not line.endswith("\n")
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # record incomplete due to an interrupted save, its progress is redone
+                        continue
+                    if "streets" in record:
+                        self.streets = record["streets"]
+                    else:
+                        self.images.add(record["image"])
+            self._saved_streets = self.streets
+
+    def add_image(self, key: str):
+        """Records an uploaded image
+
+        :param key: The object key of the image
+        """
+
+        self.images.add(key)
+        self._unsaved_images.append(key)
+
+    def save(self, force: bool = False):
+        """Appends the progress since the last save to the checkpoint file, at most every
+        CHECKPOINT_INTERVAL seconds. Records already in the file are never rewritten.
+
+        :param force: True to write the file regardless of the interval, defaults to False
+        """
+
+        if not self.path or (not force and time.monotonic() - self._saved_at < CHECKPOINT_INTERVAL):
+            return
+        records = [{"image": key} for key in self._unsaved_images]
+        if self.streets != self._saved_streets:
+            records.append({"streets": self.streets})
+        if records:
+            with open(self.path, "a") as checkpoint_file:
+                # terminate an incomplete record, it is skipped when the file is read again
+                if self._incomplete:
+                    checkpoint_file.write("\n")
+                    self._incomplete = False
+                checkpoint_file.write("".join(f"{json.dumps(record)}\n" for record in records))
+            self._unsaved_images.clear()
+            self._saved_streets = self.streets
+        self._saved_at = time.monotonic()
+
+
+def iter_streets(data_file: TextIO, read_size: int = READ_SIZE) -> Iterator[dict]:
+    """Parses a dataset (a JSON array of streets) street by street, without reading it as a whole
+
+    :param data_file: The dataset file
+    :param read_size: The number of characters to read at once, defaults to READ_SIZE
+    :raises ValueError: If the file is not a JSON array of objects
+    :return: The streets of the dataset
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = data_file.read(read_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Dataset must be a JSON array")
+    position = 1
+    next_read_size = read_size
+    while True:
+        # skip separators between streets
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+
+        # parse next street, read more if it is incomplete
+        try:
+            if position == len(buffer):
+                raise json.JSONDecodeError("Incomplete street", buffer, position)
+            street, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = data_file.read(next_read_size)
+            if not chunk:
+                raise ValueError("Dataset ends within a street")
+            buffer = buffer[position:] + chunk
+            position = 0
+            next_read_size *= 2
+            continue
+
+        next_read_size = read_size
+        yield street
+
+
+def get_image_timestamp(image_name: str) -> int:
+    """Determines the time at which an image has been taken from its name
+
+    :param image_name: The name of the image file, e.g. "2023-12-18_17-55.png" (UTC)
+    :return: The POSIX timestamp of the time at which the image has been taken
+    """
+
+    date, time_of_day = os.path.splitext(image_name)[0].split("_")
+    hours, minutes = (int(value) for value in time_of_day.split("-"))
+
+    # times in file names are UTC, so the timestamp does not depend on the local timezone
+    day = datetime.strptime(date, IMAGE_NAME_FORMAT).replace(tzinfo=timezone.utc)
+    # minutes are not normalised in the sample images (e.g. "17-60")
+    taken_at = day + timedelta(hours=hours, minutes=minutes)
+
+    return int(taken_at.timestamp())
+
+
+def create_street_items(
+    street: dict, ttl: bool = True, loaded_at: Optional[int] = None
+) -> Iterator[dict]:
+    """Creates the (serialized) DynamoDB items of a street of the dataset, including its cameras,
+    images, sensor station, measurements and sections
+
+    :param street: The street, as in data.json
+    :param ttl: True if image and measurement rows shall expire (see retention), defaults to True
+    :param loaded_at: The POSIX timestamp of the load, rows of data taken earlier (e.g. historic
+    datasets like data.json) expire a retention period after the load instead of after they have
+    been taken, which may already be over. Defaults to the current time.
+    :return: The items to store in the DynamoDB table
+    """
+
+    loaded_at = int(time.time()) if loaded_at is None else loaded_at
+
+    def expires_at(row_type: str, timestamp) -> dict:
+        return retention.expires_at(row_type, max(int(timestamp), loaded_at)) if ttl else {}
+
+    street_id = street["street_name"]
+    station = street["sensor_station"]
+
+    for camera in street["cameras"]:
+        camera_id = camera["camera_id"]
+        yield base_entities.key(f"camera#{camera_id}")
+
+        # image history of synthetic cities, otherwise a single image within the street folder
+        images = camera.get("images") or [
+            {get_image_timestamp(camera["images_path"]): f"{street_id}/{camera['images_path']}"}
+        ]
+        for image in images:
+            for timestamp, uri in image.items():
+                yield {
+                    "PK": {"S": f"camera#{camera_id}"},
+                    "SK": {"S": f"image#{timestamp}"},
+                    "URI": {"S": uri},
+                    **expires_at("image", timestamp),
+                }
+        # latest image of the camera, marks the camera as dirty for incremental runs
+        timestamps = [int(timestamp) for image in images for timestamp in image]
+        if timestamps:
+            yield change_tracking.create_received_item("camera", camera_id, max(timestamps))
+
+    yield base_entities.key(f"station#{station['station_id']}")
+    for measurement in station["measurements"]:
+        for timestamp, air_quality in measurement.items():
+            yield {
+                "PK": {"S": f"station#{station['station_id']}"},
+                "SK": {"S": f"measurement#{timestamp}"},
+                "airQuality": {"N": str(air_quality)},
+                **expires_at("measurement", timestamp),
+            }
+    timestamps = [
+        int(timestamp) for measurement in station["measurements"] for timestamp in measurement
+    ]
+    if timestamps:
+        yield change_tracking.create_received_item(
+            "station", station["station_id"], max(timestamps)
+        )
+
+    yield {
+        **base_entities.key(f"street#{street_id}"),
+        "cameras": {"L": [{"S": camera["camera_id"]} for camera in street["cameras"]]},
+        "station": {"S": station["station_id"]},
+        "trafficCapacity": {"N": str(street["trafficCapacity"])},
+        "airQualityLimit": {"N": str(street["airQualityLimit"])},
+    }
+
+    for section in street["sections"]:
+        yield {
+            **base_entities.key(f"section#{section['section_id']}"),
+            "street": {"S": street_id},
+            "defaultSpeedLimit": {"N": str(section["defaultSpeedLimit"])},
+        }
+
+
+def load_items(
+    dynamodb,
+    table_name: str,
+    streets: Iterable[dict],
+    workers: int = MAX_WORKERS,
+    checkpoint: Optional[Checkpoint] = None,
+    ttl: bool = True,
+) -> int:
+    """Writes the items of all streets to the table with parallel BatchWriteItem workers. At most
+    2 * workers requests are in flight, so memory does not grow with the size of the dataset.
+
+    :param dynamodb: The low-level DynamoDB client (clients are thread-safe, resources are not)
+    :param table_name: The name of the table
+    :param streets: The streets of the dataset
+    :param workers: The number of concurrent requests, defaults to MAX_WORKERS
+    :param checkpoint: Checkpoint to skip already loaded streets and record progress in,
+    defaults to None
+    :param ttl: True if image and measurement rows shall expire (see create_street_items),
+    defaults to True
+    :raises e: If something went wrong while writing to the table
+    :return: The number of written items
+    """
+
+    checkpoint = checkpoint or Checkpoint()
+    loaded_at = int(time.time())
+    written = 0
+    # chunks in submission order, to determine up to which street all rows have been written
+    in_flight: deque = deque()
+
+    def settle(street_index: int, block: bool):
+        nonlocal written
+        while in_flight and (block or in_flight[0][1].done()):
+            _, future = in_flight.popleft()
+            written += future.result()
+            block = False
+        # all streets before the oldest chunk in flight (or the current street) are complete
+        checkpoint.streets = in_flight[0][0] if in_flight else street_index
+        checkpoint.save()
+
+    def write_chunk(chunk: list[dict]) -> int:
+        dynamo_batch.batch_put_items(dynamodb, table_name, chunk)
+        return len(chunk)
+
+    street_count = checkpoint.streets
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for street_index, street in enumerate(streets):
+                if street_index < checkpoint.streets:
+                    continue
+                items = create_street_items(street, ttl, loaded_at)
+                while chunk := list(itertools.islice(items, dynamo_batch.BATCH_WRITE_SIZE)):
+                    if len(in_flight) >= 2 * workers:
+                        settle(street_index, block=True)
+                    in_flight.append((street_index, executor.submit(write_chunk, chunk)))
+                settle(street_index, block=False)
+                street_count = street_index + 1
+
+            # wait for remaining chunks
+            while in_flight:
+                settle(street_count, block=True)
+        except Exception as e:
+            logging.error(f"Error while loading street {checkpoint.streets}: {e}")
+            checkpoint.save(force=True)
+            raise e
+
+    checkpoint.streets = street_count
+    checkpoint.save(force=True)
+
+    return written
+
+
+def upload_images(
+    s3,
+    bucket_name: str,
+    images_dir: str,
+    workers: int = MAX_WORKERS,
+    checkpoint: Optional[Checkpoint] = None,
+) -> int:
+    """Uploads all images of a directory concurrently, the object key is the path relative to the
+    directory (e.g. "street_1/2023-12-18_17-55.png", as referenced by the image rows). At most
+    2 * workers uploads are in flight.
+
+    :param s3: The S3 client
+    :param bucket_name: The name of the bucket
+    :param images_dir: The directory containing the images
+    :param workers: The number of concurrent uploads, defaults to MAX_WORKERS
+    :param checkpoint: Checkpoint to skip already uploaded images and record progress in,
+    defaults to None
+    :raises e: If something went wrong while uploading
+    :return: The number of uploaded images
+    """
+
+    checkpoint = checkpoint or Checkpoint()
+    keys = (
+        os.path.relpath(os.path.join(directory, file_name), images_dir).replace(os.sep, "/")
+        for directory, _, file_names in os.walk(images_dir)
+        for file_name in sorted(file_names)
+    )
+    uploaded = 0
+    # uploads in flight by future, at most 2 * workers, so memory does not grow with the number of
+    # images
+    in_flight: dict = {}
+
+    def settle(block: bool):
+        nonlocal uploaded
+        done, _ = wait(in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = in_flight.pop(future)
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Error while uploading image {key}: {e}")
+                checkpoint.save(force=True)
+                raise e
+            checkpoint.add_image(key)
+            uploaded += 1
+        checkpoint.save()
+
+    # large files are split in parts, which are uploaded concurrently as well
+    config = TransferConfig(multipart_threshold=MULTIPART_THRESHOLD, max_concurrency=workers)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for key in keys:
+            if key in checkpoint.images:
+                continue
+            if len(in_flight) >= 2 * workers:
+                settle(block=True)
+            future = executor.submit(
+                s3.upload_file, os.path.join(images_dir, key), bucket_name, key, Config=config
+            )
+            in_flight[future] = key
+            settle(block=False)
+
+        # wait for remaining uploads
+        while in_flight:
+            settle(block=True)
+
+    checkpoint.save(force=True)
+
+    return uploaded
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Load a dataset into the table and bucket")
+    parser.add_argument("--table", required=True, help="name of the central DynamoDB table")
+    parser.add_argument("--bucket", required=True, help="name of the central S3 bucket")
+    parser.add_argument(
+        "--data",
+        default=os.path.join(root_dir, "data", "data.json"),
+        help="dataset file",
+    )
+    parser.add_argument(
+        "--images",
+        default=os.path.join(root_dir, "data", "images"),
+        help="images directory",
+    )
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="concurrent requests")
+    parser.add_argument("--checkpoint", help="file to store progress in and resume from")
+    parser.add_argument("--skip-items", action="store_true", help="do not load the dataset")
+    parser.add_argument("--skip-images", action="store_true", help="do not upload the images")
+    parser.add_argument(
+        "--no-ttl",
+        action="store_true",
+        help="keep image and measurement rows instead of expiring them",
+    )
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.checkpoint)
+
+    if not args.skip_images:
+        uploaded = upload_images(
+            boto3.client("s3"), args.bucket, args.images, args.workers, checkpoint
+        )
+        logging.info(f"Uploaded {uploaded} images")
+
+    if not args.skip_items:
+        dynamodb = boto3.client("dynamodb")
+        with open(args.data) as data_file:
+            written = load_items(
+                dynamodb,
+                args.table,
+                iter_streets(data_file),
+                args.workers,
+                checkpoint,
+                not args.no_ttl,
+            )
+        logging.info(f"Wrote {written} items of {checkpoint.streets} streets")
+
+        # warm Lambda containers drop their cached topology
+        version = metadata_cache.bump_topology_version(dynamodb, args.table)
+        logging.info(f"Topology version is now {version}")
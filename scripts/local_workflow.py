@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""Executes the workflow defined by MainStack locally, in a single process.
+
+The state machine definition is synthesised from MainStack, so the local run follows exactly the
+same graph (Task, Pass, Parallel and Map states with their paths, parameters, result selectors and
+max. concurrency). Task states call the handlers in build/*/*.py directly instead of invoking
+Lambda functions. Parallel branches and Map iterations run in thread pools. All handlers share a
+single process, i.e. module state (clients, caches) behaves like a single warm container per
+function.
+
+AWS services are not emulated here, start e.g. moto mocks before loading the handlers (see
+scripts/benchmark.py).
+
+Usage (as module): workflow = LocalWorkflow.from_stack(); workflow.run({})
+"""
+
+import copy
+import importlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+root_dir = os.path.join(os.path.dirname(__file__), "..")
+build_dir = os.path.join(root_dir, "build")
+
+# constants
+# key of a Lambda function reference within the resolved definition
+FUNCTION_REFERENCE = "function:{}"
+
+# path segments of a (reference) path, e.g. "$.a[0].b" -> "a", "0", "b"
+PATH_SEGMENT = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]")
+# intrinsic function call, e.g. "States.ArrayPartition($.ids, 50)"
+INTRINSIC_FUNCTION = re.compile(r"^(States\.[A-Za-z]+)\((.*)\)$")
+
+
+def add_build_paths():
+    """Makes Lambda functions and the shared layer importable by their module name (as within the
+    Lambda runtime, where layer content is extracted to /opt/python)"""
+
+    for function_dir in sorted(os.listdir(build_dir)):
+        if function_dir == "dependencies":
+            continue
+        layer_dir = os.path.join(build_dir, function_dir, "python")
+        path = layer_dir if os.path.isdir(layer_dir) else os.path.join(build_dir, function_dir)
+        path = os.path.abspath(path)
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+
+def load_handlers(module_names: list[str]) -> dict[str, Callable]:
+    """Imports the handlers of the given Lambda functions. Modules that have already been imported
+    are reloaded and shared clients are dropped, so clients are created again (e.g. within active
+    moto mocks).
+
+    :param module_names: The names of the handler modules, e.g. "get_images"
+    :return: A dictionary with module names as keys and handler functions as values
+    """
+
+    add_build_paths()
+    # shared clients are created again on first use as well
+    importlib.import_module("aws_clients").reset()
+    handlers = {}
+    for module_name in module_names:
+        if module_name in sys.modules:
+            module = importlib.reload(sys.modules[module_name])
+        else:
+            module = importlib.import_module(module_name)
+        handlers[module_name] = module.handler
+
+    return handlers
+
+
+def synthesize_definition(**stack_kwargs) -> tuple[dict, list[str]]:
+    """Synthesises MainStack and extracts the state machine definition
+
+    :param stack_kwargs: Arguments of MainStack, e.g. camera_batch_size
+    :return: A tuple containing the following values:
+    - the state machine definition, Lambda ARNs are replaced by FUNCTION_REFERENCE
+    - the names of the handler modules of all Lambda functions
+    """
+
+    import aws_cdk as cdk
+    from aws_cdk import assertions
+
+    sys.path.insert(0, os.path.abspath(root_dir))
+    from iac.main_stack import MainStack
+
+    app = cdk.App()
+    stack = MainStack(app, "MainStack", **stack_kwargs)
+    template = assertions.Template.from_stack(stack).to_json()
+
+    # map logical IDs of the functions to their handler modules ("{id}.handler")
+    modules = {
+        logical_id: resource["Properties"]["Handler"].rsplit(".", 1)[0]
+        for logical_id, resource in template["Resources"].items()
+        if resource["Type"] == "AWS::Lambda::Function"
+        and resource["Properties"].get("Handler", "").endswith(".handler")
+    }
+
+    # resolve the definition string, replacing function ARNs by references to the modules
+    state_machine = next(
+        resource
+        for resource in template["Resources"].values()
+        if resource["Type"] == "AWS::StepFunctions::StateMachine"
+    )
+    definition_string = state_machine["Properties"]["DefinitionString"]
+    if isinstance(definition_string, dict):
+        parts = []
+        for part in definition_string["Fn::Join"][1]:
+            if isinstance(part, dict):
+                part = FUNCTION_REFERENCE.format(modules[part["Fn::GetAtt"][0]])
+            parts.append(part)
+        definition_string = "".join(parts)
+
+    return json.loads(definition_string), sorted(set(modules.values()))
+
+
+def read_path(path: str, data, context: Optional[dict] = None):
+    """Evaluates a (reference) path, e.g. "$.cameraIds", "$[0].counts" or "$$.Map.Item.Value"
+
+    :param path: The path to evaluate
+    :param data: The data to apply the path to ("$")
+    :param context: The context object ("$$"), defaults to None
+    :raises ValueError: If the path is invalid
+    :return: The selected value
+    """
+
+    if path.startswith("$$"):
+        value, rest = context or {}, path[2:]
+    elif path.startswith("$"):
+        value, rest = data, path[1:]
+    else:
+        raise ValueError(f"Invalid path: {path}")
+
+    position = 0
+    while position < len(rest):
+        match = PATH_SEGMENT.match(rest, position)
+        if match is None:
+            raise ValueError(f"Invalid path: {path}")
+        field, index = match.groups()
+        value = value[field] if field is not None else value[int(index)]
+        position = match.end()
+
+    return value
+
+
+def write_path(path: Optional[str], data, result):
+    """Applies a ResultPath: inserts the result into (a copy of) the data
+
+    :param path: The result path, None to discard the result
+    :param data: The state input
+    :param result: The state result
+    :return: The state output
+    """
+
+    if path is None:
+        return data
+    if path == "$":
+        return result
+
+    output = copy.deepcopy(data)
+    segments = [field for field, _ in PATH_SEGMENT.findall(path[1:])]
+    target = output
+    for field in segments[:-1]:
+        target = target.setdefault(field, {})
+    target[segments[-1]] = result
+
+    return output
+
+
+def call_intrinsic_function(expression: str, data, context: Optional[dict] = None):
+    """Evaluates an intrinsic function, only those used by MainStack are supported
+
+    :param expression: The function call, e.g. "States.ArrayPartition($.ids, 50)"
+    :param data: The state input
+    :param context: The context object, defaults to None
+    :raises NotImplementedError: If the function is not supported
+    :return: The result of the function
+    """
+
+    name, arguments = INTRINSIC_FUNCTION.match(expression).groups()
+    arguments = [argument.strip() for argument in arguments.split(",")]
+    values = [
+        read_path(argument, data, context) if argument.startswith("$") else json.loads(argument)
+        for argument in arguments
+    ]
+
+    if name == "States.ArrayPartition":
+        array, size = values
+        return [array[i : i + size] for i in range(0, len(array), size)]
+    if name == "States.JsonMerge":
+        # shallow merge (deep merging is not supported by Step Functions either)
+        first, second, _ = values
+        return {**first, **second}
+    raise NotImplementedError(f"Intrinsic function {name} is not supported")
+
+
+def evaluate_parameters(template, data, context: Optional[dict] = None):
+    """Evaluates a payload template (Parameters, ResultSelector)
+
+    :param template: The template, keys ending with ".$" are evaluated as paths/intrinsic functions
+    :param data: The data to apply paths to
+    :param context: The context object, defaults to None
+    :return: The evaluated payload
+    """
+
+    if isinstance(template, list):
+        return [evaluate_parameters(value, data, context) for value in template]
+    if not isinstance(template, dict):
+        return template
+
+    payload = {}
+    for key, value in template.items():
+        if key.endswith(".$"):
+            if value.startswith("States."):
+                payload[key[:-2]] = call_intrinsic_function(value, data, context)
+            else:
+                payload[key[:-2]] = read_path(value, data, context)
+        else:
+            payload[key] = evaluate_parameters(value, data, context)
+
+    return payload
+
+
+class Metrics:
+    """Collects the latencies of all executed Task states and the metrics emitted by the
+    instrumented handlers (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.functions: dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, state_name: str, seconds: float):
+        with self._lock:
+            self.latencies[state_name].append(seconds)
+
+    def record_document(self, line: str):
+        """Sums up the metrics of an EMF document (see build/shared/python/instrumentation.py)
+        per function
+
+        :param line: The EMF document
+        """
+
+        document = json.loads(line)
+        names = [
+            metric["Name"]
+            for directive in document["_aws"]["CloudWatchMetrics"]
+            for metric in directive["Metrics"]
+        ]
+        with self._lock:
+            counters = self.functions[document["FunctionName"]]
+            for name in names:
+                counters[name] += document[name]
+
+    def clear(self):
+        with self._lock:
+            self.latencies.clear()
+            self.functions.clear()
+
+
+class LocalWorkflow:
+    def __init__(
+        self,
+        definition: dict,
+        handlers: dict[str, Callable],
+        metrics: Optional[Metrics] = None,
+    ):
+        """Executes a state machine definition locally
+
+        :param definition: The state machine definition (see synthesize_definition)
+        :param handlers: Handler modules as keys and handler functions as values
+        :param metrics: Collector for state latencies and handler metrics, defaults to a new
+        collector
+        """
+
+        self.definition = definition
+        self.handlers = handlers
+        self.metrics = metrics or Metrics()
+
+        # collect the metrics emitted by instrumented handlers instead of printing them
+        add_build_paths()
+        importlib.import_module("instrumentation").sink = self.metrics.record_document
+
+    @classmethod
+    def from_stack(cls, handlers: Optional[dict[str, Callable]] = None, **stack_kwargs):
+        """Creates a local workflow from MainStack, loading the handlers of all Lambda functions
+
+        :param handlers: Handlers that replace the handlers of specific functions (e.g. to fix the
+        prediction time), defaults to None
+        :param stack_kwargs: Arguments of MainStack, e.g. camera_batch_size
+        :return: The local workflow
+        """
+
+        definition, module_names = synthesize_definition(**stack_kwargs)
+        overrides = handlers or {}
+        loaded = load_handlers([name for name in module_names if name not in overrides])
+
+        return cls(definition, {**loaded, **overrides})
+
+    def run(self, execution_input=None):
+        """Executes the workflow
+
+        :param execution_input: The input of the execution, defaults to {}
+        :return: The output of the execution
+        """
+
+        return self.run_states(self.definition, {} if execution_input is None else execution_input)
+
+    def run_states(self, machine: dict, data, context: Optional[dict] = None):
+        """Executes the states of a state machine, branch or Map iterator
+
+        :param machine: The definition containing StartAt and States
+        :param data: The input
+        :param context: The context object, defaults to None
+        :return: The output of the last state
+        """
+
+        state_name = machine["StartAt"]
+        while True:
+            state = machine["States"][state_name]
+            data = self.run_state(state_name, state, data, context)
+            if state.get("End"):
+                return data
+            state_name = state["Next"]
+
+    def run_state(self, state_name: str, state: dict, data, context: Optional[dict] = None):
+        """Executes a single state
+
+        :param state_name: The name of the state
+        :param state: The definition of the state
+        :param data: The state input
+        :param context: The context object, defaults to None
+        :raises NotImplementedError: If the state type is not supported
+        :return: The state output
+        """
+
+        effective_input = read_path(state.get("InputPath", "$"), data, context)
+
+        if state["Type"] == "Task":
+            payload = effective_input
+            if "Parameters" in state:
+                payload = evaluate_parameters(state["Parameters"], effective_input, context)
+            handler = self.handlers[state["Resource"].replace(FUNCTION_REFERENCE.format(""), "")]
+            start = time.perf_counter()
+            result = handler(json.loads(json.dumps(payload)), None)
+            self.metrics.record(state_name, time.perf_counter() - start)
+            # results are passed as JSON, as between Lambda functions (e.g. int keys become str)
+            result = json.loads(json.dumps(result))
+        elif state["Type"] == "Pass":
+            result = effective_input
+            if "Parameters" in state:
+                result = evaluate_parameters(state["Parameters"], effective_input, context)
+            result = state.get("Result", result)
+        elif state["Type"] == "Parallel":
+            with ThreadPoolExecutor(max_workers=len(state["Branches"])) as executor:
+                result = list(
+                    executor.map(
+                        lambda branch: self.run_states(branch, effective_input, context),
+                        state["Branches"],
+                    )
+                )
+        elif state["Type"] == "Map":
+            result = self.run_map(state, effective_input, context)
+        else:
+            raise NotImplementedError(f"State type {state['Type']} is not supported")
+
+        if "ResultSelector" in state:
+            result = evaluate_parameters(state["ResultSelector"], result, context)
+        output = write_path(state.get("ResultPath", "$"), data, result)
+
+        return read_path(state.get("OutputPath", "$"), output, context)
+
+    def run_map(self, state: dict, data, context: Optional[dict] = None) -> list:
+        """Executes the iterations of a Map state, with at most MaxConcurrency in parallel
+
+        :param state: The definition of the Map state
+        :param data: The effective input of the state
+        :param context: The context object, defaults to None
+        :return: The outputs of all iterations (in the order of the items)
+        """
+
+        items = read_path(state.get("ItemsPath", "$"), data, context)
+        iterator = state.get("Iterator") or state["ItemProcessor"]
+        # MaxConcurrency 0 (default) means no limit, i.e. all iterations run in parallel
+        max_concurrency = state.get("MaxConcurrency", 0) or len(items)
+
+        def run_iteration(index: int):
+            iteration_context = {
+                **(context or {}),
+                "Map": {"Item": {"Index": index, "Value": items[index]}},
+            }
+            iteration_input = items[index]
+            if "Parameters" in state:
+                iteration_input = evaluate_parameters(state["Parameters"], data, iteration_context)
+            return self.run_states(iterator, iteration_input, iteration_context)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(items)))) as executor:
+            return list(executor.map(run_iteration, range(len(items))))
+
+
+if __name__ == "__main__":
+    # print the synthesised definition, e.g. to inspect it
+    definition, _ = synthesize_definition()
+    print(json.dumps(definition, indent=2))
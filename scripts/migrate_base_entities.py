@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Moves base entities (cameras, stations, streets, sections) to the sharded key layout
+("baseEntity#{shard}", see build/shared/python/base_entities.py).
+
+Source can either be the legacy unsharded partition "baseEntity" (default) or a sharded layout with
+a different number of shards (resharding). Rows are copied page by page, old rows are only deleted
+if requested. The topology version is incremented afterwards, so warm Lambda containers drop their
+cached topology.
+
+Usage: python scripts/migrate_base_entities.py --table <table name> [--shards n] [--from-shards m] [--delete]
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "build", "shared", "python"))
+
+import base_entities  # noqa: E402
+import dynamo_batch  # noqa: E402
+import metadata_cache  # noqa: E402
+
+# sort key of the only base entity row that is not sharded
+TOPOLOGY_VERSION_SORT_KEY = metadata_cache.TOPOLOGY_VERSION_KEY["SK"]["S"]
+
+
+def source_partition_keys(from_shards: int) -> list[str]:
+    """Determines the partition keys base entities are currently stored in
+
+    :param from_shards: The current number of shards, 0 for the legacy unsharded partition
+    :return: The partition keys to migrate rows from
+    """
+
+    if from_shards == 0:
+        return [base_entities.PARTITION_KEY_PREFIX]
+    return [f"{base_entities.PARTITION_KEY_PREFIX}#{shard}" for shard in range(from_shards)]
+
+
+def migrate_partition(
+    dynamodb, table_name: str, source_partition_key: str, num_shards: int, delete: bool
+) -> int:
+    """Copies all base entities of a single partition to their shard partition
+
+    :param dynamodb: The low-level DynamoDB client
+    :param table_name: The name of the table
+    :param source_partition_key: The partition key to migrate rows from
+    :param num_shards: The number of shards of the new layout
+    :param delete: True if migrated rows shall be deleted from the source partition
+    :return: The number of migrated rows
+    """
+
+    migrated = 0
+    last_evaluated_key = None
+    while True:
+        optional_params = {"ExclusiveStartKey": last_evaluated_key} if last_evaluated_key else {}
+        response = dynamodb.query(
+            TableName=table_name,
+            KeyConditionExpression="PK = :pk",
+            ExpressionAttributeValues={":pk": {"S": source_partition_key}},
+            **optional_params,
+        )
+
+        # determine rows that are not yet in the right partition
+        items = [
+            item
+            for item in response["Items"]
+            if item["SK"]["S"] != TOPOLOGY_VERSION_SORT_KEY
+            and base_entities.partition_key(item["SK"]["S"], num_shards) != source_partition_key
+        ]
+
+        # copy rows to their new partition first, to never lose a row if interrupted
+        dynamo_batch.batch_put_items(
+            dynamodb,
+            table_name,
+            [
+                {**item, "PK": {"S": base_entities.partition_key(item["SK"]["S"], num_shards)}}
+                for item in items
+            ],
+        )
+        if delete:
+            dynamo_batch.batch_write(
+                dynamodb,
+                table_name,
+                [
+                    {"DeleteRequest": {"Key": {"PK": item["PK"], "SK": item["SK"]}}}
+                    for item in items
+                ],
+            )
+        migrated += len(items)
+
+        last_evaluated_key = response.get("LastEvaluatedKey")
+        if last_evaluated_key is None:
+            return migrated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Move base entities to the sharded key layout")
+    parser.add_argument("--table", required=True, help="name of the central DynamoDB table")
+    parser.add_argument(
+        "--shards", type=int, default=base_entities.NUM_SHARDS, help="number of shards to use"
+    )
+    parser.add_argument(
+        "--from-shards",
+        type=int,
+        default=0,
+        help="current number of shards (0 = legacy unsharded 'baseEntity' partition)",
+    )
+    parser.add_argument(
+        "--delete", action="store_true", help="delete rows from their old partition"
+    )
+    args = parser.parse_args()
+    if args.from_shards > 0 and not args.delete:
+        # rows left in their old shard would be listed twice
+        parser.error("--delete is required when resharding (--from-shards > 0)")
+
+    dynamodb = boto3.client("dynamodb")
+    for source_partition_key in source_partition_keys(args.from_shards):
+        migrated = migrate_partition(
+            dynamodb, args.table, source_partition_key, args.shards, args.delete
+        )
+        logging.info(f"Migrated {migrated} rows from partition {source_partition_key}")
+
+    version = metadata_cache.bump_topology_version(dynamodb, args.table)
+    logging.info(f"Topology version is now {version}")
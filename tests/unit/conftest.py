@@ -0,0 +1,29 @@
+import os
+import sys
+
+# environment expected by the Lambda functions at import time
+os.environ.setdefault("DB_NAME", "central_table")
+os.environ.setdefault("BUCKET_NAME", "central_bucket")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+
+# make Lambda functions and the shared layer importable by their module name (as within the
+# Lambda runtime, where layer content is extracted to /opt/python)
+build_dir = os.path.join(os.path.dirname(__file__), "..", "..", "build")
+# third-party packages of the dependencies layer are installed in the virtual environment instead
+# (see requirements-dev.txt), as the layer contains packages built for the Lambda platform
+for function_dir in sorted(os.listdir(build_dir)):
+    if function_dir == "dependencies":
+        continue
+    layer_dir = os.path.join(build_dir, function_dir, "python")
+    if os.path.isdir(layer_dir):
+        sys.path.insert(0, os.path.abspath(layer_dir))
+    else:
+        sys.path.insert(0, os.path.abspath(os.path.join(build_dir, function_dir)))
+
+# make scripts and the data generator importable by their module name (e.g. local_workflow)
+for scripts_dir in ("scripts", "data"):
+    sys.path.insert(
+        0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", scripts_dir))
+    )
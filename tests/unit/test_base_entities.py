@@ -0,0 +1,35 @@
+import base_entities
+
+
+class FakeDynamoDB:
+    """Serves query pages per partition (Stubber requires a fixed call order, threads do not)"""
+
+    def __init__(self, pages: dict[str, list[list[str]]]):
+        self.pages = pages
+
+    def query(self, ExpressionAttributeValues, ExclusiveStartKey=None, **kwargs):
+        pages = self.pages.get(ExpressionAttributeValues[":pk"]["S"], [[]])
+        page = ExclusiveStartKey["page"] if ExclusiveStartKey else 0
+        prefix = ExpressionAttributeValues[":prefix"]["S"]
+        response = {"Items": [{"SK": {"S": sk}} for sk in pages[page] if sk.startswith(prefix)]}
+        if page + 1 < len(pages):
+            response["LastEvaluatedKey"] = {"page": page + 1}
+        return response
+
+
+def test_partition_key_is_stable_and_within_shard_range():
+    partition_keys = {base_entities.partition_key(f"camera#{i}", 4) for i in range(100)}
+
+    assert partition_keys == {f"baseEntity#{shard}" for shard in range(4)}
+    assert base_entities.partition_key("camera#1", 4) == base_entities.partition_key("camera#1", 4)
+
+
+def test_list_ids_merges_all_shards_and_pages():
+    dynamodb = FakeDynamoDB(
+        {
+            "baseEntity#0": [["camera#c", "street#s"], ["camera#a"]],
+            "baseEntity#2": [["camera#b"]],
+        }
+    )
+
+    assert base_entities.list_ids(dynamodb, "central_table", "camera", 3) == ["a", "b", "c"]
@@ -0,0 +1,95 @@
+import change_tracking
+import metadata_cache
+
+
+class FakeDynamoDB:
+    """Serves items of an in-memory table (Stubber requires a fixed call order, threads do not)"""
+
+    def __init__(self, items: list[dict]):
+        self.items = {(item["PK"]["S"], item["SK"]["S"]): item for item in items}
+
+    def batch_get_item(self, RequestItems):
+        ((table_name, request),) = RequestItems.items()
+        keys = [(key["PK"]["S"], key["SK"]["S"]) for key in request["Keys"]]
+        return {"Responses": {table_name: [self.items[k] for k in keys if k in self.items]}}
+
+    def query(self, ExpressionAttributeValues, ScanIndexForward=True, Limit=None, **kwargs):
+        values = {name: value["S"] for name, value in ExpressionAttributeValues.items()}
+        items = sorted(
+            (
+                item
+                for (pk, sk), item in self.items.items()
+                if pk == values[":pk"] and values[":earliest"] <= sk <= values[":latest"]
+            ),
+            key=lambda item: item["SK"]["S"],
+            reverse=not ScanIndexForward,
+        )
+        return {"Items": items[:Limit]}
+
+
+def test_cameras_with_new_images_or_expired_results_are_dirty():
+    dynamodb = FakeDynamoDB(
+        [
+            # processed, no new image
+            change_tracking.create_item("camera", "c1", 1000, 900),
+            change_tracking.create_received_item("camera", "c1", 900),
+            # processed, new image
+            change_tracking.create_item("camera", "c2", 1000, 900),
+            change_tracking.create_received_item("camera", "c2", 950),
+            # results too old to carry forward
+            change_tracking.create_item("camera", "c3", 1000 - change_tracking.MAX_RESULT_AGE, 900),
+            # c4 has never been processed
+            # processed, never received data
+            change_tracking.create_item("camera", "c5", 1000),
+        ]
+    )
+
+    dirty_ids = change_tracking.get_dirty_data_ids(
+        dynamodb, "central_table", "camera", ["c1", "c2", "c3", "c4", "c5"], 1060
+    )
+
+    assert dirty_ids == ["c2", "c3", "c4"]
+
+
+def test_dirtiness_propagates_to_dependent_streets():
+    metadata_cache.cache.clear()
+    dynamodb = FakeDynamoDB(
+        [
+            {
+                "PK": {"S": change_tracking.base_entities.partition_key(f"street#{street_id}")},
+                "SK": {"S": f"street#{street_id}"},
+                "cameras": {"L": [{"S": camera_id}]},
+                "station": {"S": "st1"},
+            }
+            for street_id, camera_id in [("s1", "c1"), ("s2", "c2")]
+        ]
+        + [change_tracking.create_item("street", street_id, 1000) for street_id in ["s1", "s2"]]
+    )
+
+    dirty_ids = change_tracking.get_dirty_dependent_ids(
+        dynamodb,
+        "central_table",
+        "street",
+        ["s1", "s2"],
+        {"cameras": "camera", "station": "station"},
+        {"camera#c2"},
+        1060,
+    )
+
+    assert dirty_ids == ["s2"]
+
+
+def test_results_of_clean_entities_are_carried_forward():
+    dynamodb = FakeDynamoDB(
+        [
+            {"PK": {"S": "camera#c1"}, "SK": {"S": "trafficCount#1060"}},
+            {"PK": {"S": "camera#c2"}, "SK": {"S": "trafficCount#1000"}},
+            {"PK": {"S": "camera#c2"}, "SK": {"S": "trafficCount#940"}},
+        ]
+    )
+
+    items = change_tracking.get_results(
+        dynamodb, "central_table", ["camera#c1", "camera#c2"], "trafficCount", 1060, "PK, SK"
+    )
+
+    assert sorted(item["SK"]["S"] for item in items) == ["trafficCount#1000", "trafficCount#1060"]
@@ -0,0 +1,105 @@
+import pytest
+from botocore.stub import Stubber
+
+import check_limits
+import metadata_cache
+import retention
+
+
+@pytest.fixture
+def stubber():
+    metadata_cache.cache.clear()
+    with Stubber(check_limits.dynamodb) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_check_streets_skips_streets_without_data(stubber):
+    table = check_limits.table_name
+    stubber.add_response(
+        "batch_get_item",
+        {
+            "Responses": {
+                table: [
+                    {
+                        "SK": {"S": "street#s1"},
+                        "cameras": {"L": [{"S": "c1"}, {"S": "c2"}]},
+                        "station": {"S": "st1"},
+                        "trafficCapacity": {"N": "10"},
+                        "airQualityLimit": {"N": "0.5"},
+                    }
+                ]
+            }
+        },
+    )
+    stubber.add_response(
+        "batch_get_item",
+        {
+            "Responses": {
+                table: [
+                    {
+                        "PK": {"S": "camera#c1"},
+                        "carCountPrediction": {"N": "5"},
+                        "emergencyVehicleCount": {"N": "0"},
+                    },
+                    {
+                        "PK": {"S": "camera#c2"},
+                        "carCountPrediction": {"N": "10"},
+                        "emergencyVehicleCount": {"N": "1"},
+                    },
+                ]
+            }
+        },
+    )
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {table: [{"PK": {"S": "station#st1"}, "airQuality": {"N": "0.75"}}]}},
+    )
+    stubber.add_response(
+        "batch_write_item",
+        {},
+        {
+            "RequestItems": {
+                table: [
+                    {
+                        "PutRequest": {
+                            "Item": {
+                                "PK": {"S": "street#s1"},
+                                "SK": {"S": "info#100"},
+                                "trafficLoad": {"N": "0.75"},
+                                "emergencyVehiclesActive": {"BOOL": True},
+                                "airQualityLoad": {"N": "0.5"},
+                                "expiresAt": {"N": str(100 + retention.RETENTION["info"])},
+                            }
+                        }
+                    },
+                    {
+                        "PutRequest": {
+                            "Item": {
+                                "PK": {"S": "street#s1"},
+                                "SK": {"S": "changes"},
+                                "processedFor": {"N": "100"},
+                            }
+                        }
+                    },
+                ]
+            }
+        },
+    )
+
+    skipped_street_ids = check_limits.check_streets(["s1", "s2"], 100)
+
+    assert skipped_street_ids == ["s2"]
+
+
+def test_skipped_streets_are_logged_and_returned_to_workflow(monkeypatch, caplog):
+    monkeypatch.setattr(check_limits.metadata_cache.cache, "check_version", lambda *args: False)
+    monkeypatch.setattr(check_limits, "check_streets", lambda street_ids, predict_for: ["s2"])
+
+    result = check_limits.handler({"streetIds": ["s1", "s2"], "predictFor": 100}, None)
+
+    assert result == {"skippedStreetIds": ["s2"]}
+    assert any(
+        record.levelname == "WARNING" and "['s2']" in record.getMessage()
+        for record in caplog.records
+    )
@@ -0,0 +1,152 @@
+import boto3
+import pytest
+
+import retention
+
+moto = pytest.importorskip("moto")
+
+import compact_time_series  # noqa: E402
+import predict_air_quality  # noqa: E402
+
+DAY = 1_700_006_400  # start of a day (UTC)
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with moto.mock_dynamodb():
+        client = boto3.client("dynamodb")
+        client.create_table(
+            TableName="central_table",
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        # clients of the modules are created before the mock
+        monkeypatch.setattr(compact_time_series, "dynamodb", client)
+        monkeypatch.setattr(compact_time_series, "table_name", "central_table")
+        monkeypatch.setattr(predict_air_quality, "dynamodb", client)
+        monkeypatch.setattr(predict_air_quality, "table_name", "central_table")
+        yield client
+
+
+def put_measurements(dynamodb, measurements: dict[int, float]):
+    for timestamp, air_quality in measurements.items():
+        dynamodb.put_item(
+            TableName="central_table",
+            Item={
+                "PK": {"S": "station#st1"},
+                "SK": {"S": f"measurement#{timestamp}"},
+                "airQuality": {"N": str(air_quality)},
+            },
+        )
+
+
+def test_measurements_are_rolled_up_into_hourly_and_daily_aggregates(dynamodb):
+    # one measurement every 10 minutes during the last 2 hours of a day and the first hour of the
+    # next day
+    start = DAY + 22 * 3600
+    put_measurements(dynamodb, {start + 600 * i: i / 100 for i in range(18)})
+
+    compact_time_series.handler(
+        {"cameraIds": [], "stationIds": ["st1"], "compactUntil": DAY + 86400 + 3600 + 60}, None
+    )
+
+    hourly = retention.get_aggregates(
+        dynamodb, "central_table", "station#st1", "hourly", start, start + 3 * 3600
+    )
+    daily = retention.get_aggregates(
+        dynamodb, "central_table", "station#st1", "daily", DAY, DAY + 86400
+    )
+    assert hourly[start][:4] == pytest.approx((6, 0.15, 0.0, 0.05))
+    assert hourly[start + 7200].count == 6
+    assert list(daily) == [DAY]
+    assert daily[DAY][:4] == pytest.approx((12, 0.66, 0.0, 0.11))
+
+    # a rebuilt regression state reads the aggregate of the compacted hour within the window
+    # instead of its rows, and the rows of the remaining parts of the window
+    predict_for = start + 3 * 3600 + 1800
+    put_measurements(dynamodb, {predict_for - 60: 0.2})
+    state = predict_air_quality.rebuild_regression_state("st1", predict_for - 7200, predict_for)
+    assert sum(stats[0] for stats in state.buckets.values()) == 3 + 6 + 1
+    assert state.watermark == predict_for - 60
+
+
+def get_progress_row(dynamodb, partition_key: str):
+    return dynamodb.get_item(
+        TableName="central_table", Key={"PK": {"S": partition_key}, "SK": {"S": "rollup"}}
+    ).get("Item")
+
+
+def test_hours_with_images_not_analysed_yet_are_compacted_later(dynamodb):
+    # images every 20 minutes over 3 hours, the first image of the 3rd hour is not analysed yet
+    start = DAY + 10 * 3600
+    for i in range(9):
+        item = {"PK": {"S": "camera#c1"}, "SK": {"S": f"image#{start + 1200 * i}"}}
+        if i != 6:
+            item["carCount"] = {"N": "10"}
+        dynamodb.put_item(TableName="central_table", Item=item)
+    event = {"cameraIds": ["c1"], "stationIds": [], "compactUntil": start + 3 * 3600 + 60}
+
+    compact_time_series.handler(event, None)
+    progress = get_progress_row(dynamodb, "camera#c1")
+    hourly = retention.get_aggregates(
+        dynamodb, "central_table", "camera#c1", "hourly", start, start + 3 * 3600
+    )
+    assert list(hourly) == [start, start + 3600]
+    assert progress["hourlyUntil"]["N"] == str(start + 7200)
+
+    # the next run includes the late car count in the aggregate of its hour
+    dynamodb.put_item(
+        TableName="central_table",
+        Item={
+            "PK": {"S": "camera#c1"},
+            "SK": {"S": f"image#{start + 7200}"},
+            "carCount": {"N": "4"},
+        },
+    )
+    compact_time_series.handler(event, None)
+    hourly = retention.get_aggregates(
+        dynamodb, "central_table", "camera#c1", "hourly", start, start + 3 * 3600
+    )
+    assert list(hourly) == [start, start + 3600, start + 7200]
+    assert hourly[start + 7200][:2] == (3, 24.0)
+
+
+def test_images_too_old_to_be_analysed_do_not_hold_compaction_back(dynamodb):
+    start = DAY + 10 * 3600
+    dynamodb.put_item(
+        TableName="central_table",
+        Item={"PK": {"S": "camera#c1"}, "SK": {"S": f"image#{start}"}},
+    )
+
+    compact_time_series.handler(
+        {"cameraIds": ["c1"], "stationIds": [], "compactUntil": start + 5 * 3600}, None
+    )
+
+    progress = get_progress_row(dynamodb, "camera#c1")
+    assert progress["hourlyUntil"]["N"] == str(start + 5 * 3600)
+
+
+def test_compacted_series_are_kept_if_another_series_fails(dynamodb, monkeypatch):
+    put_measurements(dynamodb, {DAY + 600: 0.1})
+    get_raw_values = compact_time_series.get_raw_values
+
+    def fail_for_st2(partition_key, *args):
+        if partition_key == "station#st2":
+            raise RuntimeError("timeout")
+        return get_raw_values(partition_key, *args)
+
+    monkeypatch.setattr(compact_time_series, "get_raw_values", fail_for_st2)
+    with pytest.raises(RuntimeError):
+        compact_time_series.handler(
+            {"cameraIds": [], "stationIds": ["st1", "st2"], "compactUntil": DAY + 3600}, None
+        )
+
+    assert get_progress_row(dynamodb, "station#st1")["hourlyUntil"]["N"] == str(DAY + 3600)
+    assert get_progress_row(dynamodb, "station#st2") is None
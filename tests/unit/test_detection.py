@@ -0,0 +1,175 @@
+import io
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+import detection
+
+
+def test_images_are_analysed_once_across_memory_and_table_layers():
+    dynamodb = boto3.client("dynamodb")
+    s3 = boto3.client("s3")
+    detector = detection.StubDetector()
+    cache = detection.DetectionCache(dynamodb, s3, "central_table", "central_bucket", detector)
+    image = b"image content"
+
+    with Stubber(dynamodb) as dynamodb_stubber, Stubber(s3) as s3_stubber:
+        # image 1 has been analysed before (table layer), image 2 is new
+        dynamodb_stubber.add_response(
+            "batch_get_item",
+            {
+                "Responses": {
+                    "central_table": [
+                        {
+                            "SK": {"S": "image#1"},
+                            "carCount": {"N": "7"},
+                            "emergencyVehicleCount": {"N": "1"},
+                            "detectionETag": {"S": '"etag-1"'},
+                        }
+                    ]
+                }
+            },
+        )
+        # image 2 is claimed before it is analysed
+        dynamodb_stubber.add_response(
+            "update_item",
+            {},
+            {
+                "TableName": "central_table",
+                "Key": {"PK": {"S": "camera#c1"}, "SK": {"S": "image#2"}},
+                "UpdateExpression": "SET detectionClaimedUntil = :until",
+                "ConditionExpression": ANY,
+                "ExpressionAttributeValues": ANY,
+                "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+            },
+        )
+        s3_stubber.add_response(
+            "get_object",
+            {"Body": StreamingBody(io.BytesIO(image), len(image)), "ETag": '"etag-2"'},
+            {"Bucket": "central_bucket", "Key": "c1/2.png"},
+        )
+        dynamodb_stubber.add_response(
+            "update_item",
+            {},
+            {
+                "TableName": "central_table",
+                "Key": {"PK": {"S": "camera#c1"}, "SK": {"S": "image#2"}},
+                "UpdateExpression": ANY,
+                "ConditionExpression": "attribute_exists(PK)",
+                "ExpressionAttributeValues": ANY,
+            },
+        )
+
+        detections = cache.get_detections("c1", {1: "c1/1.png", 2: "c1/2.png"})
+
+        assert detections[1] == detection.Detection(7, 1)
+        assert detections[2] == detection.StubDetector().detect(image)
+        assert detector.calls == 1
+
+        # both images are now served from memory without any request
+        assert cache.get_detections("c1", {1: "c1/1.png", 2: "c1/2.png"}) == detections
+        dynamodb_stubber.assert_no_pending_responses()
+        s3_stubber.assert_no_pending_responses()
+
+
+class SlowDetector(detection.StubDetector):
+    def detect(self, image: bytes) -> detection.Detection:
+        time.sleep(0.3)
+        return super().detect(image)
+
+
+def create_table_and_bucket():
+    dynamodb = boto3.client("dynamodb")
+    dynamodb.create_table(
+        TableName="central_table",
+        KeySchema=[
+            {"AttributeName": "PK", "KeyType": "HASH"},
+            {"AttributeName": "SK", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "PK", "AttributeType": "S"},
+            {"AttributeName": "SK", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    s3 = boto3.client("s3")
+    s3.create_bucket(Bucket="central_bucket")
+    s3.put_object(Bucket="central_bucket", Key="c1/1.png", Body=b"image content")
+    return dynamodb, s3
+
+
+def test_image_is_analysed_once_by_concurrent_invocations():
+    moto = pytest.importorskip("moto")
+
+    with moto.mock_dynamodb(), moto.mock_s3():
+        dynamodb, s3 = create_table_and_bucket()
+        dynamodb.put_item(
+            TableName="central_table",
+            Item={"PK": {"S": "camera#c1"}, "SK": {"S": "image#1"}, "imageKey": {"S": "c1/1.png"}},
+        )
+
+        # e.g. count_cars and count_emergency_vehicles (separate containers) in parallel branches
+        detector = SlowDetector()
+        caches = [
+            detection.DetectionCache(dynamodb, s3, "central_table", "central_bucket", detector)
+            for _ in range(2)
+        ]
+        results = [None, None]
+
+        def get_detections(index: int):
+            results[index] = caches[index].get_detections("c1", {1: "c1/1.png"})
+
+        threads = [threading.Thread(target=get_detections, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert detector.calls == 1
+    assert results[0] == results[1] == {1: detection.StubDetector().detect(b"image content")}
+
+
+def test_images_without_row_are_analysed_without_creating_one():
+    moto = pytest.importorskip("moto")
+
+    with moto.mock_dynamodb(), moto.mock_s3():
+        dynamodb, s3 = create_table_and_bucket()
+        detector = detection.StubDetector()
+        cache = detection.DetectionCache(dynamodb, s3, "central_table", "central_bucket", detector)
+
+        # e.g. the image row expired after the image list had been read
+        detections = cache.get_detections("c1", {1: "c1/1.png"})
+        items = dynamodb.scan(TableName="central_table")["Items"]
+
+    assert detections == {1: detection.StubDetector().detect(b"image content")}
+    assert detector.calls == 1
+    assert items == []
+
+
+def test_memory_layer_is_safe_to_share_between_threads():
+    cache = detection.DetectionCache(
+        None, None, "central_table", "central_bucket", None, max_size=8
+    )
+    errors = []
+
+    def use_cache(offset: int):
+        try:
+            for i in range(2000):
+                image_key = f"c1/{(i + offset) % 16}.png"
+                cache._remember(image_key, "etag", detection.Detection(i, 0))
+                cache._recall(image_key)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=use_cache, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(cache._memory) == 8
@@ -0,0 +1,175 @@
+import boto3
+import pytest
+
+import base_entities
+import display_state
+import metadata_cache
+
+moto = pytest.importorskip("moto")
+
+import determine_info  # noqa: E402
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    metadata_cache.cache.clear()
+    with moto.mock_dynamodb():
+        client = boto3.client("dynamodb")
+        client.create_table(
+            TableName="central_table",
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        # the client of the module is created before the mock
+        monkeypatch.setattr(determine_info, "dynamodb", client)
+        monkeypatch.setattr(determine_info, "table_name", "central_table")
+        yield client
+
+
+def put_street(dynamodb, street_id: str, section_ids: list[str], predict_for: int, **info):
+    for section_id in section_ids:
+        dynamodb.put_item(
+            TableName="central_table",
+            Item={
+                **base_entities.key(f"section#{section_id}"),
+                "street": {"S": street_id},
+                "defaultSpeedLimit": {"N": "50"},
+            },
+        )
+    dynamodb.put_item(
+        TableName="central_table",
+        Item={
+            "PK": {"S": f"street#{street_id}"},
+            "SK": {"S": f"info#{predict_for}"},
+            "trafficLoad": {"N": str(info.get("traffic_load", 0.5))},
+            "emergencyVehiclesActive": {"BOOL": info.get("emergency_vehicles_active", False)},
+            "airQualityLoad": {"N": str(info.get("air_quality_load", 0.5))},
+        },
+    )
+
+
+def get_history(dynamodb, section_id: str) -> list[str]:
+    response = dynamodb.query(
+        TableName="central_table",
+        KeyConditionExpression="PK = :pk",
+        ExpressionAttributeValues={":pk": {"S": f"section#{section_id}"}},
+    )
+    return [item["SK"]["S"] for item in response["Items"]]
+
+
+def test_display_is_reduced_by_the_strictest_rule():
+    assert determine_info.determine_display(50, 0.5, False, 0.5) == display_state.Display(50, "")
+    assert determine_info.determine_display(100, 0.5, False, 1.2) == display_state.Display(
+        80, "Air quality limit exceeded"
+    )
+    assert determine_info.determine_display(50, 0.9, False, 1.2) == display_state.Display(
+        30, "Traffic jam, Air quality limit exceeded"
+    )
+
+
+def test_only_changed_sections_are_written(dynamodb):
+    put_street(dynamodb, "s1", ["a", "b"], 100)
+    put_street(dynamodb, "s2", ["c"], 100)
+
+    determine_info.handler({"sectionIds": ["a", "b", "c"], "predictFor": 100}, None)
+
+    assert display_state.get_display_state(dynamodb, "central_table", 1) == {
+        "a": display_state.Display(50, ""),
+        "b": display_state.Display(50, ""),
+        "c": display_state.Display(50, ""),
+    }
+
+    # traffic jam on s1, unchanged info of s2 is carried forward
+    put_street(dynamodb, "s1", ["a", "b"], 400, traffic_load=0.9)
+    changes = determine_info.determine_infos(["a", "b", "c"], 400, 1)
+
+    assert changes == {
+        "a": display_state.Display(30, "Traffic jam"),
+        "b": display_state.Display(30, "Traffic jam"),
+    }
+    assert get_history(dynamodb, "a") == ["info#100", "info#400"]
+    assert get_history(dynamodb, "c") == ["info#100"]
+    assert display_state.get_display_state(dynamodb, "central_table", 1)["c"] == (50, "")
+
+
+def test_outdated_changes_do_not_overwrite_newer_display_state(dynamodb):
+    display_state.put_changes(
+        dynamodb, "central_table", 1, {"a": display_state.Display(30, "x")}, 400
+    )
+    display_state.put_changes(
+        dynamodb, "central_table", 1, {"a": display_state.Display(50, "")}, 100
+    )
+
+    assert display_state.get_display_state(dynamodb, "central_table", 1) == {
+        "a": display_state.Display(30, "x")
+    }
+
+
+def section_ids_of_shard(shard: int, count: int, num_shards: int = 8) -> list[str]:
+    candidates = (f"section{i}" for i in range(100000))
+    return [id for id in candidates if display_state.shard_of(id, num_shards) == shard][:count]
+
+
+def test_outdated_changes_are_skipped_per_section(dynamodb):
+    a, b = section_ids_of_shard(0, 2)
+    display_state.put_changes(
+        dynamodb, "central_table", 8, {a: display_state.Display(30, "x")}, 400
+    )
+    # an older run of the same shard: its change of b is still the latest one
+    display_state.put_changes(
+        dynamodb,
+        "central_table",
+        8,
+        {a: display_state.Display(50, ""), b: display_state.Display(70, "y")},
+        100,
+    )
+
+    assert display_state.get_display_state(dynamodb, "central_table", 8) == {
+        a: display_state.Display(30, "x"),
+        b: display_state.Display(70, "y"),
+    }
+
+
+def test_many_changes_of_one_shard_are_split_into_requests(dynamodb):
+    section_ids = section_ids_of_shard(3, 2 * display_state.MAX_SECTIONS_PER_UPDATE + 1)
+    changes = {section_id: display_state.Display(30, "") for section_id in section_ids}
+
+    display_state.put_changes(dynamodb, "central_table", 8, changes, 100)
+
+    assert display_state.get_display_state(dynamodb, "central_table", 8, [3]) == changes
+
+
+def test_number_of_shards_grows_with_number_of_sections():
+    assert display_state.num_shards(0) == 1
+    assert display_state.num_shards(display_state.MAX_SECTIONS_PER_SHARD) == 1
+    assert display_state.num_shards(display_state.MAX_SECTIONS_PER_SHARD + 1) == 2
+    assert display_state.num_shards(3 * display_state.MAX_SECTIONS_PER_SHARD) == 4
+    # ~130k sections no longer fit into 16 items of 400KB
+    assert display_state.num_shards(130000) == 512
+
+
+def test_shard_items_have_partitions_of_their_own():
+    assert {display_state.key(4, shard)["PK"]["S"] for shard in range(4)} == {
+        "display#4#0",
+        "display#4#1",
+        "display#4#2",
+        "display#4#3",
+    }
+
+
+def test_sections_are_written_again_if_the_number_of_shards_changed(dynamodb):
+    put_street(dynamodb, "s1", ["a", "b"], 100)
+    determine_info.determine_infos(["a", "b"], 100, 1)
+
+    # the display state of the previous shard count is not read
+    changes = determine_info.determine_infos(["a", "b"], 100, 2)
+
+    assert changes.keys() == {"a", "b"}
+    assert display_state.get_display_state(dynamodb, "central_table", 2) == changes
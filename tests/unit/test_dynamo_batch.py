@@ -0,0 +1,92 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+import dynamo_batch
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    monkeypatch.setattr(dynamo_batch, "BATCH_RETRY_BASE_DELAY", 0.0)
+    return boto3.client("dynamodb")
+
+
+@pytest.fixture
+def stubber(dynamodb):
+    with Stubber(dynamodb) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_batch_get_items_chunks_and_retries_unprocessed_keys(dynamodb, stubber):
+    table = "central_table"
+    keys = [{"PK": {"S": "baseEntity"}, "SK": {"S": f"street#{i}"}} for i in range(150)]
+    projection = "SK"
+
+    # first chunk: one key unprocessed and retried afterwards
+    stubber.add_response(
+        "batch_get_item",
+        {
+            "Responses": {table: [{"SK": k["SK"]} for k in keys[:99]]},
+            "UnprocessedKeys": {table: {"Keys": keys[99:100], "ProjectionExpression": projection}},
+        },
+        {
+            "RequestItems": {
+                table: {
+                    "Keys": keys[:100],
+                    "ProjectionExpression": projection,
+                    "ConsistentRead": False,
+                }
+            }
+        },
+    )
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {table: [{"SK": keys[99]["SK"]}]}},
+        {"RequestItems": {table: {"Keys": keys[99:100], "ProjectionExpression": projection}}},
+    )
+    # second chunk
+    stubber.add_response(
+        "batch_get_item",
+        {"Responses": {table: [{"SK": k["SK"]} for k in keys[100:]]}},
+        {
+            "RequestItems": {
+                table: {
+                    "Keys": keys[100:],
+                    "ProjectionExpression": projection,
+                    "ConsistentRead": False,
+                }
+            }
+        },
+    )
+
+    items = dynamo_batch.batch_get_items(dynamodb, table, keys, projection)
+
+    assert sorted(item["SK"]["S"] for item in items) == sorted(k["SK"]["S"] for k in keys)
+
+
+def test_batch_put_items_gives_up_after_max_retries(dynamodb, stubber, monkeypatch):
+    monkeypatch.setattr(dynamo_batch, "MAX_BATCH_RETRIES", 1)
+    table = "central_table"
+    item = {"PK": {"S": "street#1"}, "SK": {"S": "info#0"}}
+    request = {table: [{"PutRequest": {"Item": item}}]}
+    for _ in range(2):
+        stubber.add_response(
+            "batch_write_item", {"UnprocessedItems": request}, {"RequestItems": request}
+        )
+
+    with pytest.raises(RuntimeError):
+        dynamo_batch.batch_put_items(dynamodb, table, [item])
+
+
+def test_batch_write_retries_throttled_requests(dynamodb, stubber):
+    table = "central_table"
+    request = {table: [{"PutRequest": {"Item": {"PK": {"S": "street#1"}, "SK": {"S": "info#0"}}}}]}
+    stubber.add_client_error(
+        "batch_write_item",
+        "ProvisionedThroughputExceededException",
+        expected_params={"RequestItems": request},
+    )
+    stubber.add_response("batch_write_item", {}, {"RequestItems": request})
+
+    dynamo_batch.batch_write(dynamodb, table, request[table])
@@ -0,0 +1,59 @@
+import timeit
+
+import pytest
+from boto3.dynamodb.types import TypeDeserializer
+
+import dynamo_codec
+
+
+def test_items_are_deserialized_like_type_deserializer():
+    item = {
+        "PK": {"S": "camera#c1"},
+        "count": {"N": "5"},
+        "load": {"N": "0.75"},
+        "large": {"N": "1E+3"},
+        "cameras": {"L": [{"S": "c1"}, {"N": "2"}]},
+        "display": {"M": {"speedLimit": {"N": "30"}, "text": {"S": "Traffic jam"}}},
+        "active": {"BOOL": True},
+        "tags": {"SS": ["a", "b"]},
+        "ids": {"NS": ["1", "2.5"]},
+        "nothing": {"NULL": True},
+        "data": {"B": b"\x00"},
+    }
+
+    expected = {k: TypeDeserializer().deserialize(v) for k, v in item.items()}
+    deserialized = dynamo_codec.deserialize_item(item)
+
+    assert deserialized == expected
+    assert isinstance(deserialized["count"], int) and isinstance(deserialized["load"], float)
+
+
+def test_unknown_types_are_rejected():
+    with pytest.raises(TypeError):
+        dynamo_codec.deserialize({"X": "?"})
+
+
+def test_items_are_deserialized_faster_than_with_type_deserializer():
+    item = {
+        "PK": {"S": "camera#c1"},
+        "SK": {"S": "data#1702922400"},
+        "cars": {"N": "12"},
+        "load": {"N": "0.75"},
+        "display": {"M": {"speedLimit": {"N": "30"}, "text": {"S": "Traffic jam"}}},
+        "active": {"BOOL": False},
+    }
+    items = [item] * 2000
+    deserializer = TypeDeserializer()
+
+    def with_type_deserializer():
+        return [{k: deserializer.deserialize(v) for k, v in item.items()} for item in items]
+
+    def with_codec():
+        return [dynamo_codec.deserialize_item(item) for item in items]
+
+    # best of several runs, to not depend on the machine being idle
+    baseline = min(timeit.repeat(with_type_deserializer, number=1, repeat=5))
+    codec = min(timeit.repeat(with_codec, number=1, repeat=5))
+
+    assert with_codec() == with_type_deserializer()
+    assert codec < baseline
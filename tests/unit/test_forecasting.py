@@ -0,0 +1,62 @@
+import math
+
+import numpy as np
+
+import forecasting
+
+
+def test_linear_model_fits_each_series_independently():
+    series = [{0: 10, 60: 12, 120: 14}, {0: 5, 60: 5}, {0: 4, 60: 2}]
+
+    predictions = forecasting.forecast(series, 180, "linear")
+
+    np.testing.assert_allclose(predictions, [16.0, 5.0, -2.0])
+
+
+def test_series_with_zero_or_one_point():
+    series = [{}, {1_700_000_000: 0.4}]
+
+    predictions = forecasting.forecast(series, 1_700_003_600, "linear")
+
+    assert math.isnan(predictions[0])
+    assert predictions[1] == 0.4
+    assert forecasting.forecast(series, 0, "linear", default=0.0)[0] == 0.0
+
+
+def test_predict_for_per_series_and_large_timestamps():
+    base = 1_700_000_000
+    series = [{base: 1.0, base + 600: 2.0}, {base: 3.0, base + 600: 1.0}]
+
+    predictions = forecasting.forecast(series, [base + 1200, base + 300], "linear")
+
+    np.testing.assert_allclose(predictions, [3.0, 2.0])
+
+
+def test_last_value_and_exponential_models():
+    series = [{120: 3.0, 0: 1.0, 60: 2.0}, {0: 4.0}]
+
+    np.testing.assert_allclose(forecasting.forecast(series, 180, "last"), [3.0, 4.0])
+    assert np.isnan(forecasting.forecast([{}], 180, "last")[0])
+
+    # weight halves every half life before the latest point: weights 1, 0.5 -> (3 + 0.5) / 1.5
+    model = forecasting.ExponentialModel(half_life=60.0)
+    np.testing.assert_allclose(forecasting.forecast([{0: 1.0, 60: 3.0}], 120, model), [7 / 3])
+
+
+def test_last_value_model_picks_latest_point_of_many_shuffled_points():
+    rng = np.random.default_rng(1)
+    num_series, num_points = 50, 10000
+    index = rng.integers(0, num_series, num_points)
+    times = rng.permutation(num_points).astype(np.float64)
+    values = rng.random(num_points)
+
+    predictions = forecasting.LastValueModel().predict(
+        index, times, values, num_series, np.zeros(num_series)
+    )
+
+    expected = np.full(num_series, np.nan)
+    latest = np.full(num_series, -1.0)
+    for i, t, y in zip(index, times, values):
+        if t > latest[i]:
+            latest[i], expected[i] = t, y
+    np.testing.assert_array_equal(predictions, expected)
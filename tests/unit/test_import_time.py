@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# max. seconds to import a function (in a fresh interpreter, i.e. as during a cold start)
+IMPORT_TIME_BUDGET = 0.2
+# number of fresh interpreters a function is imported in, the fastest import counts
+IMPORT_REPEATS = 3
+
+build_dir = os.path.join(os.path.dirname(__file__), "..", "..", "build")
+# all functions, i.e. directories containing a module of the same name
+functions = sorted(
+    name
+    for name in os.listdir(build_dir)
+    if os.path.isfile(os.path.join(build_dir, name, f"{name}.py"))
+)
+
+# imports a function and reports its import time and whether AWS clients have been created
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {name}
+seconds = time.perf_counter() - start
+modules = [module for module in ("boto3", "botocore.client") if module in sys.modules]
+print(json.dumps({{"seconds": seconds, "modules": modules}}))
+"""
+
+
+@pytest.mark.parametrize("name", functions)
+def test_functions_are_imported_within_budget_without_creating_clients(name):
+    reports = []
+    for _ in range(IMPORT_REPEATS):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT.format(name=name)],
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        reports.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    assert all(report["modules"] == [] for report in reports)
+    assert min(report["seconds"] for report in reports) < IMPORT_TIME_BUDGET
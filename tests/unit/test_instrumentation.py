@@ -0,0 +1,79 @@
+import time
+
+import boto3
+import pytest
+
+import instrumentation
+
+moto = pytest.importorskip("moto")
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    lines = []
+    monkeypatch.setattr(instrumentation, "sink", lines.append)
+    yield lines
+
+
+def test_handler_emits_emf_document_per_invocation(documents):
+    @instrumentation.instrumented
+    def handler(event, context):
+        with instrumentation.phase("Work"):
+            instrumentation.add("Things", 2)
+        return {"ok": True}
+
+    handler({"a": 1}, None)
+    handler({"a": 1}, None)
+
+    first, second = instrumentation.parse(["not json", *documents])
+    assert first["ColdStart"] == 1 and second["ColdStart"] == 0
+    assert first["Things"] == 2 and "WorkTime" in first and "Duration" in first
+    assert first["EventSize"] == len('{"a": 1}')
+    assert "ImportTime" not in second
+
+
+def test_client_calls_are_recorded_within_handlers_only(documents):
+    with moto.mock_dynamodb():
+        dynamodb = instrumentation.instrument(boto3.client("dynamodb"))
+        dynamodb.create_table(
+            TableName="table",
+            KeySchema=[{"AttributeName": "PK", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "PK", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+        @instrumentation.instrumented
+        def handler(event, context):
+            dynamodb.put_item(TableName="table", Item={"PK": {"S": "a"}})
+            return dynamodb.get_item(TableName="table", Key={"PK": {"S": "a"}})
+
+        response = handler({}, None)
+        outside = dynamodb.get_item(TableName="table", Key={"PK": {"S": "a"}})
+
+    (metrics,) = instrumentation.parse(documents)
+    assert "ConsumedCapacity" in response and "ConsumedCapacity" not in outside
+    assert metrics["DynamoDBGetItemCalls"] == 1 and metrics["DynamoDBPutItemCalls"] == 1
+    assert metrics["DynamoDBItemsRead"] == 1 and metrics["DynamoDBItemsWritten"] == 1
+    assert metrics["DynamoDBConsumedReadCapacity"] > 0
+    assert metrics["DynamoDBConsumedWriteCapacity"] > 0
+
+
+def test_profiler_samples_hot_loop_if_switched_on(documents):
+    def hot_loop():
+        end = time.perf_counter() + 0.1
+        while time.perf_counter() < end:
+            pass
+
+    @instrumentation.instrumented
+    def handler(event, context):
+        hot_loop()
+        return {}
+
+    handler({"profile": True}, None)
+    handler({}, None)
+
+    # the event key only switches the profiler on for the invocation it is passed to
+    profiled, unprofiled = instrumentation.parse(documents)
+    assert profiled["Profile"]["samples"] > 0
+    assert any("hot_loop" in location for location, _ in profiled["Profile"]["total"])
+    assert "Profile" not in unprofiled
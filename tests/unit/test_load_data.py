@@ -0,0 +1,163 @@
+import io
+import json
+import threading
+from datetime import datetime
+
+import generate_data_json
+import load_data
+import retention
+
+
+class FakeDynamoDB:
+    """Records written items (thread-safe), fails once the given number of requests is exceeded"""
+
+    def __init__(self, max_requests: int = None):
+        self._lock = threading.Lock()
+        self.max_requests = max_requests
+        self.items = []
+
+    def batch_write_item(self, RequestItems):
+        with self._lock:
+            if self.max_requests is not None:
+                if self.max_requests == 0:
+                    raise RuntimeError("Interrupted")
+                self.max_requests -= 1
+            for requests in RequestItems.values():
+                self.items.extend(request["PutRequest"]["Item"] for request in requests)
+        return {}
+
+
+def create_dataset(streets: int) -> list[dict]:
+    return generate_data_json.generate_city(
+        streets,
+        2,
+        3,
+        3,
+        sample_images=["street_1/image.png"],
+        start_time=datetime(2024, 1, 1),
+    )
+
+
+def test_streaming_output_is_parsed_street_by_street():
+    # timestamps are object keys, which are strings in JSON
+    dataset = json.loads(json.dumps(create_dataset(3)))
+    data_file = io.StringIO()
+    generate_data_json.write_streaming(dataset, data_file)
+    data_file.seek(0)
+
+    # streets are larger than the read size
+    assert list(load_data.iter_streets(data_file, read_size=64)) == dataset
+    assert list(load_data.iter_streets(io.StringIO(json.dumps(dataset, indent=2)))) == dataset
+    assert list(load_data.iter_streets(io.StringIO(" [ ] "))) == []
+
+
+def test_image_rows_of_data_json_are_keyed_by_file_name():
+    street = generate_data_json.generate_street("street_1", ["2023-12-18_17-60.png"])
+
+    image_items = [
+        item
+        for item in load_data.create_street_items(street, loaded_at=0)
+        if item["SK"]["S"].startswith("image#")
+    ]
+
+    # 2023-12-18T18:00:00Z, regardless of the local timezone
+    timestamp = 1702922400
+    assert image_items == [
+        {
+            "PK": {"S": f"camera#{street['cameras'][0]['camera_id']}"},
+            "SK": {"S": f"image#{timestamp}"},
+            "URI": {"S": "street_1/2023-12-18_17-60.png"},
+            "expiresAt": {"N": str(timestamp + retention.RETENTION["image"])},
+        }
+    ]
+
+
+def test_rows_of_historic_data_expire_after_retention_period_from_load():
+    street = generate_data_json.generate_street("street_1", ["2023-12-18_17-60.png"])
+    loaded_at = 1702922400 + 365 * 24 * 3600
+
+    items = list(load_data.create_street_items(street, loaded_at=loaded_at))
+
+    # the image has been taken long before the load, measurements are generated for the present
+    (image_item,) = [item for item in items if item["SK"]["S"].startswith("image#")]
+    assert int(image_item["expiresAt"]["N"]) == loaded_at + retention.RETENTION["image"]
+    for item in items:
+        if "expiresAt" in item:
+            row_type = item["SK"]["S"].split("#")[0]
+            assert int(item["expiresAt"]["N"]) >= loaded_at + retention.RETENTION[row_type]
+
+
+def test_interrupted_load_resumes_from_checkpoint(tmp_path):
+    dataset = create_dataset(4)
+    items_per_street = len(list(load_data.create_street_items(dataset[0])))
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+
+    # interrupted after the first few requests
+    interrupted = FakeDynamoDB(max_requests=3)
+    try:
+        load_data.load_items(
+            interrupted,
+            "central_table",
+            dataset,
+            1,
+            load_data.Checkpoint(checkpoint_path),
+        )
+    except RuntimeError:
+        pass
+    checkpoint = load_data.Checkpoint(checkpoint_path)
+    loaded_streets = checkpoint.streets
+    assert 0 < loaded_streets < 4
+
+    resumed = FakeDynamoDB()
+    written = load_data.load_items(resumed, "central_table", dataset, 2, checkpoint)
+
+    assert written == (4 - loaded_streets) * items_per_street
+    assert load_data.Checkpoint(checkpoint_path).streets == 4
+    loaded_keys = {(item["PK"]["S"], item["SK"]["S"]) for item in interrupted.items + resumed.items}
+    assert len(loaded_keys) == 4 * items_per_street
+
+
+class FakeS3:
+    """Records uploaded keys (thread-safe), fails on the given key"""
+
+    def __init__(self, fail_on: str = None):
+        self._lock = threading.Lock()
+        self.fail_on = fail_on
+        self.keys = []
+
+    def upload_file(self, file_name, bucket_name, key, Config=None):
+        if key == self.fail_on:
+            raise RuntimeError("Interrupted")
+        with self._lock:
+            self.keys.append(key)
+
+
+def test_interrupted_upload_resumes_from_appended_checkpoint(tmp_path):
+    images_dir = tmp_path / "images"
+    all_keys = {f"street_{street}/{image:02}.png" for street in range(3) for image in range(20)}
+    for key in all_keys:
+        (images_dir / key).parent.mkdir(exist_ok=True, parents=True)
+        (images_dir / key).write_bytes(b"image")
+    checkpoint_path = str(tmp_path / "checkpoint.jsonl")
+
+    interrupted = FakeS3(fail_on="street_1/10.png")
+    try:
+        load_data.upload_images(
+            interrupted, "central_bucket", str(images_dir), 2, load_data.Checkpoint(checkpoint_path)
+        )
+    except RuntimeError:
+        pass
+    # the last save has been interrupted within a record
+    with open(checkpoint_path, "a") as checkpoint_file:
+        checkpoint_file.write('{"ima')
+    uploaded_before = load_data.Checkpoint(checkpoint_path).images
+    assert 0 < len(uploaded_before) < 60 and uploaded_before <= set(interrupted.keys)
+
+    resumed = FakeS3()
+    uploaded = load_data.upload_images(
+        resumed, "central_bucket", str(images_dir), 2, load_data.Checkpoint(checkpoint_path)
+    )
+
+    assert uploaded == 60 - len(uploaded_before)
+    assert set(resumed.keys) == all_keys - uploaded_before
+    assert load_data.Checkpoint(checkpoint_path).images == all_keys
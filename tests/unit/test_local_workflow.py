@@ -0,0 +1,166 @@
+import re
+import threading
+
+import pytest
+
+import local_workflow
+
+
+def test_paths_and_parameters_are_evaluated():
+    data = {"ids": ["a", "b", "c"], "predictFor": 100}
+    context = {"Map": {"Item": {"Value": "b"}}}
+
+    payload = local_workflow.evaluate_parameters(
+        {
+            "id.$": "$$.Map.Item.Value",
+            "predictFor.$": "$.predictFor",
+            "batches.$": "States.ArrayPartition($.ids, 2)",
+            "dirtyOnly": True,
+        },
+        data,
+        context,
+    )
+
+    assert payload == {
+        "id": "b",
+        "predictFor": 100,
+        "batches": [["a", "b"], ["c"]],
+        "dirtyOnly": True,
+    }
+    assert local_workflow.write_path("$.result.value", data, 1)["result"] == {"value": 1}
+    assert local_workflow.write_path(None, data, 1) == data
+
+
+def test_workflow_runs_parallel_branches_and_map_iterations():
+    definition = {
+        "StartAt": "Fan out",
+        "States": {
+            "Fan out": {
+                "Type": "Parallel",
+                "ResultSelector": {"doubled.$": "$[0]", "count.$": "$[1]"},
+                "ResultPath": "$.results",
+                "End": True,
+                "Branches": [
+                    {
+                        "StartAt": "Per item",
+                        "States": {
+                            "Per item": {
+                                "Type": "Map",
+                                "ItemsPath": "$.values",
+                                "MaxConcurrency": 2,
+                                "Parameters": {"value.$": "$$.Map.Item.Value"},
+                                "End": True,
+                                "Iterator": {
+                                    "StartAt": "Double",
+                                    "States": {
+                                        "Double": {
+                                            "Type": "Task",
+                                            "Resource": "function:double",
+                                            "End": True,
+                                        }
+                                    },
+                                },
+                            }
+                        },
+                    },
+                    {
+                        "StartAt": "Count",
+                        "States": {
+                            "Count": {"Type": "Task", "Resource": "function:count", "End": True}
+                        },
+                    },
+                ],
+            }
+        },
+    }
+    workflow = local_workflow.LocalWorkflow(
+        definition,
+        {
+            "double": lambda event, context: event["value"] * 2,
+            "count": lambda event, context: len(event["values"]),
+        },
+    )
+
+    output = workflow.run({"values": [1, 2, 3]})
+
+    assert output == {"values": [1, 2, 3], "results": {"doubled": [2, 4, 6], "count": 3}}
+    assert len(workflow.metrics.latencies["Double"]) == 3
+
+
+def test_benchmark_runs_main_stack_workflow_against_mocked_services():
+    pytest.importorskip("moto")
+    import benchmark
+
+    reports = benchmark.run_benchmark(
+        benchmark.parse_args(
+            [
+                "--streets",
+                "1",
+                "--cameras-per-street",
+                "2",
+                "--images-per-camera",
+                "3",
+                "--measurements-per-station",
+                "3",
+            ]
+        )
+    )
+
+    assert reports[0]["states"]["Update vehicles count"]["count"] == 2
+    assert reports[0]["dynamodb"]["BatchWriteItem"]["itemsWritten"] > 0
+
+
+def test_map_without_max_concurrency_runs_all_iterations_in_parallel():
+    definition = {
+        "StartAt": "Per item",
+        "States": {
+            "Per item": {
+                "Type": "Map",
+                "MaxConcurrency": 0,
+                "End": True,
+                "Iterator": {
+                    "StartAt": "Wait",
+                    "States": {"Wait": {"Type": "Task", "Resource": "function:wait", "End": True}},
+                },
+            }
+        },
+    }
+    # only passes if all iterations wait at the barrier at the same time
+    barrier = threading.Barrier(60, timeout=10)
+    workflow = local_workflow.LocalWorkflow(
+        definition, {"wait": lambda event, context: barrier.wait() >= 0}
+    )
+
+    assert workflow.run(list(range(60))) == [True] * 60
+
+
+@pytest.mark.parametrize("stack_kwargs", [{}, {"camera_batch_size": 2, "incremental": True}])
+def test_profile_option_of_execution_is_forwarded_to_every_task(stack_kwargs):
+    definition, module_names = local_workflow.synthesize_definition(**stack_kwargs)
+    results = {
+        "get_predict_for_timestamp": 0,
+        "get_camera_list": ["c1", "c2"],
+        "get_images": {"1": "c1/1.png"},
+        "count_cars": {"1": 3},
+        "predict_car_count": 3,
+        "count_emergency_vehicles": 0,
+        "get_station_list": ["s1"],
+        "get_street_list": ["st1"],
+        "get_section_list": {"sectionIds": ["se1"], "displayShards": 1},
+    }
+    events = []
+
+    def handler(name: str):
+        return lambda event, context: events.append((name, event)) or results.get(name, {})
+
+    workflow = local_workflow.LocalWorkflow(
+        definition, {name: handler(name) for name in module_names}
+    )
+
+    for execution_input, profile in [({"profile": True}, True), ({}, False)]:
+        events.clear()
+        workflow.run(execution_input)
+
+        # every function called by the workflow (compact_time_series runs on a schedule)
+        assert {name for name, _ in events} == set(re.findall(r"function:(\w+)", str(definition)))
+        assert all(event["profile"] is profile for _, event in events)
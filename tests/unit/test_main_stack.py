@@ -1,3 +1,5 @@
+import json
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
 import pytest
@@ -17,3 +19,82 @@ def test_sqs_queue_created():
 #     template.has_resource_properties("AWS::SQS::Queue", {
 #         "VisibilityTimeout": 300
 #     })
+
+
+def get_state_machine_definition(stack: MainStack) -> str:
+    template = assertions.Template.from_stack(stack)
+    state_machines = template.find_resources("AWS::StepFunctions::StateMachine")
+    state_machine = next(iter(state_machines.values()))
+    return json.dumps(state_machine["Properties"]["DefinitionString"])
+
+
+def test_streets_are_checked_in_batches():
+    app = core.App()
+    definition = get_state_machine_definition(MainStack(app, "MainStack"))
+
+    # CDK appends ".$" to keys with a JSONPath/intrinsic value itself
+    assert '\\"batches.$\\":\\"States.ArrayPartition($.streetIds, 50)\\"' in definition
+    assert "batches.$.$" not in definition
+
+
+def test_cameras_are_analysed_per_camera_by_default():
+    app = core.App()
+    definition = get_state_machine_definition(MainStack(app, "MainStack"))
+
+    assert "Get images" in definition
+    assert "Analyze cameras" not in definition
+
+
+def test_cameras_are_analysed_in_batches_if_batch_size_is_given():
+    app = core.App()
+    definition = get_state_machine_definition(MainStack(app, "MainStack", camera_batch_size=50))
+
+    assert "Analyze cameras" in definition
+    assert '\\"batches.$\\":\\"States.ArrayPartition($.cameraIds, 50)\\"' in definition
+    assert "batches.$.$" not in definition
+    assert "Get images" not in definition
+
+
+def test_sections_are_handled_in_batches():
+    app = core.App()
+    definition = get_state_machine_definition(MainStack(app, "MainStack"))
+
+    assert "States.ArrayPartition($.sections.sectionIds, 100)" in definition
+    assert '\\"sectionIds.$\\":\\"$$.Map.Item.Value\\"' in definition
+    assert '\\"displayShards.$\\":\\"$.sections.displayShards\\"' in definition
+
+
+def test_list_tasks_return_dirty_ids_in_incremental_runs():
+    app = core.App()
+    definition = get_state_machine_definition(MainStack(app, "MainStack", incremental=True))
+
+    assert definition.count('\\"dirtyOnly\\":true') == 4
+    assert '\\"cameraIds.$\\":\\"$.dirty.cameraIds\\"' in definition
+
+
+def test_rows_expire_and_time_series_are_compacted_hourly():
+    app = core.App()
+    template = assertions.Template.from_stack(MainStack(app, "MainStack"))
+
+    template.has_resource_properties(
+        "AWS::DynamoDB::Table",
+        {"TimeToLiveSpecification": {"AttributeName": "expiresAt", "Enabled": True}},
+    )
+    template.has_resource_properties(
+        "AWS::Events::Rule", {"ScheduleExpression": "cron(20 * * * ? *)"}
+    )
+
+
+def test_detection_functions_have_time_to_outlive_image_claims():
+    app = core.App()
+    template = assertions.Template.from_stack(MainStack(app, "MainStack"))
+
+    functions = template.find_resources(
+        "AWS::Lambda::Function",
+        {"Properties": {"Handler": assertions.Match.string_like_regexp("count_")}},
+    )
+    assert len(functions) == 2
+    for function in functions.values():
+        properties = function["Properties"]
+        assert properties["Timeout"] == 60 and properties["MemorySize"] == 512
+        assert properties["Environment"]["Variables"]["FUNCTION_TIMEOUT"] == "60"
@@ -0,0 +1,79 @@
+import boto3
+from botocore.stub import Stubber
+
+from metadata_cache import TOPOLOGY_VERSION_KEY, MetadataCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = MetadataCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = MetadataCache(ttl=10.0, clock=clock)
+    cache.put("a", 1)
+
+    clock.now = 9.0
+    assert cache.get("a") == 1
+    clock.now = 10.0
+    assert cache.get("a") is None
+
+
+def test_get_many_or_load_only_loads_missing_keys():
+    cache = MetadataCache()
+    cache.put("a", 1)
+    requested_keys = []
+
+    def loader(keys):
+        requested_keys.extend(keys)
+        return {key: key.upper() for key in keys if key != "c"}
+
+    values = cache.get_many_or_load(["a", "b", "c"], loader)
+
+    assert values == {"a": 1, "b": "B"}
+    assert requested_keys == ["b", "c"]
+    assert "c" not in cache
+
+
+def test_cache_is_cleared_when_topology_version_changes():
+    clock = FakeClock()
+    cache = MetadataCache(version_check_interval=60.0, clock=clock)
+    dynamodb = boto3.client("dynamodb")
+    expected_params = {
+        "TableName": "central_table",
+        "Key": TOPOLOGY_VERSION_KEY,
+        "ProjectionExpression": "versionNumber",
+    }
+
+    with Stubber(dynamodb) as stubber:
+        stubber.add_response("get_item", {"Item": {"versionNumber": {"N": "1"}}}, expected_params)
+        stubber.add_response("get_item", {"Item": {"versionNumber": {"N": "2"}}}, expected_params)
+
+        assert not cache.check_version(dynamodb, "central_table")
+        cache.put("a", 1)
+
+        # version is not re-read within the check interval
+        clock.now = 30.0
+        assert not cache.check_version(dynamodb, "central_table")
+        assert "a" in cache
+
+        clock.now = 60.0
+        assert cache.check_version(dynamodb, "central_table")
+        assert "a" not in cache
+
+        stubber.assert_no_pending_responses()
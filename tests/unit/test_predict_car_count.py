@@ -0,0 +1,59 @@
+import boto3
+import pytest
+
+import regression_state
+
+moto = pytest.importorskip("moto")
+
+import predict_car_count  # noqa: E402
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    with moto.mock_dynamodb():
+        client = boto3.client("dynamodb")
+        client.create_table(
+            TableName="central_table",
+            KeySchema=[
+                {"AttributeName": "PK", "KeyType": "HASH"},
+                {"AttributeName": "SK", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "PK", "AttributeType": "S"},
+                {"AttributeName": "SK", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        # the client of the module is created before the mock
+        monkeypatch.setattr(predict_car_count, "dynamodb", client)
+        monkeypatch.setattr(predict_car_count, "table_name", "central_table")
+        yield client
+
+
+def test_regression_state_is_updated_with_new_car_counts_only(dynamodb, monkeypatch):
+    predict_for = 10800
+    car_counts = {3600 + 600 * i: 10 + 2 * i for i in range(12)}
+
+    first = predict_car_count.handler(
+        {"cameraId": "c1", "predictFor": predict_for, "carCount": car_counts}, None
+    )
+
+    # the next run only adds the car count of the new image to the stored state
+    added = []
+    add = regression_state.RegressionState.add
+    monkeypatch.setattr(
+        regression_state.RegressionState,
+        "add",
+        lambda state, points: added.append(dict(points)) or add(state, points),
+    )
+    car_counts[10800] = 34
+    second = predict_car_count.handler(
+        {"cameraId": "c1", "predictFor": predict_for + 600, "carCount": car_counts}, None
+    )
+    item = dynamodb.get_item(
+        TableName="central_table", Key={"PK": {"S": "camera#c1"}, "SK": {"S": "model"}}
+    )["Item"]
+
+    assert first == 34 and second == 36
+    assert added == [{10800: 34}]
+    assert regression_state.RegressionState.from_item(item).watermark == 10800
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import forecasting
+import regression_state
+import retention
+from regression_state import RegressionState
+
+BASE = 1_700_000_000
+# start of an hour, as aggregates are aligned to their time spans
+HOUR = BASE - BASE % 3600
+
+
+def test_incremental_updates_match_full_fit():
+    points = {BASE + 60 * i: float(i % 7) for i in range(30)}
+    state = RegressionState()
+    state.add(dict(list(points.items())[:20]))
+    state = RegressionState.from_item(state.to_item("station#1"))
+    state.add(dict(list(points.items())[20:]))
+
+    predictions = regression_state.predict([state, RegressionState()], BASE + 3600)
+
+    np.testing.assert_allclose(predictions[0], forecasting.forecast([points], BASE + 3600)[0])
+    assert np.isnan(predictions[1])
+    assert state.watermark == BASE + 60 * 29
+
+
+def test_buckets_outside_of_window_are_evicted():
+    state = RegressionState(bucket_size=600)
+    state.add({BASE: 100.0, BASE + 600: 1.0, BASE + 1200: 2.0})
+
+    state.evict(BASE + 600)
+
+    np.testing.assert_allclose(regression_state.predict([state], BASE + 1800), [3.0])
+
+
+def test_state_is_stale_without_update_since_window_start():
+    state = RegressionState()
+    assert state.is_stale(BASE)
+
+    state.add({BASE: 1.0})
+    assert not state.is_stale(BASE)
+    assert state.is_stale(BASE + 1)
+
+
+def test_regression_over_aggregates_equals_regression_over_their_points():
+    # one point every 5 minutes during 3 hours, aggregated hourly and (shifted) into a longer span
+    points = {HOUR + 300 * i: (i % 7) + 0.1 * i for i in range(36)}
+    hourly = {
+        HOUR
+        + 3600
+        * h: retention.Aggregate.of(
+            {t: y for t, y in points.items() if HOUR + 3600 * h <= t < HOUR + 3600 * (h + 1)},
+            HOUR + 3600 * h,
+        )
+        for h in range(3)
+    }
+    state = RegressionState()
+    state.add_aggregates(hourly, 3600)
+
+    merged = hourly[HOUR].merge(hourly[HOUR + 3600].shift(3600))
+    assert merged == pytest.approx(
+        retention.Aggregate.of({t: y for t, y in points.items() if t < HOUR + 7200}, HOUR)
+    )
+    np.testing.assert_allclose(
+        regression_state.predict([state], HOUR + 4 * 3600),
+        forecasting.forecast([points], HOUR + 4 * 3600),
+    )
+    assert state.watermark == HOUR + 3 * 3600 - 1
@@ -0,0 +1,11 @@
+from vehicle_counts import predict_car_count
+
+
+def test_predict_car_count_extrapolates_linear_trend():
+    assert predict_car_count({0: 10, 60: 12, 120: 14}, 180) == 16
+
+
+def test_predict_car_count_handles_few_points_and_negative_trend():
+    assert predict_car_count({}, 100) == 0
+    assert predict_car_count({50: 7}, 100) == 7
+    assert predict_car_count({0: 4, 60: 2}, 600) == 0